@@ -0,0 +1,404 @@
+import argparse
+import ast
+import copy
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+STEP1_SCRIPTS = os.path.join(REPO_DIR, 'step 1', 'scripts')
+STEP2_SCRIPTS = os.path.join(REPO_DIR, 'step 2', 'scripts')
+sys.path.insert(0, STEP2_SCRIPTS)
+
+from run_metrics import METRICS, instrument_orkg
+
+# Relative paths are resolved against the directory of the config file (the repository without one)
+DEFAULT_CONFIG = {
+    'state_file': 'pipeline-state.json',
+    'orkg_host': 'https://incubating.orkg.org',
+    'template_id': 'R733029',
+    'workers': 8,
+    'chunk_size': 2000,
+    'fuzzy_cutoff': None,
+    'extraction': {
+        'max_in_flight': 8,
+        'requests_per_minute': 500,
+        'tokens_per_minute': 300000,
+        'coalesce': False,
+        'token_budget': None,
+    },
+    'paths': {
+        'raw_data': 'step 1/data/1-raw-data.csv',
+        'filtered_data': 'step 1/data/2-filtered-data.csv',
+        'full_texts': None,
+        'import_file': 'step 1/data/3-orkg-csv-papers-import.csv',
+        'papers_info': 'step 2/data/4-orkg-papers-info.csv',
+        'doi_cache': 'step 2/data/4-orkg-doi-cache.jsonl',
+        'reactants': 'step 2/data/5-orkg-added-reactants.csv',
+        'materials': 'step 2/data/5-orkg-added-materials.csv',
+        'label_index': 'step 2/data/5-orkg-label-index.jsonl',
+        'registration_log': 'step 2/data/5-orkg-registration-log.jsonl',
+        'annotations': 'step 2/data/6-gpt-annotations.csv',
+        'records': 'step 2/data/6-gpt-annotated-records.txt',
+        'response_cache': 'step 2/data/6-gpt-response-cache.sqlite',
+        'contributions': 'step 2/data/7-recorded-orkg-contributions.csv',
+        'upload_log': 'step 2/data/7-orkg-upload-log.jsonl',
+        'contribution_sync': None,
+        'template_cache': 'step 2/data/7-orkg-template-cache.json',
+        'schema': 'step 2/data/ald-schema_ver4.json',
+        'llm_backends': None,
+        'metrics': 'step 2/data/metrics/pipeline-run.json',
+    },
+}
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+
+def load_script(directory, file_name):
+    """ Import one of the numbered workflow scripts (their file names are not valid module names). """
+    with _modules_lock:
+        if file_name not in _modules:
+            module_name = 'pipeline_' + file_name[:-3].replace('-', '_')
+            spec = importlib.util.spec_from_file_location(module_name, os.path.join(directory, file_name))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _modules[file_name] = module
+        return _modules[file_name]
+
+
+def credential(name):
+    # Credentials are never read from the config file, so that it can be committed
+    value = os.environ.get(name, '')
+    if not value:
+        raise RuntimeError(f"Set the {name} environment variable")
+    return value
+
+
+def run_filter(config, paths):
+    module = load_script(STEP1_SCRIPTS, '1-2-stream-filter-and-create-orkg-csv-import-file.py')
+    module.stream_filter_and_create_import_file(paths['raw_data'], paths['filtered_data'], paths['import_file'], config['chunk_size'],
+                                                paths.get('full_texts'))
+    return True
+
+
+def run_papers(config, paths):
+    module = load_script(STEP2_SCRIPTS, '1-create-paper-info-file-from-orkg.py')
+    # DOI lookups are read-only, so they also run without ORKG credentials
+    failed = module.fetch_paper_details_parallel(
+        paths['import_file'], paths['papers_info'], os.environ.get('ORKG_EMAIL', ''), os.environ.get('ORKG_PASSWORD', ''),
+        config['orkg_host'], config['workers'], paths['doi_cache'],
+    )
+    return failed == 0
+
+
+def run_resources(config, paths):
+    from http_client import orkg_client
+    from upload_log import UploadLog, new_run_id
+    module = load_script(STEP2_SCRIPTS, '2-add-material-and-reactants-to-orkg.py')
+    orkg = orkg_client(config['orkg_host'], creds=(credential('ORKG_EMAIL'), credential('ORKG_PASSWORD')), pool_size=config['workers'])
+    instrument_orkg(orkg, METRICS)
+    data = module.read_csv_with_encoding(paths['filtered_data'])
+    index = module.load_label_index(paths['label_index'], [paths['reactants'], paths['materials']])
+    registration_log = UploadLog(paths['registration_log'])
+    run_id = new_run_id()
+    print(f"Registration run ID: {run_id}")
+    try:
+        failed = module.register_items(orkg, data, module.REACTANT_COLUMNS, paths['reactants'], index, config['workers'], registration_log, run_id)
+        failed += module.register_items(orkg, data, module.MATERIAL_COLUMNS, paths['materials'], index, config['workers'], registration_log, run_id)
+    finally:
+        index.close()
+        registration_log.close()
+    return failed == 0
+
+
+def run_annotate(config, paths):
+    from response_cache import ResponseCache
+    module = load_script(STEP2_SCRIPTS, '3-gpt-assistant-annotate.py')
+    extraction = config['extraction']
+    _, _, combined_df = module.read_input_files(paths['materials'], paths['reactants'], paths['papers_info'], paths['filtered_data'],
+                                                 paths.get('full_texts'))
+    journal, processed_keys = module.open_processed_records(paths['records'], paths['annotations'])
+    cache = ResponseCache(paths['response_cache']) if paths.get('response_cache') else None
+    # Without a backends file every request goes to gpt-4o on the OpenAI API
+    backends = module.load_backends(paths['llm_backends'], os.environ.get('OPENAI_API_KEY')) if paths.get('llm_backends') else None
+    try:
+        # The concurrent mode, without the confirmation after the first entry of the sequential mode
+        module.run_concurrent_extraction(
+            credential('OPENAI_API_KEY') if backends is None else None, combined_df, processed_keys, journal, paths['annotations'],
+            extraction['max_in_flight'], extraction['requests_per_minute'], extraction['tokens_per_minute'],
+            extraction['coalesce'], cache, extraction['token_budget'], backends,
+        )
+    finally:
+        journal.close()
+        if cache is not None:
+            cache.close()
+    remaining = sum(1 for _ in module.pending_rows(combined_df, processed_keys))
+    return remaining == 0
+
+
+def run_upload(config, paths):
+    module = load_script(STEP2_SCRIPTS, '4-create-and-upload-orkg-contributions.py')
+    remaining = module.main(
+        paths['annotations'], config['orkg_host'], credential('ORKG_EMAIL'), credential('ORKG_PASSWORD'),
+        config['template_id'], paths['contributions'], paths['reactants'], paths['materials'],
+        mode='sync' if paths.get('contribution_sync') else 'concurrent', upload_log_path=paths['upload_log'], workers=config['workers'],
+        schema_path=paths.get('schema'), resolver_path=paths.get('label_index'), fuzzy_cutoff=config['fuzzy_cutoff'],
+        sync_log_path=paths.get('contribution_sync'), template_cache_path=paths.get('template_cache'),
+    )
+    return remaining == 0
+
+
+def script_code(script_path):
+    """
+    A stage script and the local modules it imports, directly or through other local modules, so that
+    a change to any of them (e.g. the retry or metrics code) invalidates the stage.
+    """
+    code = [script_path]
+    for path in code:
+        with open(path, 'r', encoding='utf-8') as file:
+            tree = ast.parse(file.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                for directory in (os.path.dirname(path), STEP2_SCRIPTS):
+                    module_path = os.path.join(directory, name.split('.')[0] + '.py')
+                    if os.path.exists(module_path) and module_path not in code:
+                        code.append(module_path)
+                        break
+    return code
+
+
+# The workflow as a DAG. A stage runs once the stages it comes after have finished; stages without
+# a path between them (DOI resolution and resource registration) run side by side.
+# `inputs` and `outputs` name entries of the paths config; `params` name config entries.
+STAGES = {
+    'filter': {
+        'after': [],
+        'run': run_filter,
+        'code': script_code(os.path.join(STEP1_SCRIPTS, '1-2-stream-filter-and-create-orkg-csv-import-file.py')),
+        'inputs': ['raw_data'],
+        'outputs': ['filtered_data', 'import_file', 'full_texts'],
+        'params': ['chunk_size'],
+    },
+    'papers': {
+        'after': ['filter'],
+        'run': run_papers,
+        'code': script_code(os.path.join(STEP2_SCRIPTS, '1-create-paper-info-file-from-orkg.py')),
+        'inputs': ['import_file'],
+        'outputs': ['papers_info'],
+        'params': ['orkg_host'],
+    },
+    'resources': {
+        'after': ['filter'],
+        'run': run_resources,
+        'code': script_code(os.path.join(STEP2_SCRIPTS, '2-add-material-and-reactants-to-orkg.py')),
+        'inputs': ['filtered_data'],
+        'outputs': ['reactants', 'materials'],
+        'params': ['orkg_host'],
+    },
+    'annotate': {
+        'after': ['papers', 'resources'],
+        'run': run_annotate,
+        'code': script_code(os.path.join(STEP2_SCRIPTS, '3-gpt-assistant-annotate.py')),
+        'inputs': ['materials', 'reactants', 'papers_info', 'filtered_data', 'full_texts', 'llm_backends'],
+        'outputs': ['annotations', 'records'],
+        'params': ['extraction'],
+    },
+    'upload': {
+        'after': ['annotate', 'resources'],
+        'run': run_upload,
+        'code': script_code(os.path.join(STEP2_SCRIPTS, '4-create-and-upload-orkg-contributions.py')),
+        'inputs': ['annotations', 'reactants', 'materials', 'schema'],
+        'outputs': ['contributions'],
+        'params': ['orkg_host', 'template_id', 'fuzzy_cutoff'],
+    },
+}
+
+
+class PipelineState:
+    """
+    The fingerprint of every stage that last finished completely, plus the content hashes of the files
+    seen so far keyed by path, size and modification time, so unchanged files are not read again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'stages': {}, 'files': {}}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.data.update(json.load(file))
+
+    def file_hash(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing input file: {path}")
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        with self.lock:
+            known = self.data['files'].get(key)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        with self.lock:
+            self.data['files'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def fingerprint(self, name, config, paths):
+        stage = STAGES[name]
+        parts = {
+            'code': {os.path.basename(path): self.file_hash(path) for path in stage['code']},
+            'inputs': {key: self.file_hash(paths[key]) for key in stage['inputs'] if paths.get(key)},
+            'params': {key: config[key] for key in stage['params']},
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def is_current(self, name, fingerprint, paths):
+        with self.lock:
+            recorded = self.data['stages'].get(name)
+        return (recorded is not None and recorded['fingerprint'] == fingerprint
+                and all(os.path.exists(paths[key]) for key in STAGES[name]['outputs'] if paths.get(key)))
+
+    def record(self, name, fingerprint):
+        with self.lock:
+            self.data['stages'][name] = {'fingerprint': fingerprint, 'finished': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.save()
+
+    def save(self):
+        with self.lock:
+            temporary_path = self.path + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                json.dump(self.data, file, indent=2)
+            os.replace(temporary_path, self.path)
+
+
+def run_stage(name, config, paths, state, force, dry_run):
+    """ Run one stage unless it is current; returns 'current', 'done', 'partial', 'would run' or 'failed'. """
+    try:
+        fingerprint = state.fingerprint(name, config, paths)
+        if not force and state.is_current(name, fingerprint, paths):
+            print(f"[{name}] up to date, skipped")
+            return 'current'
+        if dry_run:
+            print(f"[{name}] would run")
+            return 'would run'
+        print(f"[{name}] started")
+        started = time.time()
+        with METRICS.stage(f"pipeline {name}"):
+            complete = STAGES[name]['run'](config, paths)
+        if complete:
+            state.record(name, fingerprint)
+            print(f"[{name}] finished in {time.time() - started:.1f}s")
+            return 'done'
+        # Not recorded, so the stage runs again next time to pick up what is left
+        print(f"[{name}] finished in {time.time() - started:.1f}s with items left over; it will run again next time")
+        return 'partial'
+    except Exception:
+        print(f"[{name}] failed:\n{traceback.format_exc()}")
+        return 'failed'
+
+
+def run_pipeline(config, paths, stages, force=False, dry_run=False):
+    """
+    Run the selected stages in dependency order, each as soon as the stages it comes after have finished.
+    Stages that are not selected are treated as finished. Stages after a failed stage are not run.
+    """
+    state = PipelineState(paths['state_file'])
+    results = {}
+    pending = [name for name in STAGES if name in stages]
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(STAGES)) as executor:
+        while pending or running:
+            for name in list(pending):
+                after = [previous for previous in STAGES[name]['after'] if previous in stages]
+                if any(results.get(previous) in ('failed', 'blocked') for previous in after):
+                    print(f"[{name}] not run because an earlier stage failed")
+                    results[name] = 'blocked'
+                    pending.remove(name)
+                elif dry_run and any(results.get(previous) == 'would run' for previous in after):
+                    print(f"[{name}] may run, depending on the outputs of {', '.join(after)}")
+                    results[name] = 'would run'
+                    pending.remove(name)
+                elif all(previous in results for previous in after):
+                    running[executor.submit(run_stage, name, config, paths, state, force, dry_run)] = name
+                    pending.remove(name)
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[running.pop(future)] = future.result()
+    state.save()
+    return results
+
+
+def set_option(config, assignment):
+    """ Apply a --set key=value option; dotted keys reach into sections (e.g. paths.raw_data=...). """
+    key, _, value = assignment.partition('=')
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:
+        pass  # plain strings such as paths need no quotes
+    *sections, leaf = key.split('.')
+    node = config
+    for section in sections:
+        node = node.setdefault(section, {})
+    node[leaf] = value
+
+
+def load_config(config_path, assignments):
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    base_dir = REPO_DIR
+    if config_path:
+        with open(config_path, 'r', encoding='utf-8') as file:
+            overrides = json.load(file)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+        base_dir = os.path.dirname(os.path.abspath(config_path))
+    for assignment in assignments:
+        set_option(config, assignment)
+
+    # An empty path disables an optional file (e.g. the response cache or the schema)
+    paths = {key: os.path.join(base_dir, path) if path else None for key, path in config['paths'].items()}
+    paths['state_file'] = os.path.join(base_dir, config['state_file'])
+    return config, paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the step 1 and step 2 workflow without prompts, skipping stages whose outputs are current.")
+    parser.add_argument('--config', help="JSON config file (see pipeline-config.example.json); defaults are used without one")
+    parser.add_argument('--set', dest='assignments', action='append', default=[], metavar='KEY=VALUE',
+                        help="override a config entry, e.g. --set workers=4 --set paths.raw_data=data/export.csv")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES), help="stages to run (default: all)")
+    parser.add_argument('--force', action='store_true', help="run the selected stages even if they are current")
+    parser.add_argument('--dry-run', action='store_true', help="only report which stages would run")
+    args = parser.parse_args()
+
+    config, paths = load_config(args.config, args.assignments)
+    started = time.time()
+    METRICS.script = 'run-pipeline'
+    results = run_pipeline(config, paths, set(args.stages), args.force, args.dry_run)
+    if paths.get('metrics') and not args.dry_run:
+        METRICS.write(paths['metrics'])
+    print(f"Pipeline finished in {time.time() - started:.1f}s: " + ', '.join(f"{name} {results[name]}" for name in STAGES if name in results))
+    sys.exit(1 if any(result in ('failed', 'blocked') for result in results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
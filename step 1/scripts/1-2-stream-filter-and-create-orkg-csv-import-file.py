@@ -0,0 +1,84 @@
+import os
+import sys
+import pandas as pd
+
+# The full-text store is shared with step 2
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'step 2', 'scripts'))
+from fulltext_store import FullTextStoreWriter
+
+# Columns needed to filter the papers and to build the ORKG CSV import file
+REQUIRED_COLUMNS = ['full_text', 'reference_doi']
+
+def strip_doi_prefix(doi):
+    # Remove the resolver prefixes from the DOI (same prefixes as 2-create-orkg-csv-import-file.py, plus their variants)
+    prefixes = ["http://dx.doi.org/", "https://dx.doi.org/", "https://doi.org/", "http://doi.org/"]
+    doi = str(doi).strip()
+    for prefix in prefixes:
+        if doi.startswith(prefix):
+            return doi[len(prefix):]
+    return doi
+
+def stream_filter_and_create_import_file(input_file, filtered_output_file, import_output_file, chunk_size=2000, full_text_store=None):
+    """
+    Single pass over the raw ALD database export, one chunk of rows at a time.
+    Rows whose 'full_text' is a dash are dropped; the remaining rows are appended to the filtered file
+    (if one is given) and their DOIs are normalized and deduplicated into the ORKG CSV import file.
+    Without a filtered output file only the 'full_text' and 'reference_doi' columns are parsed.
+    With a full-text store path, every paper's text is stored there once per DOI and the filtered
+    file is written without the 'full_text' column.
+    Memory use depends on the chunk size, not on the size of the export.
+    """
+    usecols = None if filtered_output_file else REQUIRED_COLUMNS
+    seen_dois = set()
+    filtered_rows = 0
+    imported_papers = 0
+    first_chunk = True
+    store = FullTextStoreWriter(full_text_store) if full_text_store else None
+
+    try:
+        reader = pd.read_csv(input_file, encoding='ISO-8859-1', usecols=usecols, chunksize=chunk_size)
+        for chunk in reader:
+            # Filter the data to exclude rows where 'full_text' is a dash ('-')
+            filtered = chunk[chunk['full_text'] != '-']
+            filtered_rows += len(filtered)
+
+            if store is not None:
+                store.add_frame(filtered)
+            if filtered_output_file:
+                output = filtered.drop(columns=['full_text']) if store is not None else filtered
+                output.to_csv(filtered_output_file, mode='w' if first_chunk else 'a', header=first_chunk, index=False)
+
+            # Normalize the DOIs and keep only papers not seen in an earlier chunk
+            dois = filtered['reference_doi'].dropna().map(strip_doi_prefix).drop_duplicates()
+            dois = dois[~dois.isin(seen_dois)]
+            seen_dois.update(dois)
+
+            import_data = pd.DataFrame({'paper:doi': dois})
+            import_data['paper:research_field'] = 'R254'
+            import_data['contribution:research_problem'] = 'orkg:R676133'
+            import_data['contribution:extraction_method'] = 'Automatic'
+            import_data.to_csv(import_output_file, mode='w' if first_chunk else 'a', header=first_chunk, index=False)
+            imported_papers += len(import_data)
+            first_chunk = False
+    except UnicodeDecodeError as e:
+        print(f"Failed to read the file due to an encoding issue: {e}")
+        return
+    finally:
+        if store is not None:
+            store.close()
+
+    if filtered_output_file:
+        print(f"{filtered_rows} filtered rows saved to {filtered_output_file}")
+    print(f"{imported_papers} papers written to the ORKG CSV import file {import_output_file}")
+    if store is not None:
+        print(f"{store.added} full texts added to the full-text store {full_text_store} ({len(store.entries)} stored)")
+
+if __name__ == "__main__":
+    # Prompting user to input the paths for the input and output files
+    input_file_path = input("Enter the path of the input CSV file: ")
+    filtered_output_path = input("Enter the path of the filtered output CSV file (leave empty to skip it): ").strip()
+    import_output_path = input("Enter the path of the ORKG CSV import output file: ")
+    chunk_size = int(input("Enter the number of rows to read at a time [2000]: ").strip() or 2000)
+    full_text_store_path = input("Enter the path of the full-text store (e.g., data/2-full-texts.store, leave empty to keep the full texts in the filtered file): ").strip()
+
+    stream_filter_and_create_import_file(input_file_path, filtered_output_path, import_output_path, chunk_size, full_text_store_path or None)
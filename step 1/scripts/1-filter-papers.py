@@ -15,9 +15,10 @@ def filter_and_save_csv_data(input_file, output_file):
     filtered_data.to_csv(output_file, index=False)
     print(f"Filtered data saved to {output_file}")
 
-# Prompting user to input the paths for the input and output files
-input_file_path = input("Enter the path of the input CSV file: ")
-output_file_path = input("Enter the path of the output CSV file: ")
+if __name__ == "__main__":
+    # Prompting user to input the paths for the input and output files
+    input_file_path = input("Enter the path of the input CSV file: ")
+    output_file_path = input("Enter the path of the output CSV file: ")
 
-# Calling the function with user inputs
-filter_and_save_csv_data(input_file_path, output_file_path)
+    # Calling the function with user inputs
+    filter_and_save_csv_data(input_file_path, output_file_path)
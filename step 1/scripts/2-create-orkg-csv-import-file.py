@@ -29,9 +29,10 @@ def transform_and_save_csv(input_file, output_file):
     new_data.to_csv(output_file, index=False)
     print(f"Data has been transformed and saved to {output_file}")
 
-# Prompting user for the paths of the input and output CSV files
-input_file_path = input("Enter the path of the input CSV file: ")
-output_file_path = input("Enter the path of the output CSV file: ")
+if __name__ == "__main__":
+    # Prompting user for the paths of the input and output CSV files
+    input_file_path = input("Enter the path of the input CSV file: ")
+    output_file_path = input("Enter the path of the output CSV file: ")
 
-# Calling the function with user inputs
-transform_and_save_csv(input_file_path, output_file_path)
+    # Calling the function with user inputs
+    transform_and_save_csv(input_file_path, output_file_path)
@@ -1,22 +1,15 @@
-import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 import pandas as pd
-from orkg import ORKG
 from getpass import getpass
-
-def setup_session():
-    session = requests.Session()
-    retries = Retry(total=5,
-                    backoff_factor=1,
-                    status_forcelist=[500, 502, 503, 504, 104])
-    session.mount('https://', HTTPAdapter(max_retries=retries))
-    return session
+import time
+from concurrent.futures import ThreadPoolExecutor
+from local_index import LocalIndex
+from run_metrics import METRICS, instrument_orkg
+from http_client import orkg_client
 
 def fetch_paper_details(input_file, output_file, username, password):
-    # Initialize the ORKG client with credentials and a custom session for retries
-    session = setup_session()
-    orkg = ORKG(host="https://orkg.org", creds=(username, password), session=session)
+    # Initialize the ORKG client with credentials and a resilient session for retries
+    orkg = orkg_client("https://orkg.org", creds=(username, password))
+    instrument_orkg(orkg, METRICS)
 
     # Read the CSV file to get DOIs
     data = pd.read_csv(input_file)
@@ -45,11 +38,103 @@ def fetch_paper_details(input_file, output_file, username, password):
     output_data.to_csv(output_file, index=False)
     print(f"Data has been written to {output_file}")
 
-# Input credentials and file paths from user
-username = input("Enter your ORKG username: ")
-password = getpass("Enter your ORKG password: ")
-input_file_path = input("Enter the path of the input CSV file: ")
-output_file_path = input("Enter the path of the output CSV file: ")
+NOT_FOUND = 'not in the ORKG'
+
+def lookup_doi(orkg, doi):
+    """
+    Look up one DOI; returns (paper dict, None) on success, (None, NOT_FOUND) if the ORKG has no paper
+    with the DOI (yet), or (None, error message) if the lookup failed.
+    """
+    try:
+        response = orkg.papers.by_doi(doi=doi)
+    except Exception as e:
+        return None, str(e)
+    if not 200 <= int(response.status_code) < 300:
+        return None, f"Status Code: {response.status_code}"
+    if len(response.content) == 0:
+        return None, NOT_FOUND
+    paper = response.content[0]
+    return {'paper_id': paper['id'], 'paper_title': paper['title']}, None
+
+def fetch_paper_details_parallel(input_file, output_file, username, password, host, workers, cache_path, retry_rounds=3):
+    # One ORKG client, logged in once, whose pooled session all worker threads share.
+    # DOI lookups are read-only, so an empty username skips the login (e.g. against a local stand-in)
+    orkg = orkg_client(host, creds=(username, password) if username else None, pool_size=workers)
+    instrument_orkg(orkg, METRICS)
+
+    data = pd.read_csv(input_file)
+    dois = list(dict.fromkeys(data['paper:doi'].tolist()))  # unique DOIs in input order
+    cache = LocalIndex(cache_path) if cache_path else None
+
+    # Only DOIs that have not been resolved before are queried
+    queue = [doi for doi in dois if cache is None or doi not in cache]
+    resolved = {doi: cache.get(doi) for doi in dois if cache is not None and doi in cache}
+    print(f"{len(dois) - len(queue)} DOIs found in the cache, {len(queue)} to look up with {workers} workers.")
+
+    def resolve(doi):
+        paper, error = lookup_doi(orkg, doi)
+        if paper is not None and cache is not None:
+            cache.put(doi, paper)
+        return doi, paper, error
+
+    failed = {}
+    # A DOI the ORKG answers for without a paper is not imported yet; asking again in this run would not help
+    not_found = {}
+    with METRICS.stage('doi lookup', rows=len(queue)), ThreadPoolExecutor(max_workers=workers) as executor:
+        for attempt in range(retry_rounds + 1):
+            if attempt > 0:
+                if not queue:
+                    break
+                # Failed DOIs are retried in rounds with a growing pause, after the rest of the work is done
+                delay = 2 ** attempt
+                print(f"Retrying {len(queue)} failed DOIs in {delay} seconds (round {attempt} of {retry_rounds}).")
+                time.sleep(delay)
+            failed = {}
+            for doi, paper, error in executor.map(resolve, queue):
+                if paper is not None:
+                    resolved[doi] = paper
+                elif error == NOT_FOUND:
+                    not_found[doi] = error
+                else:
+                    failed[doi] = error
+            queue = list(failed)
+    failed.update(not_found)
+
+    if cache is not None:
+        cache.close()
+
+    output_data = pd.DataFrame(
+        [{'doi': doi, 'paper_id': resolved[doi]['paper_id'], 'paper_title': resolved[doi]['paper_title']} for doi in dois if doi in resolved],
+        columns=['doi', 'paper_id', 'paper_title']
+    )
+    output_data.to_csv(output_file, index=False)
+    print(f"Data has been written to {output_file}")
+
+    if failed:
+        failed_file = output_file.rsplit('.', 1)[0] + '-failed-dois.csv'
+        pd.DataFrame([{'doi': doi, 'error': error} for doi, error in failed.items()]).to_csv(failed_file, index=False)
+        print(f"{len(failed)} DOIs could not be resolved ({len(not_found)} are not in the ORKG yet); they are listed in {failed_file} and will be looked up again on the next run.")
+    return len(failed)
+
+if __name__ == "__main__":
+    # Input credentials and file paths from user
+    username = input("Enter your ORKG username: ")
+    password = getpass("Enter your ORKG password: ")
+    input_file_path = input("Enter the path of the input CSV file: ")
+    output_file_path = input("Enter the path of the output CSV file: ")
+
+    mode = input("Enter the lookup mode (sequential/parallel) [sequential]: ").strip().lower() or 'sequential'
+    metrics_path = input("Enter the metrics report path (e.g., data/metrics/4-papers.json, leave empty to disable): ").strip()
+    METRICS.script = '1-create-paper-info-file-from-orkg'
 
-# Execute the function with user inputs
-fetch_paper_details(input_file_path, output_file_path, username, password)
+    # Execute the function with user inputs
+    if mode == 'parallel':
+        host = input("Enter the ORKG host address [https://orkg.org]: ").strip() or "https://orkg.org"
+        workers = int(input("Enter the number of parallel lookups [8]: ").strip() or 8)
+        cache_path = input("Enter the DOI cache file path (e.g., data/4-orkg-doi-cache.jsonl, leave empty to disable): ").strip()
+        fetch_paper_details_parallel(input_file_path, output_file_path, username, password, host, workers, cache_path)
+    else:
+        with METRICS.stage('doi lookup'):
+            fetch_paper_details(input_file_path, output_file_path, username, password)
+    if metrics_path:
+        METRICS.write(metrics_path)
@@ -1,6 +1,16 @@
 import pandas as pd
-from orkg import ORKG
 from getpass import getpass
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from label_resolver import LabelResolver, canonical_label, clean_label
+from run_metrics import METRICS, instrument_orkg
+from http_client import orkg_client
+from upload_log import UploadLog, new_run_id
+
+OUTPUT_COLUMNS = ['Name', 'ORKG Resource ID', 'Status', 'Detail']
+REACTANT_COLUMNS = ['process_reactanta', 'process_reactantb', 'process_reactantc', 'process_reactantd']
+MATERIAL_COLUMNS = ['process_material']
 
 def read_csv_with_encoding(file_path, encoding='utf-8'):
     try:
@@ -36,6 +46,104 @@ def process_items(orkg, data, item_columns):
 
     return items_info
 
+def load_label_index(index_path, output_paths):
+    """ Open the shared label resolver index and seed it with every resource already recorded in the output files. """
+    resolver = LabelResolver(index_path)
+    for output_path in output_paths:
+        if os.path.exists(output_path):
+            recorded = read_csv_with_encoding(output_path)
+            for _, row in recorded[recorded['Status'] == 'Processed'].iterrows():
+                resolver.add(row['Name'], row['ORKG Resource ID'])
+    return resolver
+
+def append_items(items_info, output_path, lock):
+    with lock:
+        write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        pd.DataFrame(items_info, columns=OUTPUT_COLUMNS).to_csv(output_path, mode='a', header=write_header, index=False)
+
+def find_or_create(orkg, label):
+    """ resources.find_or_add, but also tells whether the resource was created; returns (response, created). """
+    found = orkg.resources.get(q=label, exact=True, size=1)
+    if not found.succeeded:
+        return found, False
+    if isinstance(found.content, list) and len(found.content) > 0:
+        found.content = found.content[0]
+        return found, False
+    return orkg.resources.add(label=label), True
+
+def register_items(orkg, data, item_columns, output_path, index, workers, registration_log=None, run_id=None):
+    """
+    Register the labels in `item_columns` incrementally: labels already in the output file are skipped,
+    labels found in the index are recorded without a network call, and only the remaining normalized
+    labels are looked up and, if missing, created, concurrently. Every result is appended to the output
+    file right away, so an interrupted run resumes where it stopped. The resources a run created are
+    also recorded in `registration_log` under `run_id`, so that delete-resources.py can roll them back.
+    """
+    items = data[item_columns].fillna('')
+    labels = [clean_label(item) for item in pd.unique(items.values.flatten())]
+    labels = list(dict.fromkeys(label for label in labels if label))
+
+    recorded = set()
+    if os.path.exists(output_path):
+        previous = read_csv_with_encoding(output_path)
+        recorded = {clean_label(name) for name in previous.loc[previous['Status'] == 'Processed', 'Name']}
+
+    # Every spelling variant is recorded under its own name, but each normalized label is registered once
+    variants = {}
+    for label in labels:
+        if label not in recorded:
+            variants.setdefault(canonical_label(label), []).append(label)
+
+    lock = threading.Lock()
+    from_index = []
+    misses = []
+    for key, names in variants.items():
+        # Exact or canonical matches only: a fuzzy match is not reliable enough to skip a registration
+        match = index.resolve(names[0], fuzzy=False)
+        if match is not None:
+            for name in names:
+                index.add(name, match[0])
+            from_index.extend({'Name': name, 'ORKG Resource ID': match[0], 'Status': 'Processed'} for name in names)
+        else:
+            misses.append((key, names))
+    if from_index:
+        append_items(from_index, output_path, lock)
+    print(f"{len(recorded)} labels already recorded, {len(from_index)} resolved from the local index, {len(misses)} to register with {workers} workers.")
+
+    def register(miss):
+        key, names = miss
+        response, created = find_or_create(orkg, names[0])
+        response_data = response.content
+        if not isinstance(response_data, dict):
+            # Error responses (e.g. a 503 from a proxy) come back as raw bytes
+            response_data = {'message': f"Status Code: {response.status_code}"}
+        if registration_log is not None and 'id' in response_data:
+            registration_log.record(run_id=run_id, key=names[0], resource_id=response_data['id'], status='created' if created else 'found')
+        return key, names, response_data
+
+    failed = 0
+    with METRICS.stage('register resources', rows=len(misses)), ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(register, miss) for miss in misses]
+        for future in as_completed(futures):
+            try:
+                key, names, response_data = future.result()
+            except Exception as e:
+                print(f"Failed to process a resource: {e}")
+                failed += 1
+                continue
+            if 'id' in response_data:
+                for name in names:
+                    index.add(name, response_data['id'])
+                append_items([{'Name': name, 'ORKG Resource ID': response_data['id'], 'Status': 'Processed'} for name in names], output_path, lock)
+                print(f"Successfully processed resource {names[0]}, ID: {response_data['id']}")
+            else:
+                error_detail = response_data.get('message', 'Unknown error')
+                append_items([{'Name': name, 'Status': 'Failed', 'Detail': error_detail} for name in names], output_path, lock)
+                print(f"Failed to process resource {names[0]}: {error_detail}")
+                failed += 1
+    print(f"Registration finished with {failed} failures; results are in {output_path}")
+    return failed
+
 def main():
     host_address = input("Enter the ORKG host address: ")
     email = input("Enter your ORKG email address: ")
@@ -44,20 +152,48 @@ def main():
     reactants_output_path = input("Enter the path of the reactants output CSV file: ")
     materials_output_path = input("Enter the path of the materials output CSV file: ")
 
-    orkg = ORKG(host=host_address, creds=(email, password))
+    mode = input("Enter the registration mode (sequential/bulk) [sequential]: ").strip().lower() or 'sequential'
+    metrics_path = input("Enter the metrics report path (e.g., data/metrics/5-resources.json, leave empty to disable): ").strip()
+    METRICS.script = '2-add-material-and-reactants-to-orkg'
+
+    orkg = orkg_client(host_address, creds=(email, password))
+    instrument_orkg(orkg, METRICS)
     data = read_csv_with_encoding(input_file_path)
 
-    reactant_columns = ['process_reactanta', 'process_reactantb', 'process_reactantc', 'process_reactantd']
-    reactants_info = process_items(orkg, data, reactant_columns)
+    if mode == 'bulk':
+        workers = int(input("Enter the number of concurrent requests [8]: ").strip() or 8)
+        index_path = input("Enter the label index file path (e.g., data/5-orkg-label-index.jsonl): ")
+        registration_log_path = input("Enter the registration log path (e.g., data/5-orkg-registration-log.jsonl): ").strip()
+        index = load_label_index(index_path, [reactants_output_path, materials_output_path])
+        registration_log = UploadLog(registration_log_path) if registration_log_path else None
+        run_id = new_run_id()
+        print(f"Registration run ID: {run_id}")
+        try:
+            register_items(orkg, data, REACTANT_COLUMNS, reactants_output_path, index, workers, registration_log, run_id)
+            register_items(orkg, data, MATERIAL_COLUMNS, materials_output_path, index, workers, registration_log, run_id)
+        finally:
+            index.close()
+            if registration_log is not None:
+                registration_log.close()
+            if metrics_path:
+                METRICS.write(metrics_path)
+        return
+
+    with METRICS.stage('register resources') as stage:
+        reactants_info = process_items(orkg, data, REACTANT_COLUMNS)
+        stage.rows = len(reactants_info)
     reactants_df = pd.DataFrame(reactants_info)
     reactants_df.to_csv(reactants_output_path, index=False)
     print(f"Reactants information has been written to {reactants_output_path}")
 
-    material_columns = ['process_material']
-    materials_info = process_items(orkg, data, material_columns)
+    with METRICS.stage('register resources') as stage:
+        materials_info = process_items(orkg, data, MATERIAL_COLUMNS)
+        stage.rows = len(materials_info)
     materials_df = pd.DataFrame(materials_info)
     materials_df.to_csv(materials_output_path, index=False)
     print(f"Materials information has been written to {materials_output_path}")
+    if metrics_path:
+        METRICS.write(metrics_path)
 
 if __name__ == "__main__":
     main()
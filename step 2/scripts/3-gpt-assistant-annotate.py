@@ -1,8 +1,33 @@
 import pandas as pd
 import os
-from openai import OpenAI
 import getpass
 import json
+import asyncio
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import estimate_tokens
+from concurrent_extraction import OrderedOutputWriter, run_concurrently, append_rows_durably
+from checkpoint_journal import CheckpointJournal
+from batch_jobs import write_batch_requests, read_batch_results
+from response_cache import ResponseCache, ReplayMiss
+from fulltext_chunking import chunk_full_text, merge_profiles
+from columnar_store import read_table, table_columns
+from fulltext_store import FullTextStore
+from run_metrics import METRICS, create_completion, create_completion_async
+from llm_backends import load_backends, single_backend
+from prompt_templates import ARTICLE_MESSAGE, PromptCacheEstimate, layout_messages, process_context, processes_context, static_prefix
+from profile_repair import load_schema, repair_json, normalize_profile, field_list, fill_fields
+
+# Parallel chunk requests per article in the sequential mode, and the smallest chunk worth sending
+CHUNK_WORKERS = 4
+MIN_CHUNK_TOKENS = 1000
+# Local count of the input tokens the provider's prompt cache can serve, for the run metrics
+PROMPT_CACHE = PromptCacheEstimate()
+# The full-text store the articles are read from, if read_input_files was given one; otherwise rows carry their full_text
+FULL_TEXTS = None
+
+OUTPUT_COLUMNS = ['process_id', 'process_material', 'process_reactanta', 'process_reactantb', 'process_reactantc', 'process_reactantd', 'reference_doi', 'paper_id', 'paper_title', 'extracted_info']
 
 def generate_unique_key(row):
     # Combine DOI with material and reactants to form a unique key
@@ -10,31 +35,48 @@ def generate_unique_key(row):
     key_components = [row['reference_doi']] + [str(x) for x in reactants if pd.notna(x)]
     return '_'.join(key_components)
 
-def load_processed_records(record_file_path):
-    try:
-        with open(record_file_path, 'r') as file:
-            processed_keys = set(file.read().splitlines())
-    except FileNotFoundError:
-        processed_keys = set()
-    return processed_keys
-
-def update_processed_records(record_file_path, processed_keys):
-    with open(record_file_path, 'w') as file:
-        file.write('\n'.join(processed_keys))
+def open_processed_records(record_file_path, output_file_path):
+    # Compact the journal, reconcile it with the output file and return it with the set of processed keys
+    journal = CheckpointJournal(record_file_path)
+    journal.reconcile(output_file_path, generate_unique_key)
+    return journal, journal.processed_keys()
 
-def read_input_files(materials_path, reactants_path, papers_path, raw_data_path):
+def read_input_files(materials_path, reactants_path, papers_path, raw_data_path, full_text_store_path=None):
     # Similar as before, merge and map dataframes
-    materials_df = pd.read_csv(materials_path)
-    reactants_df = pd.read_csv(reactants_path)
-    papers_df = pd.read_csv(papers_path)
-    raw_data_df = pd.read_csv(raw_data_path)
+    materials_df = read_table(materials_path)
+    reactants_df = read_table(reactants_path)
+    papers_df = read_table(papers_path)
+    if full_text_store_path:
+        # Rows only carry the DOI; each article is read from the store when its request is built
+        open_full_text_store(full_text_store_path)
+        raw_data_df = read_table(raw_data_path, [column for column in table_columns(raw_data_path) if column != 'full_text'])
+    else:
+        raw_data_df = read_table(raw_data_path)
     
     papers_df.rename(columns={'doi': 'reference_doi'}, inplace=True)
     combined_df = pd.merge(raw_data_df, papers_df, on='reference_doi', how='left')
     
     return materials_df, reactants_df, combined_df
 
-def format_system_message(row):
+def open_full_text_store(path):
+    global FULL_TEXTS
+    if FULL_TEXTS is not None:
+        FULL_TEXTS.close()
+    FULL_TEXTS = FullTextStore(path)
+    print(f"{len(FULL_TEXTS)} full texts in the full-text store {path}")
+
+def article_text(row):
+    """ The full text of a row's article, from the full-text store if one is open; None if there is none. """
+    if FULL_TEXTS is not None:
+        return FULL_TEXTS.get(row['reference_doi'])
+    return None if pd.isna(row['full_text']) else row['full_text']
+
+def has_article(row):
+    if FULL_TEXTS is not None:
+        return pd.notna(row['reference_doi']) and row['reference_doi'] in FULL_TEXTS
+    return pd.notna(row['full_text'])
+
+def format_reactants_list(row):
     # Create a list of reactants, converting each to a string only if it's not NaN
     reactants = [
         str(row['process_reactanta']) if pd.notna(row['process_reactanta']) else None,
@@ -43,127 +85,420 @@ def format_system_message(row):
         str(row['process_reactantd']) if pd.notna(row['process_reactantd']) else None
     ]
     # Filter out any None entries, which represent empty cells
-    reactants_list = ', '.join(filter(None, reactants))
+    return ', '.join(filter(None, reactants))
 
+def article_message(full_text, part=None):
+    if part is None:
+        return f"Extract the information as instructed from this article:\n{full_text}"
+    return f"Extract the information as instructed from this part ({part[0]} of {part[1]}) of an article:\n{full_text}"
+
+def build_completion_request(row, full_text=None, part=None):
+    # The keyword arguments for a chat completion request for one data row, or for one part of its article.
+    # The static prefix comes first and the row's material and reactants last (see prompt_templates.py).
+    if full_text is None:
+        full_text = article_text(row)
+    return dict(
+        model="gpt-4o",
+        messages=layout_messages(
+            static_prefix(),
+            article_message(full_text, part),
+            process_context(row['process_material'], format_reactants_list(row)),
+        ),
+        response_format={"type": "json_object"},
+        temperature=0.1,
+        seed=54,
+    )
+
+def build_field_request(request, row, fields):
+    # A short re-request for only the fields of a profile that failed validation, on the same article text
     system_message = f'''
         <role>
-            You are assigned as a specialist in Atomic Layer Deposition (ALD). Your primary task is to process scientific articles related to ALD, extracting specific scientific information as detailed below. The ALD process involves the material {row['process_material']} and reactants {reactants_list}. This context defines the scope of the extraction task and the information is prepopulated in the extraction schema.
+            You are assigned as a specialist in Atomic Layer Deposition (ALD). The ALD process involves the material {row['process_material']} and reactants {format_reactants_list(row)}.
         </role>
 
         <task>
-            Upon receiving an article, identify and extract data according to a predefined schema. Record values for each property specified in the schema. If a property is not mentioned in the article, denote this with a "-". For properties discussed in the article that are not included in the schema, extract these as well and list them under an "extra_properties" section as key-value pairs.
+            Extract only the following properties of this process from the article:
+{textwrap.indent(field_list(load_schema(), fields), ' ' * 12)}
         </task>
 
-        <extraction-schema>
-        [
-            {{
-                "process_parameters": {{
-                    "reactants": [
-                        "{reactants_list}"
-                    ],
-                    "temperature_range": "Range of temperatures used for the deposition process",
-                    "pressure_range": "Range of pressures used for the deposition process"
-                }},
-                "film_properties": {{
-                    "material": "{row['process_material']}",
-                    "thickness_control": "Methods and results of thickness control",
-                    "uniformity": "Uniformity of the film across the substrate",
-                    "conformality": "Conformality of the film on 3D structures",
-                    "film_thickness": "Thickness of the deposited film",
-                    "film_density": "Density of the deposited film",
-                    "surface_roughness": "Surface roughness of the deposited film",
-                    "refractive_index": "Refractive index of the deposited film"
-                }},
-                "process_characteristics": {{
-                    "self_limiting_behavior": "Evidence of self-limiting behavior in the ALD process",
-                    "nucleation_behavior": "Description of nucleation behavior observed",
-                    "growth_per_cycle": "Growth per cycle observed in the process"
-                }},
-                "safety": "Safety considerations for the process and materials",
-                "stability": "Stability of the deposited films over time",
-                "reproducibility": "Reproducibility of the film thickness and properties",
-                "precursor_consumption": "Efficiency and consumption rate of precursors",
-                "device_performance": "Performance of the ALD films in practical devices",
-                "extra_properties": {{
-                    "Additional property 1": "Value of additional property 1",
-                    "Additional property 2": "Value of additional property 2",
-                    "..."
-                }}
-            }}
-        ]
-        </extraction-schema>
-
         <output-response-format>
-            Your responses should be formatted in JSON, strictly adhering to the provided schema. Ensure the formatting and data integrity are maintained as per the guidelines. Use the "-" symbol for any property not mentioned in the article.
+            Your response should be a JSON object that maps each property name above to its value. Use the "-" symbol for any property not mentioned in the article.
         </output-response-format>
     '''
-    return system_message
+    return dict(request, messages=[{"role": "system", "content": system_message}, request['messages'][ARTICLE_MESSAGE]])
+
+def build_coalesced_completion_request(rows, full_text=None, part=None):
+    # All rows of a group share the reference DOI and therefore the full text
+    request = build_completion_request(rows[0], full_text, part)
+    request['messages'] = layout_messages(
+        static_prefix(coalesced=True),
+        request['messages'][ARTICLE_MESSAGE]['content'],
+        processes_context([(row['process_id'], row['process_material'], format_reactants_list(row)) for row in rows]),
+    )
+    return request
+
+def build_requests(build_request, rows_or_row, full_text, token_budget):
+    """
+    One request for the whole article, or, with a token budget, one request per chunk of the article
+    with reference and other boilerplate sections removed.
+    """
+    if not token_budget:
+        return [build_request(rows_or_row, full_text)]
+    system_tokens = sum(estimate_tokens(message['content']) for message in build_request(rows_or_row, '')['messages'])
+    chunks = chunk_full_text(full_text, max(token_budget - system_tokens, MIN_CHUNK_TOKENS))
+    if len(chunks) == 1:
+        return [build_request(rows_or_row, chunks[0])]
+    return [build_request(rows_or_row, chunk, (number, len(chunks))) for number, chunk in enumerate(chunks, start=1)]
+
+def split_coalesced_response(content, rows):
+    """ Map each row's process_id to its profile JSON string. Processes missing from the answer are left out. """
+    try:
+        processes = json.loads(content).get('processes', [])
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        return {}
+    if not isinstance(processes, list):
+        return {}
+
+    profiles = {}
+    for entry in processes:
+        if isinstance(entry, dict) and isinstance(entry.get('profile'), dict):
+            profiles[str(entry.get('process_id', '')).strip()] = json.dumps(entry['profile'], indent=4, ensure_ascii=False)
 
-def extract_and_process(client, row):
-    formatted_message = format_system_message(row)
-    full_text = row['full_text']
+    # Fall back to positional matching if the model dropped the ids but kept one entry per process
+    if not any(str(row['process_id']) in profiles for row in rows) and len(processes) == len(rows):
+        profiles = {
+            str(row['process_id']): json.dumps(entry['profile'], indent=4, ensure_ascii=False)
+            for row, entry in zip(rows, processes) if isinstance(entry, dict) and isinstance(entry.get('profile'), dict)
+        }
+    return {process_id: profile for process_id, profile in profiles.items() if process_id in {str(row['process_id']) for row in rows}}
+
+def is_valid_json(content):
+    try:
+        json.loads(content)
+        return True
+    except (json.JSONDecodeError, TypeError):
+        return False
+
+def repair_response(content):
+    """ The answer with common JSON defects repaired locally (see profile_repair.py); unchanged if it needs no repair or cannot be repaired. """
+    value, fixes = repair_json(content)
+    if value is None or not fixes:
+        return content
+    for fix in fixes:
+        METRICS.count_repair(fix)
+    return json.dumps(value, indent=4, ensure_ascii=False)
+
+def validate_profile(content):
+    """
+    Check a profile against ald-schema_ver4.json, repairing what can be repaired locally. Returns
+    (profile, failing fields); the profile is None if the answer is not a JSON object at all.
+    """
+    try:
+        profile = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return None, []
+    if not isinstance(profile, dict):
+        return None, []
+    fixes, failing = normalize_profile(profile, load_schema())
+    for fix in fixes:
+        METRICS.count_repair(fix)
+    return profile, failing
+
+def fill_failing_fields(profile, failing, answer, label):
+    unresolved = fill_fields(profile, failing, answer, load_schema())
+    if unresolved:
+        print(f"Fields still invalid for {label}, set to '-': {', '.join(unresolved)}")
+    return json.dumps(profile, indent=4, ensure_ascii=False)
+
+def check_profile(backends, content, request, row, cache=None, label=''):
+    # Only the fields that are still invalid after the local repair are asked for again
+    profile, failing = validate_profile(content)
+    if profile is None:
+        return content
+    if not failing:
+        return json.dumps(profile, indent=4, ensure_ascii=False)
+    print(f"{len(failing)} invalid fields for {label}, re-requesting only those.")
+    METRICS.count_retry('openai', 'invalid fields')
+    answer = complete_with_retries(backends, build_field_request(request, row, failing), cache, label=label)
+    return fill_failing_fields(profile, failing, answer, label)
+
+def merge_chunk_responses(contents):
+    # Reduce the per-chunk answers into one profile; fall back to the last answer if none of them is valid JSON
+    profiles = [json.loads(content) for content in contents if is_valid_json(content)]
+    merged = merge_profiles(profiles)
+    if merged is None:
+        return contents[-1]
+    return json.dumps(merged, indent=4, ensure_ascii=False)
+
+def complete_with_retries(backends, request, cache=None, is_valid=is_valid_json, label='', row_count=1):
+    # The request goes to the backend its length and number of processes are routed to, with that backend's model
+    backend, request = backends.route(request, row_count)
+    if cache is not None:
+        cached = cache.get(request)
+        if cached is not None:
+            return cached
     valid_json = False
     attempts = 0
 
     while not valid_json and attempts < 5:  # Limit retries to prevent infinite loops
         attempts += 1
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": formatted_message},
-                {"role": "user", "content": f"Extract the information as instructed from this article:\n{full_text}"}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.1,
-            seed=54,
-        )
+        estimate = PROMPT_CACHE.count(request)
+        with backend.slots:
+            completion = create_completion(backend.client, request, METRICS, backend.name)
+        METRICS.record_usage(request['model'], getattr(completion, 'usage', None), label, row_count, estimate)
         
-        # Check if the response is valid JSON
-        try:
-            # Attempt to parse the JSON to see if it's valid
-            json.loads(completion.choices[0].message.content)
-            valid_json = True  # Set flag to True if parsing is successful
-        except json.JSONDecodeError:
-            print(f"Invalid JSON received on attempt {attempts}. Retrying...")
-            valid_json = False
-        
-        # Sleep briefly to avoid hitting the API too rapidly in a loop
+        # Repair common defects locally; only an answer that is still not valid JSON is requested again
+        content = repair_response(completion.choices[0].message.content)
+        valid_json = is_valid(content)
         if not valid_json:
-            import time
+            print(f"Invalid JSON received on attempt {attempts}. Retrying...")
+            METRICS.count_retry('openai', 'invalid json')
+            # Sleep briefly to avoid hitting the API too rapidly in a loop
             time.sleep(1)
 
+    if valid_json and cache is not None:
+        cache.put(request, content)
     # Return the last response received, valid or otherwise, to handle cases where valid JSON is never returned
-    return completion.choices[0].message.content
+    return content
 
-def main():
-    api_key = getpass.getpass('Enter your OpenAI API key: ')
-    client = OpenAI(api_key=api_key)
-    
-    # Setup paths and load files
-    materials_path = input("Enter the file path for materials CSV: ")
-    reactants_path = input("Enter the file path for reactants CSV: ")
-    papers_path = input("Enter the file path for papers CSV: ")
-    raw_data_path = input("Enter the file path for raw data CSV: ")
-    record_file_path = input("Enter the record file path (e.g., 'processed_records.txt'): ")
-    
-    _, _, combined_df = read_input_files(materials_path, reactants_path, papers_path, raw_data_path)
-    processed_keys = load_processed_records(record_file_path)
-    output_file_path = input("Enter the output file path (e.g., 'output_data.csv'): ")
-    
-    first_run = True
-    
+def extract_and_process(backends, row, cache=None, token_budget=None):
+    requests = build_requests(build_completion_request, row, article_text(row), token_budget)
+    label = f"process {row['process_id']}"
+
+    def complete(request):
+        return complete_with_retries(backends, request, cache, label=label)
+
+    if len(requests) == 1:
+        return check_profile(backends, complete(requests[0]), requests[0], row, cache, label)
+
+    # Map: extract from every chunk in parallel; reduce: merge the chunk profiles in chunk order.
+    # The merged profile is checked once, so only fields that no chunk answered validly are asked for again
+    with ThreadPoolExecutor(max_workers=min(len(requests), CHUNK_WORKERS)) as executor:
+        contents = list(executor.map(complete, requests))
+    return check_profile(backends, merge_chunk_responses(contents), requests[0], row, cache, label)
+
+async def complete_with_retries_async(backends, request, cache=None, is_valid=is_valid_json, label='', row_count=1):
+    # Same retry behaviour as complete_with_retries, but every attempt waits for the backend's rate limiter first
+    backend, request = backends.route(request, row_count)
+    client = backend.async_client
+    limiter = backend.limiter
+    if cache is not None:
+        cached = cache.get(request)
+        if cached is not None:
+            return cached
+    estimated_tokens = sum(estimate_tokens(message['content']) for message in request['messages']) + 1000
+    valid_json = False
+    attempts = 0
+
+    while not valid_json and attempts < 5:
+        attempts += 1
+        await limiter.acquire(estimated_tokens)
+        estimate = PROMPT_CACHE.count(request)
+        try:
+            completion = await create_completion_async(client, request, METRICS, backend.name)
+        finally:
+            limiter.release()
+        usage = getattr(completion, 'usage', None)
+        limiter.record_usage(estimated_tokens, getattr(usage, 'total_tokens', None))
+        METRICS.record_usage(request['model'], usage, label, row_count, estimate)
+
+        content = repair_response(completion.choices[0].message.content)
+        valid_json = is_valid(content)
+        if not valid_json:
+            print(f"Invalid JSON received on attempt {attempts} for {label}. Retrying...")
+            METRICS.count_retry('openai', 'invalid json')
+            await asyncio.sleep(1)
+
+    if valid_json and cache is not None:
+        cache.put(request, content)
+    return content
+
+async def check_profile_async(backends, content, request, row, cache=None, label=''):
+    # Same as check_profile, with the field re-request going through the rate limiter
+    profile, failing = validate_profile(content)
+    if profile is None:
+        return content
+    if not failing:
+        return json.dumps(profile, indent=4, ensure_ascii=False)
+    print(f"{len(failing)} invalid fields for {label}, re-requesting only those.")
+    METRICS.count_retry('openai', 'invalid fields')
+    answer = await complete_with_retries_async(backends, build_field_request(request, row, failing), cache, label=label)
+    return fill_failing_fields(profile, failing, answer, label)
+
+async def extract_and_process_async(backends, row, cache=None, token_budget=None):
+    requests = build_requests(build_completion_request, row, article_text(row), token_budget)
+    label = f"process {row['process_id']}"
+
+    contents = await asyncio.gather(*(complete_with_retries_async(backends, request, cache, label=label) for request in requests))
+    content = contents[0] if len(contents) == 1 else merge_chunk_responses(contents)
+    return await check_profile_async(backends, content, requests[0], row, cache, label)
+
+async def extract_group_async(backends, rows, cache=None, token_budget=None):
+    """ Extract all processes of one paper with a single request per chunk; returns a list of extracted_info strings in row order. """
+    requests = build_requests(build_coalesced_completion_request, rows, article_text(rows[0]), token_budget)
+    contents = await asyncio.gather(*(
+        complete_with_retries_async(
+            backends, request, cache,
+            is_valid=lambda content: bool(split_coalesced_response(content, rows)),
+            label=f"DOI {rows[0]['reference_doi']}", row_count=len(rows)
+        )
+        for request in requests
+    ))
+    chunk_profiles = [split_coalesced_response(content, rows) for content in contents]
+
+    async def extract_row(row):
+        process_id = str(row['process_id'])
+        answers = [(request, profiles[process_id]) for request, profiles in zip(requests, chunk_profiles) if process_id in profiles]
+        if not answers:
+            # The model skipped this process, so ask for it on its own
+            print(f"Process {row['process_id']} missing from the coalesced response, extracting it separately.")
+            return await extract_and_process_async(backends, row, cache, token_budget)
+        profile = answers[0][1] if len(answers) == 1 else merge_chunk_responses([profile for _, profile in answers])
+        return await check_profile_async(backends, profile, answers[0][0], row, cache, f"process {row['process_id']}")
+
+    return list(await asyncio.gather(*(extract_row(row) for row in rows)))
+
+def group_pending_rows(pending):
+    # Group pending rows by reference DOI, keeping the order in which papers first appear
+    groups = {}
+    for item in pending:
+        groups.setdefault(item[1]['reference_doi'], []).append(item)
+    return list(groups.values())
+
+def run_concurrent_extraction(api_key, combined_df, processed_keys, journal, output_file_path, max_in_flight, requests_per_minute, tokens_per_minute, coalesce=False, cache=None, token_budget=None, backends=None):
+    # Only rows that have not been processed yet are submitted, in file order
+    pending = list(pending_rows(combined_df, processed_keys))
+    # A unit of work is one row, or all pending rows of one paper when coalescing
+    units = group_pending_rows(pending) if coalesce else [[item] for item in pending]
+    print(f"{len(pending)} entries to process in {len(units)} requests with up to {max_in_flight} requests in flight.")
+
+    if backends is None:
+        # Chunks of one article run side by side, so the number of requests in flight is enforced per request
+        backends = single_backend(api_key, max_in_flight, requests_per_minute, tokens_per_minute)
+
+    def mark_processed(unique_key, offset):
+        processed_keys.add(unique_key)
+        journal.record(unique_key, 'done', offset)
+
+    writer = OrderedOutputWriter(output_file_path, mark_processed)
+
+    async def worker(unit):
+        rows = [row for _, row, _ in unit]
+        if not has_article(rows[0]):
+            extracted = ["-"] * len(unit)
+        elif len(unit) == 1:
+            extracted = [await extract_and_process_async(backends, rows[0], cache, token_budget)]
+        else:
+            extracted = await extract_group_async(backends, rows, cache, token_budget)
+
+        results = []
+        for (index, _, unique_key), extracted_info in zip(unit, extracted):
+            output_df = combined_df.loc[[index], OUTPUT_COLUMNS[:-1]].copy()
+            output_df['extracted_info'] = extracted_info
+            results.append((unique_key, output_df))
+        return results
+
+    async def run():
+        try:
+            # A replay miss is not a failed request: the replay stops, and the rows not written yet are left unprocessed
+            return await run_concurrently(units, worker, writer, max_in_flight, fatal=(ReplayMiss,))
+        except ReplayMiss as e:
+            print(f"{e}; stopping the replay and leaving the remaining entries unprocessed.")
+            return writer.written
+        finally:
+            await backends.aclose()
+
+    with METRICS.stage('extraction') as stage:
+        stage.rows = written = asyncio.run(run())
+    print(f"Extraction finished: {written} of {len(pending)} entries written to {output_file_path}")
+    return written
+
+def pending_rows(combined_df, processed_keys):
+    # The first row of every unprocessed key, in file order (later rows with the same key are skipped as in the live loop)
+    seen = set()
+    for index, row in combined_df.iterrows():
+        unique_key = generate_unique_key(row)
+        if unique_key in processed_keys or unique_key in seen:
+            continue
+        seen.add(unique_key)
+        yield index, row, unique_key
+
+def prepare_batch_requests(combined_df, processed_keys, batch_file_path):
+    # Rows without full text need no request; they are filled in with "-" when the results are ingested
+    requests = (
+        (unique_key, build_completion_request(row))
+        for _, row, unique_key in pending_rows(combined_df, processed_keys)
+        if has_article(row)
+    )
+    paths = write_batch_requests(requests, batch_file_path)
+    print(f"Batch request files written: {', '.join(paths) if paths else 'none, nothing left to process'}")
+
+def ingest_batch_results(combined_df, processed_keys, journal, results_file_path, output_file_path, cache=None, backends=None):
+    with METRICS.stage('batch ingest') as stage:
+        stage.rows = _ingest_batch_results(combined_df, processed_keys, journal, results_file_path, output_file_path, cache, backends)
+
+def _ingest_batch_results(combined_df, processed_keys, journal, results_file_path, output_file_path, cache=None, backends=None):
+    results = read_batch_results(results_file_path)
+    written = 0
+    failed = []
+
+    for index, row, unique_key in pending_rows(combined_df, processed_keys):
+        if not has_article(row):
+            extracted_info = "-"
+        elif unique_key not in results:
+            continue
+        else:
+            extracted_info, error = results[unique_key]
+            if error is None:
+                extracted_info = repair_response(extracted_info)
+                if not is_valid_json(extracted_info):
+                    error = 'invalid JSON'
+            if error is not None:
+                failed.append(unique_key)
+                print(f"No usable result for key {unique_key}: {error}")
+                continue
+            if cache is not None:
+                # Cached under the request as the live modes route it, so that they hit the batch results
+                request = build_completion_request(row)
+                if backends is not None:
+                    _, request = backends.route(request)
+                cache.put(request, extracted_info)
+            # There is no live client here, so fields that are still invalid are only reported
+            profile, failing = validate_profile(extracted_info)
+            if profile is not None:
+                extracted_info = json.dumps(profile, indent=4, ensure_ascii=False)
+                if failing:
+                    print(f"Invalid fields for key {unique_key}: {', '.join(failing)}")
+
+        output_df = combined_df.loc[[index], OUTPUT_COLUMNS[:-1]].copy()
+        output_df['extracted_info'] = extracted_info
+        offset = append_rows_durably(output_df, output_file_path)
+        processed_keys.add(unique_key)
+        journal.record(unique_key, 'done', offset)
+        written += 1
+
+    print(f"Ingested {written} rows into {output_file_path}; {len(failed)} failed results are left for a new batch.")
+    return written
+
+def extract_sequentially(backends, combined_df, processed_keys, journal, output_file_path, cache=None, token_budget=None):
+    """ The live loop, one row at a time with a confirmation after the first entry; returns the number of rows written. """
+    written = 0
     for index, row in combined_df.iterrows():
         unique_key = generate_unique_key(row)
         if unique_key not in processed_keys:
-            extracted_info = extract_and_process(client, row) if pd.notna(row['full_text']) else "-"
+            try:
+                extracted_info = extract_and_process(backends, row, cache, token_budget) if has_article(row) else "-"
+            except ReplayMiss as e:
+                print(f"{e}; leaving key {unique_key} unprocessed.")
+                continue
             combined_df.at[index, 'extracted_info'] = extracted_info
             
-            # Write output and update records
-            output_df = combined_df.loc[[index], ['process_id', 'process_material', 'process_reactanta', 'process_reactantb', 'process_reactantc', 'process_reactantd', 'reference_doi', 'paper_id', 'paper_title', 'extracted_info']]
-            output_df.to_csv(output_file_path, mode='a', header=first_run, index=False)
-            first_run = False
+            # Write output durably, then journal the key with the output offset
+            output_df = combined_df.loc[[index], OUTPUT_COLUMNS]
+            offset = append_rows_durably(output_df, output_file_path)
             processed_keys.add(unique_key)
-            update_processed_records(record_file_path, processed_keys)
+            journal.record(unique_key, 'done', offset)
+            written += 1
             
             if index == 0:
                 print(f"First entry processed. Check the output in {output_file_path}. Continue with the rest? (yes/no):")
@@ -171,6 +506,79 @@ def main():
                     break
         else:
             print(f"Skipping already processed entry for key: {unique_key}")
+    return written
+
+def open_response_cache():
+    cache_path = input("Enter the response cache file path (e.g., data/6-gpt-response-cache.sqlite, leave empty to disable): ").strip()
+    if not cache_path:
+        return None
+    replay = input("Replay from the cache only, without calling the API? (yes/no) [no]: ").strip().lower() in ['yes', 'y']
+    return ResponseCache(cache_path, read_only=replay)
+
+def read_int(prompt, default):
+    value = input(prompt).strip()
+    return int(value) if value else default
+
+def main():
+    api_key = getpass.getpass('Enter your OpenAI API key: ')
+    backends_path = input("Enter the LLM backends file path (e.g., data/llm-backends.json, leave empty to use gpt-4o on the OpenAI API): ").strip()
+    backends = load_backends(backends_path, api_key) if backends_path else None
+    if backends is not None:
+        print(f"Requests are routed to the first backend they fit:\n{backends.describe()}")
+    
+    # Setup paths and load files
+    materials_path = input("Enter the file path for materials CSV: ")
+    reactants_path = input("Enter the file path for reactants CSV: ")
+    papers_path = input("Enter the file path for papers CSV: ")
+    raw_data_path = input("Enter the file path for raw data CSV: ")
+    full_text_store_path = input("Enter the full-text store path written in step 1 (e.g., ../step 1/data/2-full-texts.store, leave empty if the raw data has the full texts): ").strip()
+    record_file_path = input("Enter the record file path (e.g., 'processed_records.txt'): ")
+    
+    _, _, combined_df = read_input_files(materials_path, reactants_path, papers_path, raw_data_path, full_text_store_path or None)
+    output_file_path = input("Enter the output file path (e.g., 'output_data.csv'): ")
+    journal, processed_keys = open_processed_records(record_file_path, output_file_path)
+    mode = input("Enter the extraction mode (sequential/concurrent/batch-prepare/batch-ingest) [sequential]: ").strip().lower() or 'sequential'
+    cache = open_response_cache()
+    metrics_path = input("Enter the metrics report path (e.g., data/metrics/6-annotate.json, leave empty to disable): ").strip()
+    METRICS.script = '3-gpt-assistant-annotate'
+
+    try:
+        if mode == 'batch-prepare':
+            batch_file_path = input("Enter the batch request file path (e.g., data/6-gpt-batch-requests.jsonl): ")
+            prepare_batch_requests(combined_df, processed_keys, batch_file_path)
+            return
+        if mode == 'batch-ingest':
+            results_file_path = input("Enter the batch results file path: ")
+            ingest_batch_results(combined_df, processed_keys, journal, results_file_path, output_file_path, cache, backends or single_backend(api_key))
+            return
+
+        coalesce = input("Send one request per paper for all of its processes? (yes/no) [no]: ").strip().lower() in ['yes', 'y']
+        token_budget = read_int("Enter the maximum input tokens per request, to split long articles into chunks (leave empty to send whole articles): ", None)
+
+        if mode == 'concurrent':
+            max_in_flight = read_int("Enter the maximum number of requests in flight [8]: ", 8)
+            requests_per_minute = tokens_per_minute = None
+            if backends is None:
+                # A backends file sets the limits of every backend itself
+                requests_per_minute = read_int("Enter the requests-per-minute limit [500]: ", 500)
+                tokens_per_minute = read_int("Enter the tokens-per-minute limit [300000]: ", 300000)
+            run_concurrent_extraction(api_key, combined_df, processed_keys, journal, output_file_path, max_in_flight, requests_per_minute, tokens_per_minute, coalesce, cache, token_budget, backends)
+            return
+        if coalesce:
+            # Coalesced requests one paper at a time, without rate limits
+            run_concurrent_extraction(api_key, combined_df, processed_keys, journal, output_file_path, 1, None, None, coalesce, cache, token_budget, backends)
+            return
+
+        with METRICS.stage('extraction') as stage:
+            stage.rows = extract_sequentially(backends or single_backend(api_key), combined_df, processed_keys, journal, output_file_path, cache, token_budget)
+    finally:
+        journal.close()
+        if cache is not None:
+            stats = cache.stats()
+            print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses this run; {stats['entries']} entries ({stats['bytes']} bytes) stored.")
+            cache.close()
+        if metrics_path:
+            METRICS.write(metrics_path)
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,23 @@
 import pandas as pd
-import json
-from orkg import ORKG, OID
+from orkg import OID
 import getpass  # Import getpass module for secure password input
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from upload_log import UploadLog, new_run_id
+from contribution_sync import StatementPatch, content_hash, contribution_tree, diff_trees, fetch_tree, linked_ids, retire_contribution
+from resource_rollback import contribution_statements, rewrite_csv
+from columnar_store import as_profile, read_annotations, read_table
+from contribution_builder import compile_plan, build_payloads, instantiate_contribution
+from label_resolver import LabelResolver
+from run_metrics import METRICS, instrument_orkg
+from http_client import orkg_client
+from template_cache import MODES as TEMPLATE_CACHE_MODES, materialize_template
+
+RECORD_COLUMNS = ['process_id', 'process_material', 'process_reactanta', 'process_reactantb', 'process_reactantc', 'process_reactantd', 'reference_doi', 'contribution id', 'paper title', 'paper id', 'unused_reactants']
 
 def read_mapping(file_path):
-    mapping_df = pd.read_csv(file_path)
+    mapping_df = read_table(file_path, columns=['Name', 'ORKG Resource ID'])
     return {row['Name']: row['ORKG Resource ID'] for index, row in mapping_df.iterrows()}
 
 def get_valid_param(param_dict, key):
@@ -67,6 +79,27 @@ def create_contribution(data, contribution_id, template, reactant_mapping, mater
     
     return instance, additional_reactants
 
+def prepare_payloads(template, data, schema_path, reactant_mapping, material_mapping, output_file_path):
+    """ Compile the extraction schema and build the contributions of all rows in one pass; writes a per-row build report. """
+    with METRICS.stage('build contributions', rows=len(data)):
+        plan = compile_plan(schema_path, template)
+        if plan['unmapped']:
+            print(f"Schema fields without a matching template field (not uploaded): {', '.join(plan['unmapped'])}")
+        payloads, report = build_payloads(data, plan, reactant_mapping, material_mapping)
+    report_path = os.path.splitext(output_file_path)[0] + '-build-report.csv'
+    report.to_csv(report_path, index_label='row')
+    print(f"{len(payloads)} contributions built, {len(data) - len(payloads)} rejected (see {report_path}).")
+    for index, row in report[report['status'] == 'rejected'].iterrows():
+        print(f"Rejected row {index} (process {row['process_id']}, DOI {row['reference_doi']}): {row['reasons']}")
+    return plan, payloads
+
+def contribution_for_row(index, row, contribution_id, template, reactant_mapping, material_mapping, plan=None, payloads=None):
+    # Without a compiled plan the contribution is created from the row's JSON with the built-in property lists
+    if plan is None:
+        return create_contribution(as_profile(row['extracted_info']), contribution_id, template, reactant_mapping, material_mapping)
+    payload, additional_reactants = payloads[index]
+    return instantiate_contribution(template, plan, payload, contribution_id), additional_reactants
+
 def append_record_to_csv(record, additional_reactants, output_file_path):
     # If additional reactants exist, convert them to a string
     if additional_reactants:
@@ -96,103 +129,410 @@ def load_paper_contributions(output_file_path):
     paper_contributions = {}
     if os.path.exists(output_file_path):
         existing_df = pd.read_csv(output_file_path)
-        # Directly use the last contribution id encountered for each paper id in the output file
+        # Use the highest contribution id recorded for each paper id (concurrent uploads may record them out of order)
         for _, row in existing_df.iterrows():
-            paper_contributions[row['paper id']] = row['contribution id']
+            paper_contributions[row['paper id']] = max(paper_contributions.get(row['paper id'], 0), int(row['contribution id']))
     return paper_contributions
 
 
-def main(file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path):
+def upload_key(row):
+    # Rows are identified by their process and paper, not by their position in the input file
+    return f"{row['process_id']}|{row['reference_doi']}"
+
+def load_recorded_keys(output_file_path):
+    """ Keys of the rows already recorded in the output CSV (also covers runs made before the upload log existed). """
+    if not os.path.exists(output_file_path):
+        return set()
+    existing_df = pd.read_csv(output_file_path)
+    return {upload_key(row) for _, row in existing_df.iterrows()}
+
+def build_record(row, contribution_id, paper_id, additional_reactants):
+    record = {
+        "process_id": row.get('process_id', ''),
+        "process_material": row.get('process_material', ''),
+        "process_reactanta": row.get('process_reactanta', ''),
+        "process_reactantb": row.get('process_reactantb', ''),
+        "process_reactantc": row.get('process_reactantc', ''),
+        "process_reactantd": row.get('process_reactantd', ''),
+        "reference_doi": row.get('reference_doi', ''),
+        "contribution id": contribution_id,
+        "paper title": row['paper_title'],
+        "paper id": paper_id,
+        "unused_reactants": ', '.join([str(reactant) for reactant in additional_reactants]),
+    }
+    return record
+
+def upload_paper(orkg, template, paper_id, rows, first_contribution_id, reactant_mapping, material_mapping, output_file_path, upload_log, run_id, record_lock, plan=None, payloads=None, on_upload=None):
+    """ Upload the contributions of one paper in input order; returns the number uploaded. on_upload(row, contribution_id) is called after each. """
+    contribution_id = first_contribution_id
+    uploaded = 0
+    for index, row in rows:
+        key = upload_key(row)
+        try:
+            contribution, additional_reactants = contribution_for_row(index, row, contribution_id, template, reactant_mapping, material_mapping, plan, payloads)
+            paper_data = {
+                "predicates": [],
+                "paper": {
+                    "title": row['paper_title'],
+                    "researchField": "R254",
+                    "contributions": [contribution.template_dict['resource']]
+                }
+            }
+            paper_response = orkg.papers.add(params=paper_data, merge_if_exists=True)
+        except Exception as e:
+            print(f"Failed to upload process {row['process_id']} to Paper ID {paper_id}: {e}")
+            upload_log.record(run_id=run_id, key=key, paper_id=paper_id, status='failed', error=str(e))
+            continue
+
+        if not str(paper_response.status_code).startswith('2'):
+            print(f"Failed to upload process {row['process_id']} to Paper ID {paper_id}: {paper_response.content}")
+            upload_log.record(run_id=run_id, key=key, paper_id=paper_id, status='failed', error=str(paper_response.content))
+            continue
+
+        upload_log.record(
+            run_id=run_id, key=key, paper_id=paper_id, contribution_id=contribution_id,
+            contribution_label=f"Contribution {contribution_id}", status='uploaded',
+            material_id=material_mapping.get(row.get('process_material', '')),
+        )
+        with record_lock:
+            pd.DataFrame([build_record(row, contribution_id, paper_id, additional_reactants)], columns=RECORD_COLUMNS).to_csv(
+                output_file_path, mode='a', header=not os.path.exists(output_file_path), index=False
+            )
+        print(f"Contribution {contribution_id} added to Paper ID {paper_id}.")
+        if on_upload is not None:
+            on_upload(row, contribution_id)
+        contribution_id += 1
+        uploaded += 1
+    return uploaded
+
+def upload_concurrently(orkg, template, data, reactant_mapping, material_mapping, output_file_path, upload_log_path, workers, plan=None, payloads=None):
+    """
+    Upload contributions with several papers in flight at once. Contributions of the same paper are
+    uploaded one after another, in input order, so merge_if_exists never races against itself.
+    """
+    upload_log = UploadLog(upload_log_path)
+    run_id = new_run_id()
+    print(f"Upload run ID: {run_id}")
+
+    done_keys = upload_log.completed_keys() | load_recorded_keys(output_file_path)
+    last_ids = load_paper_contributions(output_file_path)
+    for paper_id, last_id in upload_log.last_contribution_ids().items():
+        last_ids[paper_id] = max(last_ids.get(paper_id, 0), last_id)
+
+    papers = {}
+    seen_keys = set(done_keys)
+    for index, row in data.iterrows():
+        key = upload_key(row)
+        if key in seen_keys:
+            continue  # already uploaded, or a duplicate row of the same process
+        seen_keys.add(key)
+        if pd.isna(row['paper_id']):
+            print(f"Skipping process {row['process_id']}: no ORKG paper for DOI {row['reference_doi']}")
+            continue
+        if payloads is not None and index not in payloads:
+            continue  # rejected by the contribution builder, see the build report
+        papers.setdefault(row['paper_id'], []).append((index, row))
+    print(f"{len(done_keys)} contributions already uploaded; {sum(len(rows) for rows in papers.values())} to upload for {len(papers)} papers with {workers} workers.")
+
+    to_upload = sum(len(rows) for rows in papers.values())
+    record_lock = threading.Lock()
+    uploaded = 0
+    try:
+        with METRICS.stage('upload') as stage, ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(upload_paper, orkg, template, paper_id, rows, last_ids.get(paper_id, 0) + 1,
+                                reactant_mapping, material_mapping, output_file_path, upload_log, run_id, record_lock, plan, payloads)
+                for paper_id, rows in papers.items()
+            ]
+            for future in as_completed(futures):
+                uploaded += future.result()
+                stage.rows = uploaded
+    finally:
+        upload_log.close()
+    print(f"Run {run_id} uploaded {uploaded} contributions.")
+    return to_upload - uploaded
+
+def sync_entry(run_id, key, paper_id, contribution_id, resource_id, tree):
+    return dict(run_id=run_id, key=key, paper_id=paper_id, contribution_id=int(contribution_id),
+                contribution_label=f"Contribution {contribution_id}", resource_id=resource_id,
+                content_hash=content_hash(tree), tree=tree, status='synced')
+
+def adopt_uploads(orkg, sync_log, run_id, uploads, current, workers):
+    """
+    Record contributions that were uploaded without the sync log (by the other modes, or before it was
+    kept): they are found in ORKG by their label, and those whose rows are still in the annotations are
+    read back, so that the first sync compares against what is actually stored.
+    Returns the recorded entries by key, and the keys whose label is ambiguous (left alone).
+    """
+    papers = {}
+    for key, (paper_id, contribution_id) in uploads.items():
+        papers.setdefault(paper_id, []).append((key, contribution_id))
+
+    def adopt(item):
+        paper_id, contributions = item
+        by_label = contribution_statements(orkg, paper_id)
+        adopted, ambiguous = {}, set()
+        for key, contribution_id in contributions:
+            matches = by_label.get(f"Contribution {contribution_id}", [])
+            if len(matches) > 1:
+                print(f"Paper {paper_id} has {len(matches)} contributions labelled 'Contribution {contribution_id}', not synced")
+                ambiguous.add(key)
+            elif not matches:
+                print(f"Contribution {contribution_id} of paper {paper_id} is not in ORKG, it is uploaded again")
+            else:
+                resource_id = matches[0]['object']['id']
+                tree = fetch_tree(orkg, resource_id, current[key][2]) if key in current else {}
+                adopted[key] = sync_log.record(**sync_entry(run_id, key, paper_id, contribution_id, resource_id, tree))
+        return adopted, ambiguous
+
+    adopted, ambiguous = {}, set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for paper_adopted, paper_ambiguous in executor.map(adopt, papers.items()):
+            adopted.update(paper_adopted)
+            ambiguous |= paper_ambiguous
+    return adopted, ambiguous
+
+def sync_contributions(orkg, template, data, reactant_mapping, material_mapping, output_file_path, upload_log_path, sync_log_path, workers, plan=None, payloads=None, dry_run=False):
+    """
+    Delta sync with ORKG. The sync log keeps, per row key, the ORKG resource ID of the row's contribution
+    and the content hash and content of what was uploaded. Every contribution is built locally and its
+    hash compared: new rows are uploaded, contributions whose content changed get only the changed
+    statements replaced, and contributions whose rows are gone from the annotations are retired (deleted
+    from ORKG and the records). Rows rejected by the contribution builder are left as they are.
+    Returns the number of contributions that could not be synced.
+    """
+    sync_log = UploadLog(sync_log_path)
+    upload_log = UploadLog(upload_log_path)
+    run_id = new_run_id()
+    print(f"Sync run ID: {run_id}")
+    try:
+        present, current = set(), {}
+        for index, row in data.iterrows():
+            key = upload_key(row)
+            present.add(key)
+            if key in current or pd.isna(row['paper_id']) or (payloads is not None and index not in payloads):
+                continue
+            contribution, _ = contribution_for_row(index, row, 0, template, reactant_mapping, material_mapping, plan, payloads)
+            current[key] = (index, row, contribution_tree(contribution.template_dict['resource']['values']))
+
+        synced = {key: entry for key, entry in sync_log.latest_entries().items() if entry.get('status') == 'synced'}
+        uploads = {key: (entry['paper_id'], int(entry['contribution_id']))
+                   for key, entry in upload_log.latest_entries().items() if entry.get('status') == 'uploaded'}
+        if os.path.exists(output_file_path):
+            for _, record in pd.read_csv(output_file_path).iterrows():
+                uploads.setdefault(upload_key(record), (record['paper id'], int(record['contribution id'])))
+        to_adopt = {key: upload for key, upload in uploads.items() if key not in synced}
+        ambiguous = set()
+        if to_adopt and not dry_run:
+            print(f"Looking up {len(to_adopt)} contributions uploaded without the sync log in ORKG")
+            adopted, ambiguous = adopt_uploads(orkg, sync_log, run_id, to_adopt, current, workers)
+            synced.update(adopted)
+
+        to_create = [key for key in current if key not in synced and key not in ambiguous]
+        to_update, to_replace = {}, []
+        for key, (_, _, tree) in current.items():
+            if key in synced and synced[key]['content_hash'] != content_hash(tree):
+                changes = diff_trees(synced[key]['tree'], tree)
+                if changes is None:
+                    to_replace.append(key)
+                else:
+                    to_update[key] = changes
+        to_retire = [key for key in synced if key not in present]
+        unchanged = len(current) - len(to_create) - len(to_update) - len(to_replace)
+        print(f"{unchanged} contributions unchanged, {len(to_create)} to create, {len(to_update)} to update, "
+              f"{len(to_replace)} to replace and {len(to_retire)} to retire"
+              + (f"; {len(to_adopt)} uploads not in the sync log yet" if dry_run and to_adopt else '') + '.')
+        if dry_run:
+            return 0
+
+        failed = 0
+        protected = set(reactant_mapping.values()) | set(material_mapping.values())
+        with METRICS.stage('sync', rows=0) as stage, ThreadPoolExecutor(max_workers=workers) as executor:
+            def retire(key):
+                entry = synced[key]
+                kept = retire_contribution(orkg, entry['resource_id'], protected | linked_ids(entry['tree']))
+                for thing_id, status in kept.items():
+                    print(f"Not deleted: {thing_id} ({status})")
+                if entry['resource_id'] in kept:
+                    return None
+                sync_log.record(run_id=run_id, key=key, paper_id=entry['paper_id'], contribution_id=entry['contribution_id'],
+                                resource_id=entry['resource_id'], status='retired')
+                upload_log.record(run_id=run_id, key=key, paper_id=entry['paper_id'], status='retired')
+                print(f"Contribution {entry['resource_id']} retired.")
+                return entry
+
+            retired = [entry for entry in executor.map(retire, to_retire + to_replace) if entry is not None]
+            failed += len(to_retire) + len(to_replace) - len(retired)
+            retired_contributions = {(str(entry['paper_id']), int(entry['contribution_id'])) for entry in retired}
+            if retired_contributions:
+                rewrite_csv(output_file_path, lambda row: (str(row['paper id']), int(row['contribution id'])) not in retired_contributions)
+
+            def update(key):
+                entry = synced[key]
+                try:
+                    changed = StatementPatch(orkg, entry['resource_id']).apply(to_update[key])
+                except Exception as e:
+                    print(f"Failed to update contribution {entry['resource_id']} of process {key}: {e}")
+                    return False
+                sync_log.record(**sync_entry(run_id, key, entry['paper_id'], entry['contribution_id'], entry['resource_id'], current[key][2]))
+                print(f"Contribution {entry['resource_id']} updated, {changed} statements changed.")
+                return True
+
+            updated = sum(executor.map(update, to_update))
+            failed += len(to_update) - updated
+
+            # Replaced contributions are uploaded again once the old one is gone; numbers are never reused
+            last_ids = load_paper_contributions(output_file_path)
+            for entry in upload_log.entries + sync_log.entries:
+                if entry.get('paper_id') is not None and entry.get('contribution_id') is not None:
+                    last_ids[entry['paper_id']] = max(last_ids.get(entry['paper_id'], 0), int(entry['contribution_id']))
+            replaced = {entry['key'] for entry in retired}
+            papers = {}
+            for key in to_create + [key for key in to_replace if key in replaced]:
+                index, row, _ = current[key]
+                papers.setdefault(row['paper_id'], []).append((index, row))
+            record_lock = threading.Lock()
+
+            def create(item):
+                paper_id, rows = item
+                uploaded = []
+                upload_paper(orkg, template, paper_id, rows, last_ids.get(paper_id, 0) + 1, reactant_mapping, material_mapping,
+                             output_file_path, upload_log, run_id, record_lock, plan, payloads,
+                             on_upload=lambda row, contribution_id: uploaded.append((upload_key(row), contribution_id)))
+                if uploaded:
+                    # Resource IDs not found here are looked up by label on the next sync
+                    by_label = contribution_statements(orkg, paper_id)
+                    for key, contribution_id in uploaded:
+                        matches = by_label.get(f"Contribution {contribution_id}", [])
+                        if len(matches) == 1:
+                            sync_log.record(**sync_entry(run_id, key, paper_id, contribution_id, matches[0]['object']['id'], current[key][2]))
+                return len(rows) - len(uploaded)
+
+            failed += sum(executor.map(create, papers.items()))
+            stage.rows = len(retired) + updated + sum(len(rows) for rows in papers.values())
+        print(f"Sync run {run_id} finished: {len(retired)} contributions retired, {updated} updated, "
+              f"{sum(len(rows) for rows in papers.values())} uploaded, {failed} not synced.")
+        return failed
+    finally:
+        sync_log.close()
+        upload_log.close()
+
+def main(file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path, mode='sequential', upload_log_path=None, workers=8, schema_path=None, resolver_path=None, fuzzy_cutoff=None, metrics_path=None, sync_log_path=None, dry_run=False, template_cache_path=None, template_cache_mode='check'):
+    try:
+        return upload_contributions(file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path, mode, upload_log_path, workers, schema_path, resolver_path, fuzzy_cutoff, sync_log_path, dry_run, template_cache_path, template_cache_mode)
+    finally:
+        if metrics_path:
+            METRICS.write(metrics_path)
+
+def upload_contributions(file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path, mode='sequential', upload_log_path=None, workers=8, schema_path=None, resolver_path=None, fuzzy_cutoff=None, sync_log_path=None, dry_run=False, template_cache_path=None, template_cache_mode='check'):
     # Initialize ORKG client with user inputs
-    orkg = ORKG(host=orkg_host, creds=(orkg_email, orkg_password))
+    orkg = orkg_client(orkg_host, creds=(orkg_email, orkg_password), pool_size=max(workers, 10))
+    instrument_orkg(orkg, METRICS)
     
-    # Materialize the specified template
-    orkg.templates.materialize_template(template_resource_id)
+    # Materialize the specified template, from the template cache if one is given
+    materialize_template(orkg, template_resource_id, template_cache_path, template_cache_mode)
 
     template = orkg.templates
     
     # Read CSV file and mappings
-    data = pd.read_csv(file_path)
+    data = read_annotations(file_path)
     reactant_mapping = read_mapping(reactant_mapping_path)
     material_mapping = read_mapping(material_mapping_path)
-    processed_indices = load_processed_indices(output_file_path)
-    paper_contributions = load_paper_contributions(output_file_path)
-    
-    # Track contributions per paper
-    paper_contributions = {}
+    if resolver_path:
+        # Labels missing from the mapping files are resolved through the shared label index
+        resolver = LabelResolver(resolver_path, fuzzy_cutoff)
+        reactant_mapping = resolver.mapping(reactant_mapping)
+        material_mapping = resolver.mapping(material_mapping)
+        resolver.close()
+    plan, payloads = None, None
+    if schema_path:
+        plan, payloads = prepare_payloads(template, data, schema_path, reactant_mapping, material_mapping, output_file_path)
+    if mode == 'concurrent':
+        # The number of contributions left to upload, e.g. for the pipeline runner
+        return upload_concurrently(orkg, template, data, reactant_mapping, material_mapping, output_file_path, upload_log_path, workers, plan, payloads)
+    if mode == 'sync':
+        # The number of contributions that could not be synced
+        return sync_contributions(orkg, template, data, reactant_mapping, material_mapping, output_file_path, upload_log_path, sync_log_path, workers, plan, payloads, dry_run)
+
+    with METRICS.stage('upload', rows=0) as stage:
+        processed_indices = load_processed_indices(output_file_path)
+        # Track contributions per paper, continuing the numbering of earlier runs
+        paper_contributions = load_paper_contributions(output_file_path)
     
-    ask_for_confirmation = True
+        ask_for_confirmation = True
 
-    for index, row in data.iterrows():
-        if index + 1 in processed_indices:
-            print(f"skipped {row}")
-            continue  # Skip this row as it has already been processed
-
-        paper_id = row['paper_id']
-        print(paper_id)
-        if paper_id not in paper_contributions:
-            paper_contributions[paper_id] = 0
-
-        contribution_id = paper_contributions[paper_id] + 1
-        paper_contributions[paper_id] = contribution_id
-
-        extracted_info = json.loads(row['extracted_info'])
-
-        # Ask user for confirmation only if the flag is True
-        if ask_for_confirmation:
-            confirmation = input(f"Do you want to save Contribution {contribution_id} for Paper ID {paper_id}? (yes/no/all): ").strip().lower()
-
-            if confirmation in ['no', 'n']:
-                print("Exiting workflow as requested.")
-                return  # Exit the entire workflow
-            elif confirmation == 'all':
-                print("Automatically saving all remaining contributions.")
-                ask_for_confirmation = False  # Set the flag to False to stop asking for confirmation
-            elif confirmation not in ['yes', 'y', 'all']:
-                print(f"Skipping Contribution {contribution_id} for Paper ID {paper_id}.")
+        for index, row in data.iterrows():
+            if index + 1 in processed_indices:
+                print(f"skipped {row}")
+                continue  # Skip this row as it has already been processed
+            if payloads is not None and index not in payloads:
+                print(f"Skipping process {row['process_id']}: rejected by the contribution builder")
                 continue
 
-        # Create and process the contribution if confirmation was 'yes', 'all', or not needed
-        contribution, additional_reactants = create_contribution(extracted_info, contribution_id, template, reactant_mapping, material_mapping)
-
-        # Prepare paper data and add to ORKG
-        paper_data = {
-            "predicates": [],
-            "paper": {               
-                "title": row['paper_title'],
-                "researchField": "R254",
-                "contributions": [contribution.template_dict['resource']]
-                #"contributions": contribution_resource_id
+            paper_id = row['paper_id']
+            print(paper_id)
+            if paper_id not in paper_contributions:
+                paper_contributions[paper_id] = 0
+
+            contribution_id = paper_contributions[paper_id] + 1
+            paper_contributions[paper_id] = contribution_id
+
+            # Ask user for confirmation only if the flag is True
+            if ask_for_confirmation:
+                confirmation = input(f"Do you want to save Contribution {contribution_id} for Paper ID {paper_id}? (yes/no/all): ").strip().lower()
+
+                if confirmation in ['no', 'n']:
+                    print("Exiting workflow as requested.")
+                    return  # Exit the entire workflow
+                elif confirmation == 'all':
+                    print("Automatically saving all remaining contributions.")
+                    ask_for_confirmation = False  # Set the flag to False to stop asking for confirmation
+                elif confirmation not in ['yes', 'y', 'all']:
+                    print(f"Skipping Contribution {contribution_id} for Paper ID {paper_id}.")
+                    continue
+
+            # Create and process the contribution if confirmation was 'yes', 'all', or not needed
+            contribution, additional_reactants = contribution_for_row(index, row, contribution_id, template, reactant_mapping, material_mapping, plan, payloads)
+
+            # Prepare paper data and add to ORKG
+            paper_data = {
+                "predicates": [],
+                "paper": {               
+                    "title": row['paper_title'],
+                    "researchField": "R254",
+                    "contributions": [contribution.template_dict['resource']]
+                    #"contributions": contribution_resource_id
+                }
+            }
+    
+            paper_response = orkg.papers.add(params=paper_data, merge_if_exists=True)
+            print(f"paper response {paper_response.content}")
+    
+            # Logging information for paper addition
+            print(f"Contribution added to Paper ID {paper_id}. Paper Response: {paper_response.content}")
+
+            # Process response and append record to CSV file
+            record = {
+                "process_id": row.get('process_id', ''),
+                "process_material": row.get('process_material', ''),  # Assuming this comes from the 'material' column
+                "process_reactanta": row.get('process_reactanta', ''),
+                "process_reactantb": row.get('process_reactantb', ''),
+                "process_reactantc": row.get('process_reactantc', ''),
+                "process_reactantd": row.get('process_reactantd', ''),
+                "reference_doi": row.get('reference_doi', ''),             
+                "contribution id": contribution_id,
+                "paper title": row['paper_title'],
+                "paper id": paper_id,  # Using paper_id directly from the input file
+                #"contribution resource id": contribution_resource_id  # Contribution resource ID from the response
             }
-        }
-        
-        paper_response = orkg.papers.add(params=paper_data, merge_if_exists=True)
-        print(f"paper response {paper_response.content}")
-        
-        # Logging information for paper addition
-        print(f"Contribution added to Paper ID {paper_id}. Paper Response: {paper_response.content}")
-
-        # Process response and append record to CSV file
-        record = {
-            "process_id": row.get('process_id', ''),
-            "process_material": row.get('process_material', ''),  # Assuming this comes from the 'material' column
-            "process_reactanta": row.get('process_reactanta', ''),
-            "process_reactantb": row.get('process_reactantb', ''),
-            "process_reactantc": row.get('process_reactantc', ''),
-            "process_reactantd": row.get('process_reactantd', ''),
-            "reference_doi": row.get('reference_doi', ''),             
-            "contribution id": contribution_id,
-            "paper title": row['paper_title'],
-            "paper id": paper_id,  # Using paper_id directly from the input file
-            #"contribution resource id": contribution_resource_id  # Contribution resource ID from the response
-        }
-        
-        append_record_to_csv(record, additional_reactants, output_file_path)
-
-        # Log the processed index
-        processed_indices.add(index + 1)        
-        
-    print("Data uploaded and recorded successfully.")
+    
+            append_record_to_csv(record, additional_reactants, output_file_path)
+
+            # Log the processed index
+            processed_indices.add(index + 1)        
+            stage.rows += 1
+    
+        print("Data uploaded and recorded successfully.")
 
 if __name__ == "__main__":
     orkg_host = input("Enter ORKG host URL: ")
@@ -203,5 +543,27 @@ if __name__ == "__main__":
     output_file_path = input("Enter the path for the output CSV file: ")
     reactant_mapping_path = input("Enter the path to the reactant mapping CSV file: ")
     material_mapping_path = input("Enter the path to the material mapping CSV file: ")
+    mode = input("Enter the upload mode (sequential/concurrent/sync) [sequential]: ").strip().lower() or 'sequential'
+    upload_log_path = None
+    sync_log_path = None
+    dry_run = False
+    workers = 8
+    if mode in ['concurrent', 'sync']:
+        upload_log_path = input("Enter the path for the upload log (e.g., data/7-orkg-upload-log.jsonl): ")
+        workers = int(input("Enter the number of papers to upload concurrently [8]: ").strip() or 8)
+    if mode == 'sync':
+        sync_log_path = input("Enter the path for the sync log (e.g., data/7-orkg-contribution-sync.jsonl): ")
+        dry_run = input("Dry run, only count what would change? (yes/no) [no]: ").strip().lower() in ['yes', 'y']
+    schema_path = input("Enter the path to the extraction schema to build contributions from (e.g., data/ald-schema_ver4.json), leave empty for the built-in property lists: ").strip()
+    resolver_path = input("Enter the label index file path to resolve unmatched labels (e.g., data/5-orkg-label-index.jsonl), leave empty for exact lookups: ").strip()
+    fuzzy_cutoff = None
+    if resolver_path:
+        fuzzy_cutoff = float(input("Enter the minimum similarity for fuzzy label matches (0-1), leave empty to disable: ").strip() or 0) or None
+    template_cache_path = input("Enter the template cache path (e.g., data/7-orkg-template-cache.json), leave empty to fetch the template from ORKG: ").strip()
+    template_cache_mode = 'check'
+    if template_cache_path:
+        template_cache_mode = input(f"Enter the template cache mode ({'/'.join(TEMPLATE_CACHE_MODES)}) [check]: ").strip().lower() or 'check'
+    metrics_path = input("Enter the metrics report path (e.g., data/metrics/7-upload.json, leave empty to disable): ").strip()
+    METRICS.script = '4-create-and-upload-orkg-contributions'
     
-    main(csv_file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path)
+    main(csv_file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path, mode, upload_log_path, workers, schema_path, resolver_path, fuzzy_cutoff, metrics_path, sync_log_path, dry_run, template_cache_path, template_cache_mode)
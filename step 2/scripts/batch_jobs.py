@@ -0,0 +1,77 @@
+import json
+import os
+
+# Limits of a single OpenAI batch input file
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+
+def batch_file_path(base_path, part):
+    # data/batch.jsonl -> data/batch.jsonl, data/batch-2.jsonl, data/batch-3.jsonl, ...
+    if part == 1:
+        return base_path
+    root, extension = os.path.splitext(base_path)
+    return f"{root}-{part}{extension}"
+
+
+def write_batch_requests(requests, base_path, endpoint='/v1/chat/completions', max_requests=MAX_REQUESTS_PER_FILE, max_bytes=MAX_BYTES_PER_FILE):
+    """
+    Write (custom_id, body) pairs as batch request lines, starting a new file whenever the
+    request count or size limit of a batch file would be exceeded. Returns the written file paths.
+    """
+    paths = []
+    file = None
+    count = 0
+    size = 0
+    try:
+        for custom_id, body in requests:
+            line = json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': endpoint, 'body': body}, ensure_ascii=False) + '\n'
+            encoded_size = len(line.encode('utf-8'))
+            if file is None or count >= max_requests or size + encoded_size > max_bytes:
+                if file is not None:
+                    file.close()
+                paths.append(batch_file_path(base_path, len(paths) + 1))
+                file = open(paths[-1], 'w', encoding='utf-8')
+                count = 0
+                size = 0
+            file.write(line)
+            count += 1
+            size += encoded_size
+    finally:
+        if file is not None:
+            file.close()
+    return paths
+
+
+def read_batch_results(results_path):
+    """
+    Read a batch results file into {custom_id: (content, error)}. `content` is the message
+    content of a successful chat completion, otherwise `error` describes what went wrong.
+    """
+    results = {}
+    with open(results_path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping unreadable line {line_number} in {results_path}")
+                continue
+
+            custom_id = entry.get('custom_id')
+            response = entry.get('response') or {}
+            if entry.get('error'):
+                results[custom_id] = (None, entry['error'].get('message', str(entry['error'])))
+            elif response.get('status_code') != 200:
+                body = response.get('body') or {}
+                error = (body.get('error') or {}).get('message', f"status code {response.get('status_code')}")
+                results[custom_id] = (None, error)
+            else:
+                try:
+                    content = response['body']['choices'][0]['message']['content']
+                    results[custom_id] = (content, None)
+                except (KeyError, IndexError, TypeError):
+                    results[custom_id] = (None, 'response without message content')
+    return results
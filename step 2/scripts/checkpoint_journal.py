@@ -0,0 +1,172 @@
+import io
+import json
+import os
+import time
+
+import pandas as pd
+
+# Statuses that mark a key as processed; any other status (e.g. 'lost') is processed again on the next run
+DONE_STATUSES = {'done', 'reconciled'}
+
+
+def _read_rows(data):
+    return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, na_values=[''])
+
+
+def _complete_prefix(tail):
+    """
+    The longest prefix of `tail` made of complete CSV rows, found in one pass: a row ends at a newline
+    outside quotes, and an escaped quote ("") toggles the quote state twice. A cut inside a quoted field
+    leaves the quote open, so the torn row is not part of the prefix.
+    """
+    end = 0
+    quoted = False
+    position = tail.find(b'"')
+    newline = tail.find(b'\n')
+    while newline >= 0:
+        if 0 <= position < newline:
+            quoted = not quoted
+            position = tail.find(b'"', position + 1)
+            continue
+        if not quoted:
+            end = newline + 1
+        newline = tail.find(b'\n', newline + 1)
+    return tail[:end]
+
+
+class CheckpointJournal:
+    """
+    Append-only record of processed rows. Each line is a JSON entry with the row key, a status,
+    the byte offset in the output file right after the row was written, and a timestamp.
+    Older record files with one plain key per line are read as 'done' entries without an offset.
+    The journal is compacted to the latest entry per key every time it is opened.
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.entries = {}
+        self._load()
+        self._compact()
+        self.file = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _load(self):
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                entry = None
+            if not isinstance(entry, dict) or 'key' not in entry:
+                # A legacy plain key, or the torn last line of an interrupted append
+                if line.startswith('{'):
+                    continue
+                entry = {'key': line, 'status': 'done', 'offset': None, 'timestamp': None}
+            # Later entries win; re-inserting keeps the dict in order of the latest update
+            self.entries.pop(entry['key'], None)
+            self.entries[entry['key']] = entry
+
+    def _compact(self):
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            for entry in self.entries.values():
+                file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.journal_path)
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        try:
+            directory_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(directory_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(directory_fd)
+
+    def record(self, key, status='done', offset=None, sync=True):
+        """ Append one entry and, unless `sync` is unset, fsync it before returning. """
+        entry = {'key': key, 'status': status, 'offset': offset, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+        self.entries.pop(key, None)
+        self.entries[key] = entry
+
+    def is_processed(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry['status'] in DONE_STATUSES
+
+    def processed_keys(self):
+        return {key for key, entry in self.entries.items() if entry['status'] in DONE_STATUSES}
+
+    def reconcile(self, output_file_path, key_function):
+        """
+        Bring the journal in line with the output CSV after a crash:
+        rows written to the output but never journaled are recorded as 'reconciled', and
+        journaled rows whose offset lies beyond the end of a truncated output are forgotten.
+        Returns the number of reconciled rows.
+        """
+        if not os.path.exists(output_file_path):
+            return 0
+        output_size = os.path.getsize(output_file_path)
+
+        for key, entry in list(self.entries.items()):
+            if entry['status'] in DONE_STATUSES and entry['offset'] is not None and entry['offset'] > output_size:
+                print(f"Output ends before the journaled row for key {key}; it will be processed again.")
+                self.record(key, 'lost', None)
+
+        offsets = [entry['offset'] for entry in self.entries.values() if entry['status'] in DONE_STATUSES and entry['offset'] is not None]
+        # Without any offsets (e.g. a legacy record file) the whole output has to be scanned once
+        start = max(offsets) if offsets else 0
+
+        with open(output_file_path, 'rb') as file:
+            header = file.readline()
+            if start < file.tell():
+                start = file.tell()
+            file.seek(start)
+            tail = file.read()
+        if not tail.strip():
+            return 0
+
+        complete = _complete_prefix(tail)
+        if len(complete) < len(tail):
+            # The last append was torn by the crash: cut the partial row so the next append starts on a clean line
+            print(f"Removing a partially written row from the end of {output_file_path}.")
+            with open(output_file_path, 'r+b') as file:
+                file.truncate(start + len(complete))
+                os.fsync(file.fileno())
+            output_size = start + len(complete)
+        if not complete.strip():
+            return 0
+
+        unjournaled = _read_rows(header + complete)
+
+        reconciled = 0
+        for _, row in unjournaled.iterrows():
+            key = key_function(row)
+            entry = self.entries.get(key)
+            if not self.is_processed(key):
+                self.record(key, 'reconciled', output_size, sync=False)
+                reconciled += 1
+            elif entry['offset'] is None:
+                # A key migrated from a legacy record file: give it an offset so the next run does not scan the whole output again
+                self.record(key, entry['status'], output_size, sync=False)
+        # Reconciling again after a crash gives the same entries, so one fsync for all of them is enough
+        os.fsync(self.file.fileno())
+        if reconciled:
+            print(f"Reconciled {reconciled} rows found in {output_file_path} but missing from the journal.")
+        return reconciled
+
+    def close(self):
+        self.file.close()
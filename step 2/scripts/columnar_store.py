@@ -0,0 +1,225 @@
+import json
+
+import pandas as pd
+from profile_repair import FREE_FORM_SECTIONS
+
+COLUMNAR_EXTENSIONS = ('.parquet', '.arrow', '.feather')
+PROFILE_PREFIX = 'extracted_info'
+JSON_COLUMNS_KEY = b'json_columns'
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.feather
+    except ImportError:
+        raise ImportError("Columnar files (.parquet, .arrow, .feather) need pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def is_columnar(path):
+    return str(path).lower().endswith(COLUMNAR_EXTENSIONS)
+
+
+def _escape(key):
+    # JSON pointer escaping, so keys containing '/' survive the round trip
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(part):
+    return part.replace('~1', '/').replace('~0', '~')
+
+
+def _column_path(column, prefix=PROFILE_PREFIX):
+    return [_unescape(part) for part in column[len(prefix) + 1:].split('/')]
+
+
+def flatten_profile(profile, prefix=PROFILE_PREFIX):
+    """
+    Flatten a nested extracted_info dict into {'extracted_info/film_properties/material': value, ...}.
+    The free-form sections (extra_properties, presence_checks) have different keys in every profile,
+    so each is kept whole as one JSON string column instead of one mostly empty column per key.
+    """
+    flat = {}
+    for key, value in profile.items():
+        column = f"{prefix}/{_escape(key)}"
+        if prefix == PROFILE_PREFIX and key in FREE_FORM_SECTIONS:
+            flat[column] = json.dumps(value, ensure_ascii=False)
+        elif isinstance(value, dict) and value:
+            flat.update(flatten_profile(value, column))
+        else:
+            flat[column] = value
+    return flat
+
+
+def annotations_to_columnar(annotations_df):
+    """
+    Replace the extracted_info JSON strings of the annotations with one typed column per field.
+    Rows without a valid JSON profile (e.g. '-' for papers without full text) keep their raw value
+    in the 'extracted_info' column; it is null for all other rows.
+    """
+    profiles = []
+    raw_values = []
+    for value in annotations_df['extracted_info']:
+        try:
+            profile = json.loads(value) if isinstance(value, str) else None
+        except json.JSONDecodeError:
+            profile = None
+        if isinstance(profile, dict):
+            profiles.append(flatten_profile(profile))
+            raw_values.append(None)
+        else:
+            profiles.append({})
+            raw_values.append(value)
+
+    flat_df = pd.DataFrame(profiles, index=annotations_df.index)
+    table_df = annotations_df.drop(columns=['extracted_info']).copy()
+    table_df['extracted_info'] = pd.Series(raw_values, index=annotations_df.index, dtype=object)
+    return pd.concat([table_df, flat_df], axis=1)
+
+
+def _profiles_from_arrow(table, profile_columns):
+    """ Build the extracted_info dicts column by column, visiting only the non-null cells of each column. """
+    _require_pyarrow()
+    import pyarrow.compute as pc
+    profiles = [{} for _ in range(table.num_rows)]
+    for column in profile_columns:
+        values = table.column(column)
+        if values.null_count == values.length():
+            continue
+        *parents, leaf = _column_path(column)
+        positions = pc.indices_nonzero(pc.is_valid(values))
+        for position, value in zip(positions.to_pylist(), values.take(positions).to_pylist()):
+            node = profiles[position]
+            for part in parents:
+                node = node.setdefault(part, {})
+            node[leaf] = value
+    return profiles
+
+
+def _to_arrow(df):
+    """ Convert a DataFrame to an Arrow table; columns with mixed value types are stored as JSON strings. """
+    pa = _require_pyarrow()
+    arrays = []
+    json_columns = []
+    for column in df.columns:
+        values = [None if not isinstance(value, (list, dict)) and pd.isna(value) else value for value in df[column]]
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if value is None else json.dumps(value, ensure_ascii=False) for value in values], pa.string()))
+            json_columns.append(column)
+    table = pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+    return table.replace_schema_metadata({JSON_COLUMNS_KEY: json.dumps(json_columns).encode('utf-8')})
+
+
+def _from_arrow(table):
+    pa = _require_pyarrow()
+    metadata = table.schema.metadata or {}
+    json_columns = set(json.loads(metadata.get(JSON_COLUMNS_KEY, b'[]')))
+    # Nested Arrow values would come back as numpy arrays; convert only those columns to Python lists
+    nested_columns = [field.name for field in table.schema if pa.types.is_nested(field.type)]
+    df = table.drop_columns(nested_columns).to_pandas()
+    for column in nested_columns:
+        df[column] = table.column(column).to_pylist()
+    df = df[table.column_names]
+    for column in json_columns & set(df.columns):
+        df[column] = [json.loads(value) if isinstance(value, str) else None for value in df[column]]
+    return df
+
+
+def write_table(df, path):
+    """ Write a pipeline artifact; the format follows the extension (.parquet, .arrow/.feather, otherwise CSV). """
+    if not is_columnar(path):
+        df.to_csv(path, index=False)
+        return
+    pa = _require_pyarrow()
+    table = _to_arrow(df)
+    if str(path).lower().endswith('.parquet'):
+        pa.parquet.write_table(table, path)
+    else:
+        # Uncompressed Arrow IPC files can be memory-mapped without copying
+        pa.feather.write_feather(table, path, compression='uncompressed')
+
+
+def read_table(path, columns=None):
+    """ Read a pipeline artifact written by write_table (or any CSV), optionally only some columns. """
+    if not is_columnar(path):
+        return pd.read_csv(path, usecols=columns)
+    pa = _require_pyarrow()
+    if str(path).lower().endswith('.parquet'):
+        table = pa.parquet.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = pa.feather.read_table(path, columns=columns, memory_map=True)
+    return _from_arrow(table)
+
+
+def table_columns(path):
+    """ The column names of a pipeline artifact, without reading its rows. """
+    if not is_columnar(path):
+        return list(pd.read_csv(path, nrows=0).columns)
+    pa = _require_pyarrow()
+    if str(path).lower().endswith('.parquet'):
+        return pa.parquet.read_schema(path).names
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def read_annotations(path):
+    """ Read the GPT annotations; 'extracted_info' holds dicts for columnar files and JSON strings for CSV. """
+    if not is_columnar(path):
+        return read_table(path)
+    pa = _require_pyarrow()
+    if str(path).lower().endswith('.parquet'):
+        table = pa.parquet.read_table(path, memory_map=True)
+    else:
+        table = pa.feather.read_table(path, memory_map=True)
+    profile_columns = [column for column in table.column_names if column.startswith(PROFILE_PREFIX + '/')]
+    json_columns = set(json.loads((table.schema.metadata or {}).get(JSON_COLUMNS_KEY, b'[]')))
+    profiles = _profiles_from_arrow(table, profile_columns)
+    free_form_columns = {f"{PROFILE_PREFIX}/{section}" for section in FREE_FORM_SECTIONS}
+    for profile_column in (json_columns | free_form_columns) & set(profile_columns):
+        _decode_json_fields(profiles, _column_path(profile_column))
+
+    annotations_df = _from_arrow(table.drop_columns(profile_columns))
+    raw_values = annotations_df['extracted_info'] if 'extracted_info' in annotations_df.columns else [None] * len(annotations_df)
+    annotations_df['extracted_info'] = [
+        raw if isinstance(raw, str) else profile
+        for raw, profile in zip(raw_values, profiles)
+    ]
+    return annotations_df
+
+
+def _decode_json_fields(profiles, path):
+    # Mixed-type fields were stored as JSON strings by _to_arrow, the free-form sections by flatten_profile
+    *parents, leaf = path
+    for profile in profiles:
+        node = profile
+        for part in parents:
+            node = node.get(part, {})
+        if isinstance(node.get(leaf), str):
+            node[leaf] = json.loads(node[leaf])
+
+
+def as_profile(extracted_info):
+    """ The extracted_info of an annotation row as a dict, whether it was read from CSV or a columnar file. """
+    if isinstance(extracted_info, dict):
+        return extracted_info
+    return json.loads(extracted_info)
+
+
+def convert_artifact(input_path, output_path):
+    """ Convert a pipeline artifact between CSV and the columnar formats. """
+    df = read_table(input_path)
+    annotations = 'extracted_info' in df.columns
+    if annotations and is_columnar(input_path) and not is_columnar(output_path):
+        df = read_annotations(input_path)
+        df['extracted_info'] = [
+            json.dumps(value, indent=4, ensure_ascii=False) if isinstance(value, dict) else value
+            for value in df['extracted_info']
+        ]
+    elif annotations and not is_columnar(input_path) and is_columnar(output_path):
+        df = annotations_to_columnar(df)
+    write_table(df, output_path)
+    return len(df)
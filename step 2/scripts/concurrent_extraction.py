@@ -0,0 +1,78 @@
+import asyncio
+import os
+
+
+def append_rows_durably(output_df, output_file_path):
+    """
+    Append rows to a CSV file and fsync, writing the header only for a new or empty file.
+    Returns the byte offset of the end of the file after the write.
+    """
+    write_header = not os.path.exists(output_file_path) or os.path.getsize(output_file_path) == 0
+    with open(output_file_path, 'a', newline='', encoding='utf-8') as file:
+        output_df.to_csv(file, header=write_header, index=False)
+        file.flush()
+        os.fsync(file.fileno())
+        return os.fstat(file.fileno()).st_size
+
+
+class OrderedOutputWriter:
+    """
+    Collects results that complete out of order and writes them in submission order.
+    A key is only handed to `on_written` (with the output offset after its row) once the row is on disk, so a crash
+    can at worst repeat a request but never lose or reorder an output row.
+    """
+
+    def __init__(self, output_file_path, on_written):
+        self.output_file_path = output_file_path
+        self.on_written = on_written
+        self.next_sequence = 0
+        self.completed = {}
+        self.written = 0
+
+    def write(self, unique_key, output_df):
+        offset = append_rows_durably(output_df, self.output_file_path)
+        self.on_written(unique_key, offset)
+
+    async def submit(self, sequence, result):
+        # result is a list of (unique_key, output_df) pairs, or None when the request failed and should be retried on a later run
+        self.completed[sequence] = result
+        # The writes and their fsyncs run in a worker thread so that the event loop keeps serving the requests in flight.
+        # Only the submit that took the next sequence writes: the others find it gone until it is written
+        while self.next_sequence in self.completed:
+            ready = self.completed.pop(self.next_sequence)
+            for unique_key, output_df in ready or []:
+                await asyncio.get_running_loop().run_in_executor(None, self.write, unique_key, output_df)
+                self.written += 1
+            self.next_sequence += 1
+
+
+async def run_concurrently(items, worker, writer, max_in_flight, fatal=()):
+    """
+    Run `worker` over `items` with at most `max_in_flight` calls awaiting at once. An exception of a type in `fatal`
+    is not a failure of its item: no further items are started, and it is raised once the calls in flight are done.
+    """
+    queue = asyncio.Queue()
+    for sequence, item in enumerate(items):
+        queue.put_nowait((sequence, item))
+    stopped = []
+
+    async def consume():
+        while not stopped:
+            try:
+                sequence, item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                result = await worker(item)
+            except fatal as e:
+                stopped.append(e)
+                return
+            except Exception as e:
+                print(f"Request {sequence} failed and will be retried on the next run: {e}")
+                result = None
+            await writer.submit(sequence, result)
+
+    await asyncio.gather(*(consume() for _ in range(max(1, max_in_flight))))
+    if stopped:
+        raise stopped[0]
+    return writer.written
@@ -0,0 +1,238 @@
+import inspect
+import json
+import re
+
+import pandas as pd
+from orkg import OID
+
+from columnar_store import PROFILE_PREFIX
+
+# Schema sections that are uploaded as nested templates: section -> (parameter of the profile template, template function)
+SECTION_SLOTS = {
+    'process_parameters': ('process_parameter', 'ald_process_parameters'),
+    'film_properties': ('film_property', 'ald_film_properties'),
+    'process_characteristics': ('process_characteristic', 'ald_process_characteristics'),
+}
+PROFILE_FUNCTION = 'comprehensive_ald_profile'
+# Fields whose values are linked to ORKG resources instead of being uploaded as literals
+REACTANTS_FIELD = ('process_parameters', 'reactants', 'reactant')
+MATERIAL_FIELD = ('film_properties', 'material', 'material')
+MISSING_VALUES = ['-', '']
+RESOURCE_ID_PATTERN = re.compile(r'^R\d+$')
+
+
+def template_parameters(template, function_name):
+    """ Names of the fields a materialized template function accepts, or None if it accepts any keyword. """
+    # Looked up statically: attribute access on the ORKG client returns a logging wrapper taking (*args, **kwargs)
+    function = inspect.getattr_static(template, function_name)
+    parameters = inspect.signature(function).parameters.values()
+    if any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters):
+        return None
+    return {parameter.name for parameter in parameters} - {'self', 'label'}
+
+
+def _accepts(accepted, name):
+    return accepted is None or name in accepted
+
+
+def compile_plan(schema_path, template):
+    """
+    Compile the extraction schema against the materialized templates once.
+    Every schema field that the matching template function accepts becomes a column of the plan;
+    the others (e.g. the free-form extra_properties) are listed as unmapped.
+    """
+    with open(schema_path, 'r', encoding='utf-8') as file:
+        schema = json.load(file)
+    if isinstance(schema, list):
+        schema = schema[0]
+
+    profile_accepts = template_parameters(template, PROFILE_FUNCTION)
+    plan = {'sections': {}, 'fields': {}, 'unmapped': []}
+    for section, value in schema.items():
+        if section in SECTION_SLOTS and isinstance(value, dict):
+            slot, function_name = SECTION_SLOTS[section]
+            accepted = template_parameters(template, function_name)
+            fields = {}
+            for field in value:
+                if (section, field) in (REACTANTS_FIELD[:2], MATERIAL_FIELD[:2]):
+                    continue  # linked to resources separately
+                if _accepts(accepted, field):
+                    fields[field] = f"{PROFILE_PREFIX}/{section}/{field}"
+                else:
+                    plan['unmapped'].append(f"{section}/{field}")
+            plan['sections'][slot] = {'function': function_name, 'fields': fields}
+        elif not isinstance(value, dict) and _accepts(profile_accepts, section):
+            plan['fields'][section] = f"{PROFILE_PREFIX}/{section}"
+        else:
+            plan['unmapped'].append(section)
+    return plan
+
+
+def plan_columns(plan):
+    columns = [column for section in plan['sections'].values() for column in section['fields'].values()]
+    columns += list(plan['fields'].values())
+    for section, field, _ in (REACTANTS_FIELD, MATERIAL_FIELD):
+        columns.append(f"{PROFILE_PREFIX}/{section}/{field}")
+    return columns
+
+
+def _project(nodes, key):
+    return [node.get(key) if isinstance(node, dict) else None for node in nodes]
+
+
+def _parse_profiles(values):
+    """ The extracted_info values as dicts (None where a value is not a JSON object); the JSON strings are parsed in one call. """
+    profiles = [value if isinstance(value, dict) else None for value in values]
+    strings = [(position, value) for position, value in enumerate(values) if isinstance(value, str) and value.lstrip().startswith('{')]
+    try:
+        parsed = json.loads('[' + ','.join(value for _, value in strings) + ']')
+    except json.JSONDecodeError:
+        parsed = None
+    if parsed is None or len(parsed) != len(strings):
+        # A malformed answer spoils the whole batch, so the strings are parsed one by one instead
+        parsed = []
+        for _, value in strings:
+            try:
+                parsed.append(json.loads(value))
+            except json.JSONDecodeError:
+                parsed.append(None)
+    for (position, _), profile in zip(strings, parsed):
+        profiles[position] = profile if isinstance(profile, dict) else None
+    return profiles
+
+
+def flatten_annotations(annotations_df, columns):
+    """ The given flattened columns of the extracted fields, plus the reason for rows whose extracted_info is not a JSON object. """
+    values = annotations_df['extracted_info'].tolist()
+    profiles = _parse_profiles(values)
+    errors = {
+        index: f"extracted_info is not a JSON object: {str(value)[:40]!r}"
+        for index, value, profile in zip(annotations_df.index, values, profiles) if profile is None
+    }
+    # Built column by column, one level of the profile at a time; the section values are shared by their fields,
+    # and only the fields of the plan are looked up
+    levels = {(): profiles}
+    flat = {}
+    for column in columns:
+        path = tuple(column[len(PROFILE_PREFIX) + 1:].split('/'))
+        for depth in range(1, len(path) + 1):
+            if path[:depth] not in levels:
+                levels[path[:depth]] = _project(levels[path[:depth - 1]], path[depth - 1])
+        flat[column] = levels[path]
+    return pd.DataFrame(flat, index=annotations_df.index, columns=columns, dtype=object), errors
+
+
+def _literal_column(flat_df, column, reasons, label):
+    """ Valid literal values of a column; lists and objects where a literal is expected are reported and dropped. """
+    if column not in flat_df.columns:
+        return pd.Series(None, index=flat_df.index, dtype=object)
+    values = flat_df[column]
+    nested = values.map(lambda value: isinstance(value, (list, dict)))
+    for index in values.index[nested]:
+        reasons[index].append(f"{label} is not a literal value")
+    values = values.mask(nested)
+    return values.where(values.notna() & ~values.astype(str).str.strip().isin(MISSING_VALUES))
+
+
+def _note_resolutions(labels, mapping, kind, reasons):
+    # Labels a LabelResolver matched by their canonical form or by similarity are reported with the match
+    resolutions = getattr(mapping, 'resolutions', {})
+    for index, label in labels.items():
+        if label in resolutions:
+            matched_label, method, confidence = resolutions[label]
+            reasons[index].append(f"{kind} {label!r} matched {matched_label!r} ({method}, confidence {confidence:.2f})")
+
+
+def build_payloads(annotations_df, plan, reactant_mapping, material_mapping):
+    """
+    Apply the compiled plan to the whole annotations table.
+    Returns ({index: (payload, additional_reactants)} for the accepted rows, report DataFrame with one row per input row).
+    A payload holds the keyword arguments of every template function of the plan.
+    """
+    flat_df, errors = flatten_annotations(annotations_df, plan_columns(plan))
+    reasons = {index: [] for index in annotations_df.index}
+    rejected = set(errors)
+    for index, error in errors.items():
+        reasons[index].append(error)
+
+    # Literal fields, column by column
+    section_values = {}
+    for slot, section in plan['sections'].items():
+        section_values[slot] = {
+            field: _literal_column(flat_df, column, reasons, column[len(PROFILE_PREFIX) + 1:])
+            for field, column in section['fields'].items()
+        }
+    field_values = {
+        field: _literal_column(flat_df, column, reasons, field) for field, column in plan['fields'].items()
+    }
+
+    # Reactants: the first entry of the list holds the comma-separated reactants
+    reactants_column = f"{PROFILE_PREFIX}/{REACTANTS_FIELD[0]}/{REACTANTS_FIELD[1]}"
+    reactants = flat_df[reactants_column] if reactants_column in flat_df.columns else pd.Series(None, index=flat_df.index, dtype=object)
+    reactant_labels = reactants.map(lambda value: value[0] if isinstance(value, list) and value else value)
+    reactant_labels = reactant_labels.where(reactant_labels.map(lambda value: isinstance(value, str))).astype(object)
+    exploded = reactant_labels.str.split(',').explode().str.strip()
+    exploded = exploded[exploded.notna() & (exploded != '')]
+    reactant_ids = exploded.map(reactant_mapping)
+    for index, label in exploded[reactant_ids.isna()].items():
+        reasons[index].append(f"reactant {label!r} is not in the reactant mapping")
+    _note_resolutions(exploded[reactant_ids.notna()], reactant_mapping, 'reactant', reasons)
+    mapped_reactants = {}
+    for index, reactant_id in reactant_ids.dropna().items():
+        mapped_reactants.setdefault(index, []).append(OID(reactant_id))
+
+    # Material: linked by the material mapping, or used as is when it is not in the mapping (as the built-in
+    # property lists do), e.g. when it already is a resource ID
+    material_column = f"{PROFILE_PREFIX}/{MATERIAL_FIELD[0]}/{MATERIAL_FIELD[1]}"
+    materials = flat_df[material_column] if material_column in flat_df.columns else pd.Series(None, index=flat_df.index, dtype=object)
+    materials = materials.where(materials.map(lambda value: isinstance(value, str))).astype(object)
+    material_ids = materials.map(material_mapping)
+    is_id = materials.map(lambda value: isinstance(value, str) and bool(RESOURCE_ID_PATTERN.match(value)))
+    _note_resolutions(materials[material_ids.notna()], material_mapping, 'material', reasons)
+    present = materials.notna() & ~materials.astype(str).str.strip().isin(MISSING_VALUES)
+    for index in material_ids.index[material_ids.isna() & present & ~is_id]:
+        reasons[index].append(f"material {materials[index]!r} is not in the material mapping, linked as is")
+    for index in material_ids.index[~present]:
+        if index not in errors:
+            reasons[index].append("no material")
+    material_ids = material_ids.where(material_ids.notna(), materials.where(present))
+
+    # Assemble the keyword arguments row by row from plain per-column dicts
+    section_values = {
+        slot: {field: values.dropna().to_dict() for field, values in fields.items()}
+        for slot, fields in section_values.items()
+    }
+    field_values = {field: values.dropna().to_dict() for field, values in field_values.items()}
+    payloads = {}
+    for index in annotations_df.index:
+        if index in rejected:
+            continue
+        row_reactants = mapped_reactants.get(index, [])
+        payload = {'sections': {}, 'fields': {}}
+        for slot, fields in section_values.items():
+            payload['sections'][slot] = {field: values[index] for field, values in fields.items() if index in values}
+        payload['fields'] = {field: values[index] for field, values in field_values.items() if index in values}
+        parameters_slot = SECTION_SLOTS[REACTANTS_FIELD[0]][0]
+        if row_reactants and parameters_slot in payload['sections']:
+            payload['sections'][parameters_slot][REACTANTS_FIELD[2]] = row_reactants[0]
+        material_slot = SECTION_SLOTS[MATERIAL_FIELD[0]][0]
+        if material_slot in payload['sections'] and pd.notna(material_ids[index]):
+            payload['sections'][material_slot][MATERIAL_FIELD[2]] = OID(material_ids[index])
+        payloads[index] = (payload, row_reactants[1:])
+
+    report = pd.DataFrame({
+        'process_id': annotations_df.get('process_id'),
+        'reference_doi': annotations_df.get('reference_doi'),
+        'status': ['rejected' if index in rejected else 'accepted' for index in annotations_df.index],
+        'reasons': ['; '.join(reasons[index]) for index in annotations_df.index],
+    }, index=annotations_df.index)
+    return payloads, report
+
+
+def instantiate_contribution(template, plan, payload, contribution_id):
+    """ Turn a payload into the template instance of one contribution. """
+    sections = {
+        slot: getattr(template, section['function'])(**payload['sections'].get(slot, {}))
+        for slot, section in plan['sections'].items()
+    }
+    return getattr(template, PROFILE_FUNCTION)(label=f"Contribution {contribution_id}", **sections, **payload['fields'])
@@ -0,0 +1,181 @@
+import hashlib
+import json
+
+from resource_rollback import CONTRIBUTION_PREDICATE, DONE_STATUSES, RollbackPlan, delete_thing, list_statements
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+def contribution_tree(values):
+    """
+    The comparable content of a contribution, from the values of its template instance
+    ({predicate ID: [value]}): linked resources by ID, literals by text and nested resources as trees of
+    their own, in a canonical order. Labels are left out, so renumbering a contribution does not change it.
+    """
+    tree = {}
+    for predicate_id, objects in values.items():
+        items = []
+        for value in objects:
+            if '@id' in value:
+                items.append({'@id': str(value['@id'])})
+            elif 'text' in value:
+                items.append({'text': str(value['text'])})
+            else:
+                items.append({'values': contribution_tree(value.get('values', {}))})
+        if items:
+            tree[predicate_id] = sorted(items, key=_canonical)
+    return tree
+
+
+def content_hash(tree):
+    return hashlib.sha256(_canonical(tree).encode('utf-8')).hexdigest()
+
+
+def linked_ids(tree):
+    """ The IDs of the resources a tree links to, e.g. its material and reactants. """
+    ids = set()
+    for items in tree.values():
+        for value in items:
+            if '@id' in value:
+                ids.add(value['@id'])
+            elif 'values' in value:
+                ids |= linked_ids(value['values'])
+    return ids
+
+
+def diff_trees(old, new, path=()):
+    """
+    The statement changes that turn the `old` tree into the `new` one: [(path, predicate ID, removed
+    values, added values)], where `path` is the predicates leading from the contribution to the subject.
+    Returns None if nested resources were added or removed; such a contribution is replaced instead.
+    """
+    changes = []
+    for predicate_id in sorted(set(old) | set(new)):
+        old_values, new_values = old.get(predicate_id, []), new.get(predicate_id, [])
+        if any('values' in value for value in old_values + new_values):
+            if len(old_values) != 1 or len(new_values) != 1 or 'values' not in old_values[0] or 'values' not in new_values[0]:
+                return None
+            nested = diff_trees(old_values[0]['values'], new_values[0]['values'], path + (predicate_id,))
+            if nested is None:
+                return None
+            changes.extend(nested)
+            continue
+        removed = [value for value in old_values if value not in new_values]
+        added = [value for value in new_values if value not in old_values]
+        if removed or added:
+            changes.append((path, predicate_id, removed, added))
+    return changes
+
+
+def _matches(target, value):
+    if 'text' in value:
+        return target.get('_class') == 'literal' and target['label'] == value['text']
+    return target.get('_class') != 'literal' and target['id'] == value['@id']
+
+
+def fetch_tree(orkg, subject_id, shape):
+    """
+    Read a stored contribution back from ORKG as a tree. `shape` is a tree of the same template; the
+    predicates that hold nested resources in it are followed, other resources are taken as links.
+    """
+    tree = {}
+    for statement in list_statements(orkg.statements.get_by_subject, subject_id=subject_id):
+        predicate_id, target = statement['predicate']['id'], statement['object']
+        nested_shape = next((value['values'] for value in shape.get(predicate_id, []) if 'values' in value), None)
+        if target.get('_class') == 'literal':
+            item = {'text': target['label']}
+        elif nested_shape is not None:
+            item = {'values': fetch_tree(orkg, target['id'], nested_shape)}
+        else:
+            item = {'@id': target['id']}
+        tree.setdefault(predicate_id, []).append(item)
+    return {predicate_id: sorted(items, key=_canonical) for predicate_id, items in tree.items()}
+
+
+def create_thing(orkg, kind, payload):
+    """ Create a statement or literal and return its ID, without fetching it again afterwards. """
+    # A spawned endpoint of its own, so that setting the trailing slash does not race with other threads
+    endpoint = getattr(orkg.backend, kind)
+    endpoint._append_slash = True
+    response = endpoint.POST(json=payload, headers=orkg.resources.auth)
+    if not response.ok:
+        raise RuntimeError(f"Creating {kind} {payload} failed with status {response.status_code}: {response.text[:200]}")
+    location = response.headers.get('Location')
+    if location:
+        return location.rstrip('/').rsplit('/', 1)[-1]
+    return response.json()['id']
+
+
+class StatementPatch:
+    """ Applies the changes of diff_trees to one stored contribution, reading each subject's statements at most once. """
+
+    def __init__(self, orkg, contribution_id):
+        self.orkg = orkg
+        self.subjects = {(): contribution_id}
+        self.statements = {}
+
+    def statements_of(self, subject_id):
+        if subject_id not in self.statements:
+            self.statements[subject_id] = list_statements(self.orkg.statements.get_by_subject, subject_id=subject_id)
+        return self.statements[subject_id]
+
+    def subject(self, path):
+        if path not in self.subjects:
+            parent_id = self.subject(path[:-1])
+            nested = [s for s in self.statements_of(parent_id) if s['predicate']['id'] == path[-1]]
+            if len(nested) != 1:
+                raise RuntimeError(f"{parent_id} has {len(nested)} statements with predicate {path[-1]}, expected one")
+            self.subjects[path] = nested[0]['object']['id']
+        return self.subjects[path]
+
+    def apply(self, changes):
+        """
+        Delete the statements of removed values, then add statements for added ones. Values that are
+        already gone or already there are skipped, so applying the same changes again is harmless.
+        Returns the number of statements deleted and added.
+        """
+        changed = 0
+        for path, predicate_id, removed, added in changes:
+            subject_id = self.subject(path)
+            statements = self.statements_of(subject_id)
+            for value in removed:
+                match = next((s for s in statements if s['predicate']['id'] == predicate_id and _matches(s['object'], value)), None)
+                if match is None:
+                    continue
+                status, detail = delete_thing(self.orkg, 'statements', match['id'])
+                if status not in DONE_STATUSES:
+                    raise RuntimeError(f"Deleting statement {match['id']} failed ({status}): {detail}")
+                statements.remove(match)
+                changed += 1
+            for value in added:
+                if any(s['predicate']['id'] == predicate_id and _matches(s['object'], value) for s in statements):
+                    continue
+                if 'text' in value:
+                    object_id = create_thing(self.orkg, 'literals', {'label': value['text']})
+                    target = {'id': object_id, 'label': value['text'], '_class': 'literal'}
+                else:
+                    object_id = value['@id']
+                    target = {'id': object_id, 'label': object_id, '_class': 'resource'}
+                statement_id = create_thing(self.orkg, 'statements', {'subject_id': subject_id, 'predicate_id': predicate_id, 'object_id': object_id})
+                statements.append({'id': statement_id, 'predicate': {'id': predicate_id}, 'object': target})
+                changed += 1
+        return changed
+
+
+def retire_contribution(orkg, contribution_id, protected):
+    """
+    Delete a contribution: the "has contribution" statement of its paper, the statements of its
+    subgraph, then its nested resources and the contribution itself. Linked materials and reactants
+    (`protected`) are kept. Returns the IDs that could not be deleted, with their status.
+    """
+    statements, resources = RollbackPlan(orkg, protected, 1).walk(contribution_id)
+    links = list_statements(orkg.statements.get_by_object_and_predicate, object_id=contribution_id, predicate_id=CONTRIBUTION_PREDICATE)
+    kept = {}
+    for kind, ids in (('statements', [link['id'] for link in links] + statements), ('resources', resources + [contribution_id])):
+        for thing_id in ids:
+            status, detail = delete_thing(orkg, kind, thing_id)
+            if status not in DONE_STATUSES:
+                kept[thing_id] = f"{status} {detail}".strip()
+    return kept
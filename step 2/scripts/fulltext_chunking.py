@@ -0,0 +1,186 @@
+import re
+
+from rate_limiter import estimate_tokens, estimate_tokens_for_length
+
+# Headings of sections that never describe the ALD process itself
+BOILERPLATE_HEADINGS = [
+    'references', 'bibliography', 'literature cited', 'notes and references',
+    'acknowledgement', 'acknowledgements', 'acknowledgment', 'acknowledgments',
+    'funding', 'funding sources', 'conflicts of interest', 'conflict of interest', 'declaration of competing interest',
+    'competing interests', 'author contributions', 'author information', 'credit authorship contribution statement',
+    'data availability', 'data availability statement', 'supporting information available', 'associated content',
+    'abbreviations', 'orcid',
+]
+HEADING_PATTERN = re.compile(r'^\s*(?:[0-9IVX]+\.?\s+)?([A-Za-z][A-Za-z &\-]{1,60}?)\s*:?\s*$')
+PLACEHOLDERS = {'', '-', '...', 'n/a', 'na', 'none', 'not mentioned', 'not specified', 'not reported'}
+
+
+def is_boilerplate_heading(line):
+    match = HEADING_PATTERN.match(line)
+    return match is not None and match.group(1).strip().lower() in BOILERPLATE_HEADINGS
+
+
+def is_heading(line):
+    # Short stand-alone lines without sentence punctuation are treated as section headings
+    stripped = line.strip()
+    return 0 < len(stripped) <= 60 and HEADING_PATTERN.match(stripped) is not None and not stripped.endswith('.')
+
+
+def iter_lines(text, block_size=1 << 16):
+    """ The lines of a text as str.splitlines gives them, split off block by block instead of all at once. """
+    start = 0
+    while start < len(text):
+        # Blocks end after a '\n', so a '\r\n' line break is never cut in two
+        end = text.find('\n', start + block_size)
+        end = len(text) if end < 0 else end + 1
+        yield from text[start:end].splitlines()
+        start = end
+
+
+def cut_reference_list(text):
+    # For texts without line breaks: cut a trailing reference list that starts in the last part of the article
+    match = None
+    for match in re.finditer(r'\b(?:References|REFERENCES|Bibliography)\b\s*(?:\(?1[\.\)\]]|\[1\])', text):
+        pass
+    if match is not None and match.start() > len(text) * 0.6:
+        return text[:match.start()]
+    return text
+
+
+def iter_article_lines(full_text):
+    """
+    The lines of a full text without reference lists, acknowledgements and similar sections. A boilerplate
+    section runs from its heading to the next heading that is not boilerplate (or the end of the text).
+    """
+    first = None
+    lines = 0
+    skipping = False
+    for line in iter_lines(str(full_text)):
+        if is_boilerplate_heading(line):
+            skipping = True
+            continue
+        if skipping and is_heading(line):
+            skipping = False
+        if not skipping:
+            lines += 1
+            # The first line is held back until a second one shows that the text has line breaks
+            if lines == 1:
+                first = line
+                continue
+            if lines == 2:
+                yield first
+            yield line
+    if lines == 1:
+        yield cut_reference_list(first)
+
+
+def strip_boilerplate(full_text):
+    return '\n'.join(iter_article_lines(full_text)).strip()
+
+
+def split_long_paragraph(paragraph, token_budget):
+    # Sentence-level split for paragraphs that on their own exceed the budget
+    sentences = re.split(r'(?<=[.!?])\s+', paragraph)
+    piece = []
+    piece_tokens = 0
+    for sentence in sentences:
+        sentence_tokens = estimate_tokens(sentence)
+        if piece and piece_tokens + sentence_tokens > token_budget:
+            yield ' '.join(piece)
+            piece = []
+            piece_tokens = 0
+        if sentence_tokens > token_budget:
+            # A single runaway "sentence" (e.g. a table dump) is cut by characters
+            step = token_budget * 4
+            for start in range(0, len(sentence), step):
+                yield sentence[start:start + step]
+            continue
+        piece.append(sentence)
+        piece_tokens += sentence_tokens
+    if piece:
+        yield ' '.join(piece)
+
+
+def iter_chunks(lines, token_budget):
+    """ Yield consecutive chunks of at most `token_budget` estimated tokens from the lines of a text, split on line boundaries where possible. """
+    chunk = []
+    chunk_tokens = 0
+    for paragraph in lines:
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        paragraph_tokens = estimate_tokens(paragraph)
+        pieces = [paragraph] if paragraph_tokens <= token_budget else list(split_long_paragraph(paragraph, token_budget))
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if chunk and chunk_tokens + piece_tokens > token_budget:
+                yield '\n\n'.join(chunk)
+                chunk = []
+                chunk_tokens = 0
+            chunk.append(piece)
+            chunk_tokens += piece_tokens
+    if chunk:
+        yield '\n\n'.join(chunk)
+
+
+def measure_lines(lines, length):
+    """ Pass the lines through, adding up in length[0] the length of the lines joined by newlines and stripped. """
+    pending = 0  # whitespace after the last non-whitespace character, counted once more text follows
+    for number, line in enumerate(lines):
+        separator = 1 if number else 0
+        content = line.strip()
+        if content:
+            if length[0]:
+                length[0] += pending + separator + len(line) - len(line.lstrip())
+            length[0] += len(content)
+            pending = len(line) - len(line.rstrip())
+        else:
+            pending += separator + len(line)
+        yield line
+
+
+def chunk_full_text(full_text, token_budget):
+    """
+    Boilerplate-free chunks of a full text; a text that fits the budget comes back as a single chunk.
+    The text is read line by line, so no list of its lines or stripped copy of it is held.
+    """
+    length = [0]
+    chunks = list(iter_chunks(measure_lines(iter_article_lines(full_text), length), token_budget))
+    if estimate_tokens_for_length(length[0]) <= token_budget:
+        # Fits as a whole: sent as is, with its line breaks, like a text sent without a budget
+        return [strip_boilerplate(full_text)]
+    return chunks
+
+
+def is_informative(value):
+    if value is None:
+        return False
+    if isinstance(value, (dict, list)):
+        return any(is_informative(v) for v in (value.values() if isinstance(value, dict) else value))
+    return str(value).strip().lower() not in PLACEHOLDERS
+
+
+def merge_values(values):
+    """
+    Deterministic merge of the values one property got from the chunks, in chunk order:
+    dicts are merged key by key (keys in order of first appearance), lists and scalars take the first
+    informative value, and a property no chunk found keeps the first placeholder seen.
+    """
+    dicts = [value for value in values if isinstance(value, dict)]
+    if dicts:
+        keys = []
+        for value in dicts:
+            keys.extend(key for key in value if key not in keys)
+        return {key: merge_values([value[key] for value in dicts if key in value]) for key in keys}
+    for value in values:
+        if is_informative(value):
+            return value
+    return values[0] if values else '-'
+
+
+def merge_profiles(profiles):
+    """ Merge the per-chunk extraction profiles of one article into one profile. """
+    profiles = [profile for profile in profiles if isinstance(profile, dict)]
+    if not profiles:
+        return None
+    return merge_values(profiles)
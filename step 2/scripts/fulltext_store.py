@@ -0,0 +1,158 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import zlib
+
+import pandas as pd
+
+# Resolver prefixes removed from DOIs, as in the ORKG CSV import file of step 1
+DOI_PREFIXES = ["http://dx.doi.org/", "https://dx.doi.org/", "https://doi.org/", "http://doi.org/"]
+COMPRESSION_LEVEL = 6
+
+
+def doi_key(doi):
+    """ The key of a DOI in the store: without resolver prefix and lower-cased, as DOIs are case-insensitive. """
+    doi = str(doi).strip()
+    for prefix in DOI_PREFIXES:
+        if doi.lower().startswith(prefix):
+            doi = doi[len(prefix):]
+            break
+    return doi.lower()
+
+
+def index_path(path):
+    return path + '.index'
+
+
+def _read_index(path):
+    """ DOI key -> (offset, length, sha256) of the complete entries; a partly written last line is ignored. """
+    entries = {}
+    if not os.path.exists(index_path(path)):
+        return entries
+    data_size = os.path.getsize(path) if os.path.exists(path) else 0
+    with open(index_path(path), 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry['offset'] + entry['length'] <= data_size:
+                entries[entry['doi']] = (entry['offset'], entry['length'], entry['sha256'])
+    return entries
+
+
+class FullTextStore:
+    """
+    Read side of the full-text store: one zlib-compressed text per DOI in a data file, found through
+    an offset index (`<path>.index`, one JSON line per DOI). The data file is memory-mapped, so a text
+    is only read and decompressed when it is asked for, and the operating system can drop the pages
+    again; only the index is held in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = _read_index(path)
+        self.file = None
+        self.data = None
+        if self.entries:
+            self.file = open(path, 'rb')
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, doi):
+        return doi_key(doi) in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, doi, default=None):
+        entry = self.entries.get(doi_key(doi))
+        if entry is None:
+            return default
+        offset, length, _ = entry
+        return zlib.decompress(self.data[offset:offset + length]).decode('utf-8')
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+            self.data = self.file = None
+
+
+class FullTextStoreWriter:
+    """
+    Append-only write side of the store. A DOI that is already stored is skipped, and texts shared by
+    several DOIs are stored once. Index lines are only written by flush(), after the texts they point
+    to are synced to disk; data left behind by an interrupted run (beyond the last indexed text, or a
+    partly written index line) is cut off on opening.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        _trim_partial_line(index_path(path))
+        self.entries = _read_index(path)
+        self.by_hash = {sha256: (offset, length) for offset, length, sha256 in self.entries.values()}
+        end = max((offset + length for offset, length, _ in self.entries.values()), default=0)
+        self.data = open(path, 'ab')
+        self.data.truncate(end)
+        self.index = open(index_path(path), 'a', encoding='utf-8')
+        self.pending = []
+        self.lock = threading.Lock()
+        self.added = 0
+
+    def __contains__(self, doi):
+        return doi_key(doi) in self.entries
+
+    def add(self, doi, text):
+        """ Store the text of a DOI (readable after the next flush); returns False if the DOI was already stored. """
+        key = doi_key(doi)
+        with self.lock:
+            if key in self.entries:
+                return False
+            encoded = str(text).encode('utf-8')
+            sha256 = hashlib.sha256(encoded).hexdigest()
+            if sha256 in self.by_hash:
+                offset, length = self.by_hash[sha256]
+            else:
+                blob = zlib.compress(encoded, COMPRESSION_LEVEL)
+                offset = self.data.seek(0, os.SEEK_END)
+                length = len(blob)
+                self.data.write(blob)
+                self.by_hash[sha256] = (offset, length)
+            self.pending.append(json.dumps({'doi': key, 'offset': offset, 'length': length, 'sha256': sha256}) + '\n')
+            self.entries[key] = (offset, length, sha256)
+            self.added += 1
+            return True
+
+    def add_frame(self, df):
+        """ Store the 'full_text' of every row of a data frame with 'reference_doi'; rows without text are skipped. """
+        for doi, text in zip(df['reference_doi'], df['full_text']):
+            if pd.notna(doi) and pd.notna(text) and text != '-':
+                self.add(doi, text)
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            self.data.flush()
+            os.fsync(self.data.fileno())
+            self.index.writelines(self.pending)
+            self.index.flush()
+            os.fsync(self.index.fileno())
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.data.close()
+        self.index.close()
+
+
+def _trim_partial_line(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as file:
+        content = file.read()
+        if content and not content.endswith(b'\n'):
+            file.truncate(content.rfind(b'\n') + 1)
@@ -0,0 +1,214 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from orkg import ORKG
+
+# Server errors worth another attempt
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+# Responses that mean the server is overloaded and did not handle the request
+PRESSURE_STATUSES = {429, 503}
+
+
+class PressureRetry(Retry):
+    """
+    Exponential backoff with full jitter, so parallel workers do not retry in lockstep. A Retry-After
+    header takes precedence over the backoff (urllib3 honours it). Requests that are not idempotent
+    (POST, PATCH) are only repeated after a 429 or 503, when the server refused them without doing any work.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code in PRESSURE_STATUSES and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+
+class HostLimiter:
+    """
+    Adaptive limit on the requests in flight to one host. The limit is halved whenever the server shows
+    pressure (429/503 responses, timeouts or dropped connections) and raised by one after as many
+    successful requests in a row as the current limit, up to `max_concurrency`.
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.active = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, pressure):
+        with self.condition:
+            self.active -= 1
+            if pressure:
+                if self.limit > 1:
+                    print(f"Server pressure, lowering the concurrency limit to {max(1, self.limit // 2)}")
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` failed requests in a row (server errors or no response at all, after retries).
+    While it is open, requests wait instead of failing; after the cooldown one probe request is let
+    through. A successful probe closes the circuit, a failed one doubles the cooldown (up to
+    `max_cooldown`). A request that has waited longer than `max_wait` raises CircuitOpenError.
+    """
+
+    def __init__(self, threshold=5, cooldown=5.0, max_cooldown=120.0, max_wait=900.0):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_wait = max_wait
+        self.failures = 0
+        self.open_until = None
+        self.probing = False
+        self.condition = threading.Condition()
+
+    def before_request(self, host):
+        started = time.monotonic()
+        with self.condition:
+            while self.open_until is not None:
+                now = time.monotonic()
+                if now - started > self.max_wait:
+                    raise CircuitOpenError(f"{host} has been failing for more than {self.max_wait:.0f} seconds")
+                if now >= self.open_until and not self.probing:
+                    self.probing = True
+                    return
+                self.condition.wait(timeout=max(0.05, self.open_until - now) if not self.probing else 1.0)
+
+    def record(self, host, failed):
+        with self.condition:
+            if not failed:
+                if self.open_until is not None:
+                    print(f"{host} is answering again, closing the circuit")
+                self.failures = 0
+                self.open_until = None
+                self.cooldown = self.base_cooldown
+            else:
+                self.failures += 1
+                if self.probing or self.failures >= self.threshold:
+                    if self.probing:
+                        self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                    self.open_until = time.monotonic() + self.cooldown
+                    print(f"{self.failures} failed requests in a row to {host}, pausing requests for {self.cooldown:.0f} seconds")
+            self.probing = False
+            self.condition.notify_all()
+
+
+class ResilientAdapter(HTTPAdapter):
+    """ HTTPAdapter with a default timeout and, per host, an adaptive concurrency limit and a circuit breaker. """
+
+    def __init__(self, timeout=60, max_concurrency=8, breaker_threshold=5, breaker_cooldown=5.0, **kwargs):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.hosts = {}
+        self.hosts_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def host_state(self, host):
+        with self.hosts_lock:
+            if host not in self.hosts:
+                self.hosts[host] = (HostLimiter(self.max_concurrency), CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+            return self.hosts[host]
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        host = urlsplit(request.url).netloc
+        limiter, breaker = self.host_state(host)
+        breaker.before_request(host)
+        limiter.acquire()
+        try:
+            response = super().send(request, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            limiter.release(pressure=True)
+            breaker.record(host, failed=True)
+            raise
+        except Exception:
+            limiter.release(pressure=False)
+            breaker.record(host, failed=False)
+            raise
+        # Retried attempts happen inside super().send, so pressure is read from the retry history too
+        history = getattr(getattr(response.raw, 'retries', None), 'history', ())
+        pressure = response.status_code in PRESSURE_STATUSES or any(
+            attempt.error is not None or attempt.status in PRESSURE_STATUSES for attempt in history
+        )
+        limiter.release(pressure)
+        breaker.record(host, failed=response.status_code >= 500 or response.status_code == 429)
+        return response
+
+
+def build_session(pool_size=10, retries=5, backoff_factor=1, timeout=60, max_concurrency=None):
+    """
+    A pooled keep-alive session with retries and the per-host limits of ResilientAdapter. After the last
+    retry the final response is returned rather than raised, so callers see its status code as before.
+    """
+    session = requests.Session()
+    retry = PressureRetry(total=retries, backoff_factor=backoff_factor, backoff_max=60,
+                          status_forcelist=RETRY_STATUSES, raise_on_status=False)
+    adapter = ResilientAdapter(timeout=timeout, max_concurrency=max_concurrency or pool_size, max_retries=retry,
+                               pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def orkg_client(host, creds=None, auth_host=None, session=None, pool_size=10):
+    """
+    An ORKG client whose API requests go through `session` (a new resilient session unless one is given,
+    e.g. to share one pool between the clients of several worker threads).
+    """
+    orkg = ORKG(host=host, creds=creds, **({'auth_host': auth_host} if auth_host else {}))
+    if session is None:
+        session = build_session(pool_size)
+    session.headers['User-Agent'] = orkg.user_agent
+    # The API root is spawned from orkg.core when the client is created and keeps its own session reference
+    orkg.core._session = session
+    orkg.backend._session = session
+    if orkg.simcomp_available:
+        orkg.simcomp._session = session
+    follow_locations_through(orkg, session)
+    return orkg
+
+
+def follow_locations_through(orkg, session):
+    """
+    The client fetches the resource a POST or PUT created from its Location header with a bare
+    requests.get. Route that request through the session too, so that a failed follow-up does not lose
+    the result of a write that succeeded.
+    """
+    def expand_response(response):
+        url = response.headers.get('Location')
+        if not orkg.follow_location:
+            return orkg.wrap_response(status_code=str(response.status_code), content={}, url=url)
+        headers = {key: value for key, value in response.request.headers.items()
+                   if key in ['Authorization', 'Content-Type', 'Accept', 'User-Agent']}
+        return orkg.wrap_response(session.get(url, headers=headers))
+    orkg.expand_response = expand_response
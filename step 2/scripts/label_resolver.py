@@ -0,0 +1,200 @@
+import difflib
+import re
+import threading
+import unicodedata
+
+from local_index import LocalIndex
+
+# Common names and abbreviations of ALD precursors, co-reactants and films, keyed by their case-folded canonical form
+SYNONYMS = {
+    'water': 'H2O',
+    'ozone': 'O3',
+    'oxygen': 'O2',
+    'hydrogen': 'H2',
+    'nitrogen': 'N2',
+    'ammonia': 'NH3',
+    'hydrogen peroxide': 'H2O2',
+    'hydrogen sulfide': 'H2S',
+    'tma': 'AlMe3',
+    'trimethylaluminum': 'AlMe3',
+    'trimethylaluminium': 'AlMe3',
+    'al(ch3)3': 'AlMe3',
+    'dez': 'ZnEt2',
+    'diethylzinc': 'ZnEt2',
+    'zn(c2h5)2': 'ZnEt2',
+    'tdmat': 'Ti(NMe2)4',
+    'tdmah': 'Hf(NMe2)4',
+    'temah': 'Hf(NEtMe)4',
+    'tdmaz': 'Zr(NMe2)4',
+    'tdma-zr': 'Zr(NMe2)4',
+    'temaz': 'Zr(NEtMe)4',
+    'bis(trimethylsilyl)sulfide': '(Me3Si)2S',
+    'alumina': 'Al2O3',
+    'titania': 'TiO2',
+    'hafnia': 'HfO2',
+    'zirconia': 'ZrO2',
+    'silica': 'SiO2',
+    'zinc oxide': 'ZnO',
+}
+
+
+def clean_label(label):
+    # The label as written in the data, without stray whitespace
+    return re.sub(r'\s+', ' ', str(label)).strip()
+
+
+def _repair_mojibake(label):
+    # UTF-8 text that was read as ISO-8859-1 (e.g. 'Î·' for 'η')
+    if not re.search('[Â-Ïâ]', label):
+        return label
+    try:
+        return label.encode('latin-1').decode('utf-8')
+    except UnicodeError:
+        return label
+
+
+def _is_word(token):
+    # Ordinary words ("plasma", "Plasma"); acronyms and formula fragments ("COOH", "Te", "Me(OMe)") are not words
+    return token.isalpha() and len(token) > 2 and (token.islower() or token.istitle())
+
+
+def canonical_label(label):
+    """
+    Canonical form of a chemical label: mojibake is repaired, the text is Unicode-normalized (subscript
+    digits become plain digits), whitespace around '+', ',' and '/' is removed, ordinary words are
+    case-folded while formula tokens keep their case ("Co" and "CO" stay distinct), formula fragments
+    split by a space are joined ("CH3 COOH", "N2 O") and common synonyms are replaced ("TMA" -> "AlMe3").
+    """
+    label = unicodedata.normalize('NFKC', _repair_mojibake(str(label)))
+    label = re.sub('[‐-―−]', '-', label)
+    label = re.sub(r'\s*([+,/])\s*', r'\1', label)
+    tokens = []
+    previous_is_word = True
+    for token in re.sub(r'\s+', ' ', label).strip().split(' '):
+        is_word = _is_word(token)
+        if tokens and not is_word and not previous_is_word:
+            tokens[-1] += token
+        else:
+            tokens.append(token.casefold() if is_word else token)
+        previous_is_word = is_word
+    key = ' '.join(tokens)
+    return SYNONYMS.get(key.casefold(), key)
+
+
+class LabelResolver:
+    """
+    Persistent index of ORKG resources by label, shared by every script that links labels to resources.
+    Labels are looked up exactly, then by their canonical form and, if a fuzzy cutoff is given, by the
+    closest canonical form (difflib ratio at least `fuzzy_cutoff`). Only confirmed resource IDs are stored;
+    fuzzy matches are never written back to the index.
+    """
+
+    def __init__(self, path, fuzzy_cutoff=None):
+        self.index = LocalIndex(path)
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.lock = threading.Lock()
+        self.exact = {}
+        self.canonical = {}
+        self._keys = None
+        for entry in self.index.entries.values():
+            self._remember(entry['label'], entry['id'])
+
+    def _remember(self, label, resource_id):
+        label = clean_label(label)
+        self.exact.setdefault(label, resource_id)
+        key = canonical_label(label)
+        if key not in self.canonical:
+            self.canonical[key] = (label, resource_id)
+            self._keys = None
+
+    def __len__(self):
+        return len(self.exact)
+
+    def add(self, label, resource_id):
+        """ Record the resource ID of a label (e.g. after find_or_add or from a mapping file). """
+        label = clean_label(label)
+        if not label or self.exact.get(label) == resource_id:
+            return
+        with self.lock:
+            self.index.put(label, {'id': resource_id, 'label': label})
+            self._remember(label, resource_id)
+
+    def remove_ids(self, resource_ids):
+        """ Forget every label of the given resources (e.g. after they were deleted from ORKG). """
+        resource_ids = set(resource_ids)
+        with self.lock:
+            for label, entry in list(self.index.entries.items()):
+                if entry['id'] in resource_ids:
+                    self.index.delete(label)
+            self.exact = {}
+            self.canonical = {}
+            self._keys = None
+            for entry in self.index.entries.values():
+                self._remember(entry['label'], entry['id'])
+
+    def add_mapping(self, mapping):
+        for label, resource_id in mapping.items():
+            if isinstance(resource_id, str) and resource_id:
+                self.add(label, resource_id)
+
+    def resolve(self, label, fuzzy=True):
+        """ Returns (resource_id, matched_label, method, confidence) or None; method is 'exact', 'canonical' or 'fuzzy'. """
+        label = clean_label(label)
+        if label in self.exact:
+            return self.exact[label], label, 'exact', 1.0
+        key = canonical_label(label)
+        if key in self.canonical:
+            matched_label, resource_id = self.canonical[key]
+            return resource_id, matched_label, 'canonical', 1.0
+        if not fuzzy or not self.fuzzy_cutoff:
+            return None
+        if self._keys is None:
+            self._keys = list(self.canonical)
+        matches = difflib.get_close_matches(key, self._keys, n=1, cutoff=self.fuzzy_cutoff)
+        if not matches:
+            return None
+        matched_label, resource_id = self.canonical[matches[0]]
+        confidence = difflib.SequenceMatcher(None, key, matches[0]).ratio()
+        return resource_id, matched_label, 'fuzzy', confidence
+
+    def mapping(self, mapping):
+        """ A drop-in replacement for a label -> resource ID dict that falls back to the resolver. """
+        self.add_mapping(mapping)
+        return ResolvedMapping(mapping, self)
+
+    def close(self):
+        self.index.close()
+
+
+class ResolvedMapping(dict):
+    """
+    Label -> resource ID dict (as built by read_mapping) whose misses are resolved by a LabelResolver.
+    Non-exact matches are kept in `resolutions` ({label: (matched_label, method, confidence)}) for reporting.
+    """
+
+    def __init__(self, mapping, resolver):
+        super().__init__(mapping)
+        self.resolver = resolver
+        self.resolutions = {}
+
+    def _resolve(self, label):
+        match = self.resolver.resolve(label)
+        if match is None:
+            return None
+        resource_id, matched_label, method, confidence = match
+        if method != 'exact':
+            self.resolutions[label] = (matched_label, method, confidence)
+        return resource_id
+
+    def __missing__(self, label):
+        # None rather than KeyError, so that pandas' Series.map(mapping) leaves unresolved labels empty
+        return self._resolve(label)
+
+    def __contains__(self, label):
+        return dict.__contains__(self, label) or self._resolve(label) is not None
+
+    def get(self, label, default=None):
+        if dict.__contains__(self, label):
+            return dict.__getitem__(self, label)
+        resource_id = self._resolve(label)
+        return default if resource_id is None else resource_id
@@ -0,0 +1,121 @@
+import contextlib
+import json
+import os
+import threading
+
+from openai import AsyncOpenAI, OpenAI
+from rate_limiter import RateLimiter, estimate_tokens
+
+DEFAULT_MODEL = 'gpt-4o'
+
+
+class Backend:
+    """
+    One OpenAI-compatible chat completions endpoint, e.g. the OpenAI API or a locally hosted model
+    server, with the model to ask and its own limits. Without a base URL the OpenAI client's default
+    is used, which honours OPENAI_BASE_URL. `max_input_tokens` and `max_processes` are the routing
+    limits: the largest request, and the most processes in one request, the backend should get.
+    """
+
+    def __init__(self, name, model=DEFAULT_MODEL, base_url=None, api_key=None, max_in_flight=None,
+                 requests_per_minute=None, tokens_per_minute=None, max_input_tokens=None, max_processes=None):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_input_tokens = max_input_tokens
+        self.max_processes = max_processes
+        # Limits requests in flight from threads (sequential mode); the async modes use the rate limiter
+        self.slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight else contextlib.nullcontext()
+        self.limits = (requests_per_minute, tokens_per_minute, max_in_flight)
+        self.limiter = None
+        self._client = None
+        self._async_client = None
+        self.lock = threading.Lock()
+
+    def accepts(self, tokens, processes):
+        return ((self.max_input_tokens is None or tokens <= self.max_input_tokens)
+                and (self.max_processes is None or processes <= self.max_processes))
+
+    @property
+    def client(self):
+        with self.lock:
+            if self._client is None:
+                self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            return self._client
+
+    @property
+    def async_client(self):
+        # The async client and the rate limiter belong to the event loop of one run, see BackendRouter.aclose
+        with self.lock:
+            if self._async_client is None:
+                self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+                self.limiter = RateLimiter(*self.limits)
+            return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self.limiter = None
+
+    def describe(self):
+        limits = []
+        if self.max_input_tokens is not None:
+            limits.append(f"up to {self.max_input_tokens} input tokens")
+        if self.max_processes is not None:
+            limits.append(f"up to {self.max_processes} processes")
+        if self.limits[2]:
+            limits.append(f"{self.limits[2]} requests in flight")
+        return f"{self.name}: {self.model} at {self.base_url or 'the OpenAI API'}" + (f" ({', '.join(limits)})" if limits else '')
+
+
+class BackendRouter:
+    """
+    Sends each request to the first backend, in configured order, whose limits it fits, e.g. a small and
+    fast model for short single-process requests first and a large model last. A request that fits no
+    backend goes to the last one. The routed request carries the backend's model.
+    """
+
+    def __init__(self, backends):
+        if not backends:
+            raise ValueError("At least one LLM backend is needed")
+        self.backends = backends
+
+    def route(self, request, processes=1):
+        tokens = sum(estimate_tokens(message['content']) for message in request['messages'])
+        backend = next((backend for backend in self.backends if backend.accepts(tokens, processes)), self.backends[-1])
+        return backend, dict(request, model=backend.model)
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
+
+    def describe(self):
+        return '\n'.join(f"- {backend.describe()}" for backend in self.backends)
+
+
+def single_backend(api_key, max_in_flight=None, requests_per_minute=None, tokens_per_minute=None):
+    """ The OpenAI API with the default model for every request, as before backends could be configured. """
+    return BackendRouter([Backend('openai', DEFAULT_MODEL, api_key=api_key, max_in_flight=max_in_flight,
+                                  requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)])
+
+
+def load_backends(path, default_api_key=None):
+    """
+    Read the backends from a JSON file: {"backends": [{"name", "model", "base_url", "api_key_env" or
+    "api_key", "max_in_flight", "requests_per_minute", "tokens_per_minute", "max_input_tokens",
+    "max_processes"}, ...]} in routing order. Backends without an API key use `default_api_key`.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        config = json.load(file)
+    backends = []
+    for entry in config['backends']:
+        entry = dict(entry)
+        api_key_env = entry.pop('api_key_env', None)
+        if api_key_env:
+            entry['api_key'] = os.environ.get(api_key_env)
+        if not entry.get('api_key'):
+            entry['api_key'] = default_api_key
+        backends.append(Backend(**entry))
+    return BackendRouter(backends)
@@ -0,0 +1,59 @@
+import json
+import os
+import threading
+
+
+class LocalIndex:
+    """
+    A persistent key -> value index stored as append-only JSON lines.
+    Later lines override earlier ones (a line marked as deleted removes the key), so updates are a
+    single append and a crash can at worst lose the last, partially written line. Safe to use from
+    several threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get('deleted'):
+                        self.entries.pop(entry['key'], None)
+                    else:
+                        self.entries[entry['key']] = entry['value']
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def put(self, key, value):
+        with self.lock:
+            if self.entries.get(key) == value:
+                return
+            self.entries[key] = value
+            self.file.write(json.dumps({'key': key, 'value': value}, ensure_ascii=False) + '\n')
+            self.file.flush()
+
+    def delete(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return
+            del self.entries[key]
+            self.file.write(json.dumps({'key': key, 'deleted': True}, ensure_ascii=False) + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            os.fsync(self.file.fileno())
+            self.file.close()
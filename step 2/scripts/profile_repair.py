@@ -0,0 +1,267 @@
+import json
+import os
+import re
+
+DEFAULT_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'ald-schema_ver4.json')
+# Sections with free-form key-value pairs; they may be missing
+FREE_FORM_SECTIONS = {'extra_properties', 'presence_checks'}
+# The "..." item of the prompt schema, copied as a bare list or object item
+PLACEHOLDER_ITEM = re.compile(r'(,\s*"\.\.\."(?=\s*[,}\]]))|((?<=[\[{])\s*"\.\.\."\s*(,|(?=[}\]])))')
+FENCE = re.compile(r'^\s*```[a-zA-Z]*\s*\n?|\n?\s*```\s*$')
+
+_schemas = {}
+
+
+def load_schema(path=DEFAULT_SCHEMA_PATH):
+    """ The extraction schema (the first entry of ald-schema_ver4.json): a profile whose values describe the fields. """
+    if path not in _schemas:
+        with open(path, 'r', encoding='utf-8') as file:
+            schema = json.load(file)
+        _schemas[path] = schema[0] if isinstance(schema, list) else schema
+    return _schemas[path]
+
+
+def _close_json(text):
+    """
+    Remove trailing commas and stray closing brackets outside strings, and close what a truncated
+    answer left open: an unterminated string, a key without a value (which becomes null) and the open
+    objects and lists. Returns (text, fixes).
+    """
+    out = []
+    stack = []
+    fixes = set()
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char in '}]':
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+                fixes.add('trailing comma')
+            if not stack or stack[-1] != char:
+                fixes.add('stray bracket')
+                continue
+            stack.pop()
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char == '"':
+            in_string = True
+        out.append(char)
+    if not in_string and not stack:
+        return ''.join(out), fixes
+
+    fixes.add('truncated')
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+    text = ''.join(out).rstrip()
+    if text.endswith(','):
+        text = text[:-1]
+    if text.endswith(':'):
+        text += ' null'
+    elif stack[-1] == '}' and text.endswith('"') and re.search(r'[{,]\s*"(?:[^"\\]|\\.)*"$', text):
+        # The answer stopped after a key
+        text += ': null'
+    return text + ''.join(reversed(stack)), fixes
+
+
+def _cut_last_value(text):
+    """ The text up to the last comma outside strings, to drop a value that was cut off in an unrepairable way. """
+    in_string = escaped = False
+    last_comma = -1
+    for position, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ',':
+            last_comma = position
+    return text[:last_comma] if last_comma > 0 else None
+
+
+def repair_json(content):
+    """
+    Parse a model answer, repairing common defects locally: code fences and text around the JSON, the
+    "..." placeholder item of the prompt schema, trailing commas and answers cut off mid-way.
+    Returns (value, fixes); value is None if the answer cannot be repaired.
+    """
+    if not isinstance(content, str):
+        return None, []
+    try:
+        return json.loads(content), []
+    except json.JSONDecodeError:
+        pass
+
+    fixes = set()
+    text = content
+    if FENCE.search(text):
+        text = FENCE.sub('', text)
+        fixes.add('code fence')
+    start = text.find('{')
+    if start < 0:
+        return None, sorted(fixes)
+    if start > 0:
+        fixes.add('surrounding text')
+    text = text[start:]
+    if PLACEHOLDER_ITEM.search(text):
+        text = PLACEHOLDER_ITEM.sub('', text)
+        fixes.add('placeholder')
+
+    decoder = json.JSONDecoder()
+    for _ in range(20):
+        closed, closing_fixes = _close_json(text)
+        try:
+            # raw_decode ignores whatever follows the JSON value, e.g. a closing remark
+            value, end = decoder.raw_decode(closed)
+        except json.JSONDecodeError:
+            # e.g. cut off inside a number or a literal; drop the last value and try again
+            text = _cut_last_value(text)
+            fixes.add('truncated')
+            if text is None:
+                break
+            continue
+        if closed[end:].strip():
+            fixes.add('surrounding text')
+        return value, sorted(fixes | closing_fixes)
+    return None, sorted(fixes)
+
+
+def _is_placeholder(value):
+    return isinstance(value, str) and value.strip() in ('...', '')
+
+
+def _normalize(value, spec, path, fixes, failing):
+    if isinstance(spec, dict):
+        if value == '-':
+            return value  # the whole section is not mentioned
+        if not isinstance(value, dict):
+            failing.append(path)
+            return value
+        for key in [key for key in value if key == '...']:
+            del value[key]
+            fixes.add('placeholder')
+        for key, field_spec in spec.items():
+            if key == '...':
+                continue
+            if key not in value:
+                failing.append(f"{path}.{key}")
+            else:
+                value[key] = _normalize(value[key], field_spec, f"{path}.{key}", fixes, failing)
+        return value
+    if isinstance(spec, list):
+        if isinstance(value, str) and value != '-':
+            fixes.add('list')
+            value = [value]
+        if value == '-':
+            return value
+        if not isinstance(value, list) or any(isinstance(item, (dict, list)) for item in value):
+            failing.append(path)
+            return value
+        items = [str(item) for item in value if item is not None and not _is_placeholder(item)]
+        if len(items) != len(value):
+            fixes.add('placeholder')
+        return items
+    if value is None:
+        failing.append(path)
+    elif isinstance(value, bool):
+        fixes.add('type')
+        return 'Yes' if value else 'No'
+    elif isinstance(value, (int, float)):
+        fixes.add('type')
+        return str(value)
+    elif isinstance(value, (dict, list)) or value.strip() == spec or _is_placeholder(value):
+        # A structure instead of a text value, or the description of the field copied from the schema
+        failing.append(path)
+    return value
+
+
+def normalize_profile(profile, schema):
+    """
+    Check a profile against the extraction schema and repair what can be repaired locally ("..." keys
+    and items, numbers instead of text, a single reactant instead of a list). Returns (fixes, failing):
+    the dotted paths of the fields that are missing, null, of the wrong shape or still hold the schema's
+    description, e.g. 'film_properties.film_thickness'. The profile is changed in place.
+    """
+    fixes = set()
+    failing = []
+    for key, spec in schema.items():
+        if key in FREE_FORM_SECTIONS:
+            if key in profile and not isinstance(profile[key], dict):
+                fixes.add('type')
+                profile[key] = {}
+            for item in [item for item in profile.get(key, {}) if item == '...' or _is_placeholder(profile[key][item])]:
+                del profile[key][item]
+                fixes.add('placeholder')
+        elif key not in profile:
+            failing.append(key)
+        else:
+            profile[key] = _normalize(profile[key], spec, key, fixes, failing)
+    return sorted(fixes), failing
+
+
+def field_spec(schema, path):
+    spec = schema
+    for key in path.split('.'):
+        spec = spec[key]
+    return spec
+
+
+def set_field(profile, path, value):
+    keys = path.split('.')
+    node = profile
+    for key in keys[:-1]:
+        if not isinstance(node.get(key), dict):
+            node[key] = {}
+        node = node[key]
+    node[keys[-1]] = value
+
+
+def field_list(schema, paths):
+    """ The failing fields with their descriptions, for a short re-request. """
+    lines = []
+    for path in paths:
+        spec = field_spec(schema, path)
+        if isinstance(spec, list):
+            lines.append(f'- "{path}": {spec[0]} (a list of strings)')
+        elif isinstance(spec, dict):
+            lines.append(f'- "{path}": an object with the keys {", ".join(key for key in spec if key != "...")}')
+        else:
+            lines.append(f'- "{path}": {spec}')
+    return '\n'.join(lines)
+
+
+def fill_fields(profile, paths, answer, schema):
+    """
+    Put the values of a field re-request (a JSON object keyed by the dotted paths) into the profile.
+    Fields the answer does not fix are set to "-", so that the profile always matches the schema.
+    Returns the paths that were set to "-".
+    """
+    values, _ = repair_json(answer)
+    if not isinstance(values, dict):
+        values = {}
+    unresolved = []
+    for path in paths:
+        spec = field_spec(schema, path)
+        value = values.get(path, values.get(path.split('.')[-1]))
+        fixes, failing = set(), []
+        value = _normalize(value, spec, path, fixes, failing)
+        if failing:
+            value = '-'
+            unresolved.append(path)
+        set_field(profile, path, value)
+    return unresolved
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import threading
+
+from profile_repair import DEFAULT_SCHEMA_PATH, load_schema
+from rate_limiter import estimate_tokens
+
+# OpenAI caches prompt prefixes from 1024 tokens on, in steps of 128 tokens
+MIN_CACHED_TOKENS = 1024
+CACHE_INCREMENT = 128
+
+# A request is laid out as [static instructions and schema, article, row context]: everything up to
+# the row context is shared by all processes of a paper, and the first message by all requests.
+STATIC_MESSAGE, ARTICLE_MESSAGE, CONTEXT_MESSAGE = 0, 1, 2
+
+_prefixes = {}
+
+
+def _schema_text(schema_path, coalesced):
+    schema = load_schema(schema_path)
+    if coalesced:
+        schema = {"processes": [{"process_id": "The process_id from the process list", "profile": schema}]}
+    else:
+        schema = [schema]
+    return json.dumps(schema, indent=4, ensure_ascii=False)
+
+
+def static_prefix(coalesced=False, schema_path=DEFAULT_SCHEMA_PATH):
+    """
+    The instructions and the extraction schema, without anything row-specific, so that the text is
+    byte-identical for every request and can be served from the provider's prompt cache.
+    """
+    key = (coalesced, schema_path)
+    if key in _prefixes:
+        return _prefixes[key]
+    if coalesced:
+        scope = "Every article describes one or more ALD processes, each identified by its process_id and defined by its material and reactants; they are listed after the article. This defines the scope of the extraction task."
+        task = "Upon receiving an article, identify and extract data according to a predefined schema, separately for every listed process. Return exactly one entry per process with its process_id, and prepopulate the material and reactants of each profile from the process list. Record values for each property specified in the schema. If a property is not mentioned in the article for that process, denote this with a \"-\"."
+    else:
+        scope = "The ALD process of interest is defined by its material and reactants, which are given after the article. This defines the scope of the extraction task, and the material and reactants are prepopulated in the profile."
+        task = "Upon receiving an article, identify and extract data according to a predefined schema. Record values for each property specified in the schema. If a property is not mentioned in the article, denote this with a \"-\"."
+    _prefixes[key] = f'''
+        <role>
+            You are assigned as a specialist in Atomic Layer Deposition (ALD). Your primary task is to process scientific articles related to ALD, extracting specific scientific information as detailed below. {scope}
+        </role>
+
+        <task>
+            {task} For properties discussed in the article that are not included in the schema, extract these as well and list them under an "extra_properties" section as key-value pairs. Under "presence_checks", note for each property whether the article investigates it.
+        </task>
+
+        <extraction-schema>
+{_schema_text(schema_path, coalesced)}
+        </extraction-schema>
+
+        <output-response-format>
+            Your responses should be formatted in JSON, strictly adhering to the provided schema. Ensure the formatting and data integrity are maintained as per the guidelines. Use the "-" symbol for any property not mentioned in the article.
+        </output-response-format>
+    '''
+    return _prefixes[key]
+
+
+def process_context(material, reactants):
+    # The row-specific part of a single-process request, sent after the article
+    return f'''
+        <process>
+            The ALD process involves the material {material} and reactants {reactants}. Prepopulate "film_properties.material" with the material and "process_parameters.reactants" with the reactants.
+        </process>
+    '''
+
+
+def processes_context(processes):
+    # The row-specific part of a coalesced request: (process_id, material, reactants) of every process of the paper
+    process_list = '\n'.join(
+        f"            - process_id {process_id}: material {material}, reactants {reactants}"
+        for process_id, material, reactants in processes
+    )
+    return f'''
+        <processes>
+{process_list}
+        </processes>
+    '''
+
+
+def layout_messages(prefix, article, context):
+    return [
+        {"role": "system", "content": prefix},
+        {"role": "user", "content": article},
+        {"role": "system", "content": context},
+    ]
+
+
+class PromptCacheEstimate:
+    """
+    Local count of the input tokens a provider-side prompt cache can serve: a request's longest run of
+    leading messages that an earlier request already sent, if it reaches MIN_CACHED_TOKENS. Tokens are
+    estimated from the text, so the counts are approximate; only message hashes are kept.
+    """
+
+    def __init__(self):
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def count(self, request):
+        """ Returns (cached, uncached) estimated input tokens of the request, and remembers its prefixes. """
+        digest = hashlib.sha256(request.get('model', '').encode('utf-8'))
+        total_tokens = cached_tokens = 0
+        shared = True
+        with self.lock:
+            for message in request['messages']:
+                digest.update(json.dumps(message, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+                key = digest.hexdigest()  # of all messages so far
+                total_tokens += estimate_tokens(message['content'])
+                shared = shared and key in self.seen
+                if shared:
+                    cached_tokens = total_tokens
+                self.seen.add(key)
+        if cached_tokens < MIN_CACHED_TOKENS:
+            cached_tokens = 0
+        else:
+            cached_tokens -= (cached_tokens - MIN_CACHED_TOKENS) % CACHE_INCREMENT
+        return cached_tokens, total_tokens - cached_tokens
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+
+def estimate_tokens(text):
+    """ Rough token estimate (about 4 characters per token) used for rate limiting. """
+    if not text:
+        return 0
+    return estimate_tokens_for_length(len(str(text)))
+
+
+def estimate_tokens_for_length(length):
+    """ The token estimate of a text of `length` characters. """
+    return length // 4 + 1 if length else 0
+
+
+class TokenBucket:
+    """ A bucket that refills `per_minute` units every minute up to `capacity`. """
+
+    def __init__(self, per_minute, capacity=None):
+        self.per_minute = per_minute
+        self.capacity = capacity if capacity is not None else per_minute
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.available = min(self.capacity, self.available + elapsed * self.per_minute / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """ Seconds until `amount` units are available (0 if they are available now). """
+        self._refill()
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) * 60.0 / self.per_minute
+
+    def consume(self, amount):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+
+class RateLimiter:
+    """
+    Async limiter that respects a requests-per-minute and a tokens-per-minute budget and,
+    optionally, a maximum number of requests in flight (each acquire must then be paired with a release).
+    A limit of None or 0 disables it.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_in_flight=None):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.slots = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        if self.slots is not None:
+            await self.slots.acquire()
+        try:
+            # The lock keeps waiting callers in FIFO order so large requests are not starved
+            async with self.lock:
+                while True:
+                    wait = 0.0
+                    if self.request_bucket is not None:
+                        wait = max(wait, self.request_bucket.wait_time(1))
+                    if self.token_bucket is not None:
+                        wait = max(wait, self.token_bucket.wait_time(tokens))
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+
+                if self.request_bucket is not None:
+                    self.request_bucket.consume(1)
+                if self.token_bucket is not None:
+                    self.token_bucket.consume(tokens)
+        except BaseException:
+            # E.g. cancelled while waiting: the slot would otherwise be lost for the rest of the run
+            self.release()
+            raise
+
+    def release(self):
+        if self.slots is not None:
+            self.slots.release()
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """ Correct the token bucket once the real usage of a request is known. """
+        if self.token_bucket is None or actual_tokens is None:
+            return
+        difference = estimated_tokens - actual_tokens
+        if difference > 0:
+            self.token_bucket.refund(difference)
+        elif difference < 0:
+            self.token_bucket.consume(-difference)
@@ -0,0 +1,299 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from label_resolver import LabelResolver
+from upload_log import UploadLog, new_run_id
+
+# The "has contribution" predicate that links a paper to its contributions
+CONTRIBUTION_PREDICATE = 'P31'
+PAGE_SIZE = 100
+# Statuses of a delete that need no retry: 404 means an earlier attempt (or someone else) already deleted it
+DONE_STATUSES = {'deleted', 'missing'}
+
+
+def list_statements(fetch, **filters):
+    """ Every statement of a paged statements lookup, e.g. list_statements(orkg.statements.get_by_subject, subject_id=...). """
+    statements = []
+    page = 0
+    while True:
+        response = fetch(page=page, size=PAGE_SIZE, **filters)
+        if not response.succeeded:
+            raise RuntimeError(f"Statement lookup {filters} failed with status {response.status_code}: {response.content}")
+        statements.extend(response.content)
+        if len(response.content) < PAGE_SIZE:
+            return statements
+        page += 1
+
+
+def contribution_statements(orkg, paper_id):
+    """ The "has contribution" statements of a paper by contribution label, e.g. {'Contribution 1': [statement]}. """
+    by_label = {}
+    for statement in list_statements(orkg.statements.get_by_subject_and_predicate,
+                                     subject_id=paper_id, predicate_id=CONTRIBUTION_PREDICATE):
+        by_label.setdefault(statement['object']['label'], []).append(statement)
+    return by_label
+
+
+def delete_thing(orkg, kind, thing_id):
+    """
+    Delete a statement or resource without checking that it exists first; returns 'deleted', 'missing'
+    (404, nothing left to do), 'in use' (403/409, still referenced by statements outside the rollback)
+    or 'failed'.
+    """
+    # A spawned endpoint of its own, so that setting the trailing slash does not race with other threads
+    endpoint = getattr(orkg.backend, kind)(thing_id)
+    endpoint._append_slash = True
+    try:
+        response = endpoint.DELETE(headers=orkg.resources.auth)
+    except Exception as e:
+        return 'failed', str(e)
+    if response.ok:
+        return 'deleted', ''
+    if response.status_code == 404:
+        return 'missing', ''
+    if response.status_code in (403, 409):
+        return 'in use', response.text[:200]
+    return 'failed', f"Status Code: {response.status_code} {response.text[:200]}"
+
+
+def uploads_to_roll_back(upload_log, run_ids):
+    """ The 'uploaded' entries of the given runs that have not been rolled back yet. """
+    latest = upload_log.latest_entries()
+    return [entry for entry in upload_log.entries
+            if entry.get('run_id') in run_ids and entry.get('status') == 'uploaded'
+            and latest.get(entry['key']) is entry]
+
+
+def created_resources(registration_log, run_ids):
+    """ Resource IDs the given registration runs created (not merely found) and that are not rolled back yet. """
+    latest = registration_log.latest_entries()
+    return [entry for entry in registration_log.entries
+            if entry.get('run_id') in run_ids and entry.get('status') == 'created'
+            and latest.get(entry['key']) is entry]
+
+
+class RollbackPlan:
+    """
+    Everything one rollback deletes, collected with read-only requests: the statements and the resources
+    of each contribution subgraph, and the resources a registration run created. Contribution IDs are not
+    in the upload log, so they are looked up by label among the paper's "has contribution" statements.
+    A nested resource belongs to the contribution when its only incoming statement comes from the
+    contribution subgraph and it is not one of the `protected` resources (materials and reactants).
+    """
+
+    def __init__(self, orkg, protected, workers):
+        self.orkg = orkg
+        self.protected = set(protected)
+        self.workers = workers
+        self.contributions = []
+        # Uploads without a contribution of their label in ORKG, and uploads whose label several contributions share
+        self.not_found = []
+        self.ambiguous = []
+        self.statements = []
+        self.resources = []
+        self.registered = []
+
+    def add_uploads(self, entries):
+        papers = {}
+        for entry in entries:
+            papers.setdefault(entry['paper_id'], []).append(entry)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for found in executor.map(self.find_contributions, papers.items()):
+                for entry, contribution_id, statement_id, matches in found:
+                    if contribution_id is None:
+                        upload = {'key': entry['key'], 'paper_id': entry['paper_id'], 'contribution_id': entry['contribution_id']}
+                        (self.ambiguous if matches else self.not_found).append(upload)
+                        continue
+                    self.contributions.append({'key': entry['key'], 'paper_id': entry['paper_id'],
+                                               'contribution_id': entry['contribution_id'], 'resource_id': contribution_id})
+                    self.statements.append(statement_id)
+            contributions = [contribution['resource_id'] for contribution in self.contributions]
+            for statements, resources in executor.map(self.walk, contributions):
+                self.statements.extend(statements)
+                self.resources.extend(resources)
+        self.resources.extend(contributions)
+
+    def find_contributions(self, item):
+        paper_id, entries = item
+        by_label = contribution_statements(self.orkg, paper_id)
+        found = []
+        for entry in entries:
+            matches = by_label.get(entry['contribution_label'], [])
+            if len(matches) == 1:
+                found.append((entry, matches[0]['object']['id'], matches[0]['id'], 1))
+            else:
+                if matches:
+                    print(f"Paper {paper_id} has {len(matches)} contributions labelled '{entry['contribution_label']}', keeping them")
+                found.append((entry, None, None, len(matches)))
+        return found
+
+    def walk(self, contribution_id):
+        statements, resources = [], []
+        pending = [contribution_id]
+        visited = {contribution_id}
+        while pending:
+            subject_id = pending.pop()
+            for statement in list_statements(self.orkg.statements.get_by_subject, subject_id=subject_id):
+                statements.append(statement['id'])
+                target = statement['object']
+                if target.get('_class') != 'resource' or target['id'] in visited or target['id'] in self.protected:
+                    continue
+                visited.add(target['id'])
+                incoming = self.orkg.statements.get_by_object(object_id=target['id'], size=2)
+                if incoming.succeeded and len(incoming.content) == 1:
+                    resources.append(target['id'])
+                    pending.append(target['id'])
+        # Nested resources are deleted after the statements, deepest first
+        return statements, resources[::-1]
+
+    def as_dict(self):
+        return {'contributions': self.contributions, 'not_found': self.not_found, 'ambiguous': self.ambiguous, 'statements': self.statements,
+                'resources': self.resources, 'registered': self.registered}
+
+
+def protected_resource_ids(mapping_paths):
+    """ Resource IDs recorded in the reactant and material output files of 2-add-material-and-reactants-to-orkg.py. """
+    protected = set()
+    for path in mapping_paths:
+        if path and os.path.exists(path):
+            protected.update(pd.read_csv(path)['ORKG Resource ID'].dropna())
+    return protected
+
+
+def execute(orkg, journal, rollback_id, kind, ids, workers, batch_size):
+    """ Delete `ids` in batches of concurrent requests, journaling every result; returns {id: status}. """
+    done = {entry['id']: entry['status'] for entry in journal.entries
+            if entry.get('kind') == kind and entry.get('status') in DONE_STATUSES}
+    statuses = {thing_id: done[thing_id] for thing_id in ids if thing_id in done}
+    pending = [thing_id for thing_id in ids if thing_id not in done]
+    if statuses:
+        print(f"{len(statuses)} {kind} already deleted by an earlier attempt")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            for thing_id, (status, detail) in zip(batch, executor.map(lambda thing_id: delete_thing(orkg, kind, thing_id), batch)):
+                journal.record(run_id=rollback_id, kind=kind, id=thing_id, status=status, detail=detail)
+                statuses[thing_id] = status
+            print(f"{kind}: {start + len(batch)} of {len(pending)} processed")
+    return statuses
+
+
+def rollback_runs(orkg, run_ids, journal_path, upload_log_path=None, registration_log_path=None, records_path=None,
+                  mapping_paths=(), label_index_path=None, workers=8, batch_size=100, dry_run=False):
+    """
+    Delete everything the given upload and registration runs created: first all statements of the
+    contribution subgraphs, then the contributions and their nested resources, then the materials and
+    reactants the registration runs created. The plan and every delete are journaled, so running the
+    same rollback again resumes it. Afterwards the local records are updated, so that the rows can be
+    uploaded again. Returns the number of IDs that could not be deleted.
+    """
+    run_ids = set(run_ids)
+    target = ','.join(sorted(run_ids))
+    if dry_run and not os.path.exists(journal_path):
+        journal_path = os.devnull
+    journal = UploadLog(journal_path)
+    upload_log = UploadLog(upload_log_path) if upload_log_path else None
+    registration_log = UploadLog(registration_log_path) if registration_log_path else None
+    try:
+        plans = [entry for entry in journal.entries if entry.get('kind') == 'plan' and entry.get('target') == target]
+        if plans:
+            rollback_id, plan = plans[-1]['run_id'], plans[-1]['plan']
+            # Plans journaled before not-found and ambiguous uploads were told apart are left for review
+            plan.setdefault('not_found', [])
+            plan.setdefault('ambiguous', [{'key': key} for key in plan.get('unresolved', [])])
+            print(f"Resuming rollback {rollback_id} of {target}")
+        else:
+            rollback_id = new_run_id()
+            collected = RollbackPlan(orkg, protected_resource_ids(mapping_paths), workers)
+            if upload_log is not None:
+                collected.add_uploads(uploads_to_roll_back(upload_log, run_ids))
+            if registration_log is not None:
+                collected.registered = [entry['resource_id'] for entry in created_resources(registration_log, run_ids)]
+            plan = collected.as_dict()
+        print(f"Rollback of {target}: {len(plan['contributions'])} contributions with {len(plan['statements'])} statements "
+              f"and {len(plan['resources'])} resources, {len(plan['registered'])} registered materials and reactants; "
+              f"{len(plan['not_found'])} uploads not found in ORKG, {len(plan['ambiguous'])} ambiguous.")
+        if dry_run:
+            for contribution in plan['contributions']:
+                print(f"Would delete {contribution['resource_id']} (Contribution {contribution['contribution_id']} of paper {contribution['paper_id']})")
+            for resource_id in plan['registered']:
+                print(f"Would delete registered resource {resource_id}")
+            return 0
+        if not plans:
+            journal.record(run_id=rollback_id, kind='plan', target=target, plan=plan)
+
+        statuses = execute(orkg, journal, rollback_id, 'statements', plan['statements'], workers, batch_size)
+        statuses.update(execute(orkg, journal, rollback_id, 'resources', plan['resources'], workers, batch_size))
+        statuses.update(execute(orkg, journal, rollback_id, 'resources', plan['registered'], workers, batch_size))
+        kept = {thing_id: status for thing_id, status in statuses.items() if status not in DONE_STATUSES}
+        for thing_id, status in kept.items():
+            print(f"Not deleted: {thing_id} ({status})")
+
+        removed = [c for c in plan['contributions'] if statuses.get(c['resource_id']) in DONE_STATUSES]
+        # Uploads not found in ORKG are gone already, so their local records are dropped like the deleted ones
+        removed_keys = {c['key'] for c in removed + plan['not_found']}
+        removed_ids = {resource_id for resource_id in plan['registered'] if statuses.get(resource_id) in DONE_STATUSES}
+        update_local_records(rollback_id, removed + plan['not_found'], removed_keys, removed_ids, upload_log, registration_log,
+                             records_path, mapping_paths, label_index_path)
+        for upload in plan['ambiguous']:
+            print(f"Needs manual review, left as it is: {upload['key']}"
+                  + (f" (Contribution {upload['contribution_id']} of paper {upload['paper_id']})" if 'paper_id' in upload else ''))
+        print(f"Rollback {rollback_id} finished: {len(removed)} contributions and {len(removed_ids)} registered resources removed, "
+              f"{len(kept)} deletes not done; the journal is {journal_path}")
+        return len(kept)
+    finally:
+        journal.close()
+        if upload_log is not None:
+            upload_log.close()
+        if registration_log is not None:
+            registration_log.close()
+
+
+def rewrite_csv(path, keep):
+    """ Rewrite a CSV file with only the rows for which keep(row) is true, atomically. """
+    if not path or not os.path.exists(path):
+        return
+    data = pd.read_csv(path)
+    kept = data[data.apply(keep, axis=1)] if len(data) else data
+    temporary_path = path + '.tmp'
+    kept.to_csv(temporary_path, index=False)
+    os.replace(temporary_path, path)
+    print(f"{len(data) - len(kept)} rows removed from {path}")
+
+
+def update_local_records(rollback_id, removed, removed_keys, removed_ids, upload_log, registration_log,
+                         records_path, mapping_paths, label_index_path):
+    """ Mark the rolled back uploads and registrations in the logs and drop them from the recorded files. """
+    if upload_log is not None:
+        for key in removed_keys:
+            upload_log.record(run_id=rollback_id, key=key, status='rolled back')
+    if registration_log is not None:
+        for entry in registration_log.latest_entries().values():
+            if entry.get('resource_id') in removed_ids:
+                registration_log.record(run_id=rollback_id, key=entry['key'], resource_id=entry['resource_id'], status='rolled back')
+    contributions = {(str(c['paper_id']), int(c['contribution_id'])) for c in removed}
+    rewrite_csv(records_path, lambda row: (str(row['paper id']), int(row['contribution id'])) not in contributions)
+    for path in mapping_paths:
+        rewrite_csv(path, lambda row: row['ORKG Resource ID'] not in removed_ids)
+    if label_index_path and removed_ids:
+        resolver = LabelResolver(label_index_path)
+        resolver.remove_ids(removed_ids)
+        resolver.close()
+
+
+def delete_resources(orkg, resource_ids, journal_path, workers=8, batch_size=100, dry_run=False):
+    """ Delete a list of resource IDs (e.g. from an older records file) concurrently, journaled like a rollback. """
+    print(f"{len(resource_ids)} resources to delete")
+    if dry_run:
+        return 0
+    journal = UploadLog(journal_path)
+    try:
+        statuses = execute(orkg, journal, new_run_id(), 'resources', list(dict.fromkeys(resource_ids)), workers, batch_size)
+        kept = {thing_id: status for thing_id, status in statuses.items() if status not in DONE_STATUSES}
+        for thing_id, status in kept.items():
+            print(f"Not deleted: {thing_id} ({status})")
+        return len(kept)
+    finally:
+        journal.close()
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_AGE_DAYS = 180
+
+
+class ReplayMiss(Exception):
+    """ Raised in read-only replay mode when a request is not in the cache. """
+
+
+def request_cache_key(request):
+    """ Content hash of everything that determines a chat completion's answer. """
+    messages = request.get('messages', [])
+    key_fields = {
+        'model': request.get('model'),
+        # In order: [system, user, system] and [system, system, user] are different prompts
+        'messages': [[m.get('role'), m['content']] for m in messages],
+        'temperature': request.get('temperature'),
+        'seed': request.get('seed'),
+        'response_format': request.get('response_format'),
+    }
+    encoded = json.dumps(key_fields, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of LLM responses keyed by request_cache_key.
+    Entries older than `max_age_days` are dropped and the least recently used entries are evicted
+    once the stored responses exceed `max_bytes`. In `read_only` mode nothing is written and a miss
+    raises ReplayMiss, so a replayed run never calls the API.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS, read_only=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        # Chunk requests may use the cache from several threads, so access is serialized by a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, model TEXT, content TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created_at REAL NOT NULL, last_used_at REAL NOT NULL)'
+        )
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self.connection.commit()
+        if not read_only:
+            self.evict()
+
+    def get(self, request):
+        with self.lock:
+            return self._get(request)
+
+    def _get(self, request):
+        key = request_cache_key(request)
+        row = self.connection.execute('SELECT content FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            if self.read_only:
+                raise ReplayMiss(f"Request {key[:12]} is not in the response cache")
+            return None
+        self.hits += 1
+        if not self.read_only:
+            self.connection.execute('UPDATE responses SET last_used_at = ? WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+        return row[0]
+
+    def put(self, request, content):
+        if self.read_only or content is None:
+            return
+        now = time.time()
+        with self.lock:
+            self._put(request, content, now)
+
+    def _put(self, request, content, now):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO responses (key, model, content, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (request_cache_key(request), request.get('model'), content, len(content.encode('utf-8')), now, now)
+        )
+        self.connection.commit()
+
+    def evict(self):
+        """ Drop expired entries, then least recently used ones until the cache fits in max_bytes. Returns the number removed. """
+        removed = 0
+        if self.max_age_days:
+            cursor = self.connection.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.max_age_days * 86400,))
+            removed += cursor.rowcount
+        if self.max_bytes:
+            total = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                stale_keys = []
+                for key, size in self.connection.execute('SELECT key, size FROM responses ORDER BY last_used_at'):
+                    if total <= self.max_bytes:
+                        break
+                    stale_keys.append((key,))
+                    total -= size
+                self.connection.executemany('DELETE FROM responses WHERE key = ?', stale_keys)
+                removed += len(stale_keys)
+        self.connection.commit()
+        return removed
+
+    def stats(self):
+        entries, size = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        totals = dict(self.connection.execute('SELECT name, value FROM counters').fetchall())
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'total_hits': totals.get('hits', 0) + self.hits,
+            'total_misses': totals.get('misses', 0) + self.misses,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def close(self):
+        # Keep lifetime hit/miss counters next to the entries
+        if not self.read_only:
+            for name, value in (('hits', self.hits), ('misses', self.misses)):
+                self.connection.execute(
+                    'INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                    (name, value)
+                )
+            self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,338 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+# Upper bounds (USD) of the per-row cost histogram buckets
+COST_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25]
+
+# USD per million tokens (input, cached input, output); models missing here are reported without a cost
+MODEL_PRICES = {
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4.1': (2.00, 0.50, 8.00),
+    'gpt-4.1-mini': (0.40, 0.10, 1.60),
+}
+
+# Resource, paper and statement IDs in URL paths, so e.g. all resource lookups share one endpoint
+ID_PATTERN = re.compile(r'/(R|P|C|S|L)\d+(?=/|$)')
+
+
+def endpoint_name(method, url):
+    """ 'GET /api/resources/{id}' for 'GET https://orkg.org/api/resources/R123/?q=x'. """
+    path = re.sub(r'^[a-z]+://[^/]+', '', url).split('?', 1)[0].rstrip('/') or '/'
+    return f"{method} {ID_PATTERN.sub('/{id}', path)}"
+
+
+class Histogram:
+    """ Cumulative-bucket histogram in the Prometheus sense: bucket counts, sum and count. """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+        self.sum += value
+        self.count += 1
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class RunMetrics:
+    """
+    Thread-safe collector for one run: request latencies, HTTP status tallies and retries per client
+    and endpoint, LLM answers repaired locally, LLM token usage and cost per row, and wall time and throughput per stage.
+    Collecting is always on and cheap; nothing is written unless write() is called.
+    """
+
+    def __init__(self, script=''):
+        self.script = script
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.latencies = {}   # (client, endpoint) -> Histogram
+        self.statuses = {}    # (client, endpoint, status) -> count
+        self.retries = {}     # (client, reason) -> count
+        self.repairs = {}     # defect -> count
+        self.tokens = {}      # (model, kind) -> count
+        self.costs = {}       # model -> USD
+        self.rows = {}        # row label -> {'rows', 'requests', 'prompt_tokens', 'completion_tokens', 'cost'}
+        self.stages = {}      # stage -> {'seconds', 'rows', 'runs'}
+
+    def observe_request(self, client, endpoint, seconds, status):
+        with self.lock:
+            histogram = self.latencies.get((client, endpoint))
+            if histogram is None:
+                histogram = self.latencies[(client, endpoint)] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(seconds)
+            key = (client, endpoint, str(status))
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def count_retry(self, client, reason, amount=1):
+        if not amount:
+            return
+        with self.lock:
+            self.retries[(client, reason)] = self.retries.get((client, reason), 0) + amount
+
+    def count_repair(self, defect):
+        with self.lock:
+            self.repairs[defect] = self.repairs.get(defect, 0) + 1
+
+    def record_usage(self, model, usage, label='', rows=1, estimate=None):
+        """
+        Add the token usage of one completion (`completion.usage`) to the totals and to the row(s) it
+        was made for. `rows` is the number of data rows the label covers, e.g. all processes of a paper.
+        `estimate` is the locally counted (cached, uncached) input tokens of the request, if known.
+        """
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+        cost = usage_cost(model, prompt_tokens, cached_tokens, completion_tokens)
+        amounts = [('prompt', prompt_tokens), ('cached', cached_tokens), ('uncached', prompt_tokens - cached_tokens), ('completion', completion_tokens)]
+        if estimate is not None:
+            amounts += [('estimated cached', estimate[0]), ('estimated uncached', estimate[1])]
+        with self.lock:
+            for kind, amount in amounts:
+                self.tokens[(model, kind)] = self.tokens.get((model, kind), 0) + amount
+            if cost is not None:
+                self.costs[model] = self.costs.get(model, 0.0) + cost
+            entry = self.rows.setdefault(label, {'rows': rows, 'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0, 'cost': 0.0})
+            entry['requests'] += 1
+            entry['prompt_tokens'] += prompt_tokens
+            entry['cached_tokens'] += cached_tokens
+            entry['completion_tokens'] += completion_tokens
+            entry['cost'] += cost or 0.0
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """ Time a stage; set `.rows` on the yielded object if the row count is only known at the end. """
+        progress = StageProgress(rows)
+        started = time.monotonic()
+        try:
+            yield progress
+        finally:
+            seconds = time.monotonic() - started
+            with self.lock:
+                entry = self.stages.setdefault(name, {'seconds': 0.0, 'rows': 0, 'runs': 0})
+                entry['seconds'] += seconds
+                entry['rows'] += progress.rows or 0
+                entry['runs'] += 1
+
+    def report(self):
+        with self.lock:
+            per_row = [entry['cost'] / entry['rows'] for entry in self.rows.values() for _ in range(entry['rows'])]
+            row_costs = Histogram(COST_BUCKETS)
+            for cost in per_row:
+                row_costs.observe(cost)
+            total_rows = sum(entry['rows'] for entry in self.rows.values())
+            return {
+                'script': self.script,
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+                'wall_seconds': round(time.time() - self.started_at, 3),
+                'stages': {
+                    name: dict(entry, seconds=round(entry['seconds'], 3),
+                               rows_per_second=round(entry['rows'] / entry['seconds'], 2) if entry['seconds'] and entry['rows'] else None)
+                    for name, entry in self.stages.items()
+                },
+                'requests': [
+                    dict(client=client, endpoint=endpoint, latency=histogram.as_dict(),
+                         statuses={status: count for (c, e, status), count in self.statuses.items() if (c, e) == (client, endpoint)})
+                    for (client, endpoint), histogram in sorted(self.latencies.items())
+                ],
+                'retries': [dict(client=client, reason=reason, count=count) for (client, reason), count in sorted(self.retries.items())],
+                'repairs': dict(sorted(self.repairs.items())),
+                'tokens': [dict(model=model, kind=kind, count=count) for (model, kind), count in sorted(self.tokens.items())],
+                'prompt_cache': {
+                    model: {
+                        'cached_share': share(self.tokens.get((model, 'cached'), 0), self.tokens.get((model, 'prompt'), 0)),
+                        'estimated_cached_share': share(self.tokens.get((model, 'estimated cached'), 0),
+                                                        self.tokens.get((model, 'estimated cached'), 0) + self.tokens.get((model, 'estimated uncached'), 0)),
+                    }
+                    for model in sorted({model for model, _ in self.tokens})
+                },
+                'cost_usd': {model: round(cost, 6) for model, cost in self.costs.items()},
+                'llm_rows': {
+                    'rows': total_rows,
+                    'cost_per_row': round(sum(per_row) / total_rows, 6) if total_rows else None,
+                    'cost_histogram': row_costs.as_dict(),
+                    'by_label': {label: dict(entry, cost=round(entry['cost'], 6)) for label, entry in self.rows.items()},
+                },
+            }
+
+    def prometheus_text(self, report=None):
+        """ The report in the Prometheus text exposition format, for the node exporter's textfile collector. """
+        report = report or self.report()
+        job = {'script': self.script}
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def sample(name, labels, value):
+            lines.append(f"{name}{format_labels(dict(job, **labels))} {value}")
+
+        def histogram(name, labels, data):
+            for bound, count in data['buckets'].items():
+                sample(f"{name}_bucket", dict(labels, le=bound), count)
+            sample(f"{name}_bucket", dict(labels, le='+Inf'), data['count'])
+            sample(f"{name}_sum", labels, data['sum'])
+            sample(f"{name}_count", labels, data['count'])
+
+        family('ald_request_duration_seconds', 'histogram', 'Latency of ORKG and OpenAI requests.')
+        for entry in report['requests']:
+            histogram('ald_request_duration_seconds', {'client': entry['client'], 'endpoint': entry['endpoint']}, entry['latency'])
+        family('ald_responses_total', 'counter', 'Responses by HTTP status.')
+        for entry in report['requests']:
+            for status, count in entry['statuses'].items():
+                sample('ald_responses_total', {'client': entry['client'], 'endpoint': entry['endpoint'], 'status': status}, count)
+        family('ald_retries_total', 'counter', 'Retried requests by reason.')
+        for entry in report['retries']:
+            sample('ald_retries_total', {'client': entry['client'], 'reason': entry['reason']}, entry['count'])
+        family('ald_llm_repairs_total', 'counter', 'Defects of LLM answers repaired locally instead of re-requested.')
+        for defect, count in report['repairs'].items():
+            sample('ald_llm_repairs_total', {'defect': defect}, count)
+        family('ald_llm_tokens_total', 'counter', 'LLM tokens used, by model and kind.')
+        for entry in report['tokens']:
+            sample('ald_llm_tokens_total', {'model': entry['model'], 'kind': entry['kind']}, entry['count'])
+        family('ald_llm_prompt_cached_share', 'gauge', 'Share of input tokens served from the prompt cache.')
+        for model, entry in report['prompt_cache'].items():
+            if entry['cached_share'] is not None:
+                sample('ald_llm_prompt_cached_share', {'model': model}, entry['cached_share'])
+        family('ald_llm_cost_usd_total', 'counter', 'Estimated LLM cost in USD.')
+        for model, cost in report['cost_usd'].items():
+            sample('ald_llm_cost_usd_total', {'model': model}, cost)
+        family('ald_llm_row_cost_usd', 'histogram', 'Estimated LLM cost per extracted row in USD.')
+        histogram('ald_llm_row_cost_usd', {}, report['llm_rows']['cost_histogram'])
+        family('ald_stage_duration_seconds', 'gauge', 'Wall time per stage.')
+        for name, entry in report['stages'].items():
+            sample('ald_stage_duration_seconds', {'stage': name}, entry['seconds'])
+        family('ald_stage_rows', 'gauge', 'Rows processed per stage.')
+        for name, entry in report['stages'].items():
+            sample('ald_stage_rows', {'stage': name}, entry['rows'])
+        family('ald_stage_rows_per_second', 'gauge', 'Throughput per stage.')
+        for name, entry in report['stages'].items():
+            if entry['rows_per_second'] is not None:
+                sample('ald_stage_rows_per_second', {'stage': name}, entry['rows_per_second'])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, report_path):
+        """
+        Write the JSON run report to `report_path` and the Prometheus textfile next to it (same name, .prom).
+        Both are replaced atomically, so a collector never reads a half-written file.
+        """
+        report = self.report()
+        prom_path = os.path.splitext(report_path)[0] + '.prom'
+        write_atomically(report_path, json.dumps(report, indent=2, ensure_ascii=False))
+        write_atomically(prom_path, self.prometheus_text(report))
+        print(f"Run metrics written to {report_path} and {prom_path}")
+        return report
+
+
+class StageProgress:
+    def __init__(self, rows=None):
+        self.rows = rows
+
+
+def share(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def usage_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    # Dated snapshots (e.g. gpt-4o-2024-08-06) are priced like their base model
+    prices = MODEL_PRICES.get(model) or next((MODEL_PRICES[name] for name in sorted(MODEL_PRICES, key=len, reverse=True) if model.startswith(name + '-')), None)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price + completion_tokens * output_price) / 1e6
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        key + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def write_atomically(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(temporary_path, path)
+
+
+def instrument_session(session, metrics, client='orkg'):
+    """
+    Time every request of a requests session. urllib3 retries happen inside one call, so they are
+    counted from the retry history of the final response.
+    """
+    def on_response(response, *args, **kwargs):
+        metrics.observe_request(client, endpoint_name(response.request.method, response.request.url),
+                                response.elapsed.total_seconds(), response.status_code)
+        retries = getattr(getattr(response.raw, 'retries', None), 'history', ())
+        metrics.count_retry(client, 'http', len(retries))
+    session.hooks['response'].append(on_response)
+    return session
+
+
+def instrument_orkg(orkg, metrics):
+    """
+    Instrument the session an ORKG client sends its API requests through. The API root is spawned from
+    `orkg.core` when the client is created and keeps the session `orkg.core` had at that time.
+    """
+    return instrument_session(orkg.backend._session, metrics, 'orkg')
+
+
+def create_completion(client, request, metrics, client_name='openai'):
+    """ client.chat.completions.create(**request), timed and tallied under `client_name`, e.g. the LLM backend. """
+    started = time.monotonic()
+    try:
+        response = client.chat.completions.with_raw_response.create(**request)
+    except Exception as e:
+        metrics.observe_request(client_name, 'POST /chat/completions', time.monotonic() - started, getattr(e, 'status_code', 'error'))
+        raise
+    return _parsed_completion(response, started, metrics, client_name)
+
+
+async def create_completion_async(client, request, metrics, client_name='openai'):
+    """ The same as create_completion, for an AsyncOpenAI client. """
+    started = time.monotonic()
+    try:
+        response = await client.chat.completions.with_raw_response.create(**request)
+    except Exception as e:
+        metrics.observe_request(client_name, 'POST /chat/completions', time.monotonic() - started, getattr(e, 'status_code', 'error'))
+        raise
+    return _parsed_completion(response, started, metrics, client_name)
+
+
+def _parsed_completion(response, started, metrics, client_name):
+    # The SDK retries rate limits and server errors on its own; those attempts are part of the latency
+    metrics.observe_request(client_name, 'POST /chat/completions', time.monotonic() - started, response.status_code)
+    metrics.count_retry(client_name, 'http', getattr(response, 'retries_taken', 0))
+    return response.parse()
+
+
+# The process-wide collector the scripts record into
+METRICS = RunMetrics()
@@ -1,7 +1,18 @@
+import os
+import sys
 import pandas as pd
-from orkg import ORKG
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import orkg_client
+from resource_rollback import contribution_statements
+
+RESULT_COLUMNS = ['Name', 'ORKG Resource ID', 'Kind', 'Observatory ID', 'Organization ID',
+                  'Previous Observatory ID', 'Previous Organization ID', 'Status', 'Detail']
+# Results that need no further call as long as the target observatory and organization stay the same
+DONE_STATUSES = {'updated', 'unchanged'}
+
 def read_resources_from_csv(file_path):
     """ Read the CSV file containing resource information. """
     return pd.read_csv(file_path)
@@ -21,15 +32,136 @@ def update_resources(orkg, data, new_obs, new_org):
             except Exception as e:
                 print(f"Failed to update Resource {row['Name']} with ID {row['ORKG Resource ID']}: {e}")
 
+def collect_resources(orkg, data, workers):
+    """
+    (name, resource ID, kind) of the resources listed in an input file: a materials or reactants output
+    file of 2-add-material-and-reactants-to-orkg.py, or a recorded contributions file of the upload
+    script, whose papers are listed together with their contributions (looked up by label, as the file
+    only holds the contribution number).
+    """
+    if 'ORKG Resource ID' in data.columns:
+        processed = data[data['Status'] == 'Processed']
+        return [(row['Name'], str(row['ORKG Resource ID']), 'resource') for _, row in processed.iterrows()]
+    if 'contribution resource id' in data.columns:
+        # Records of the older upload script
+        return [(resource_id, resource_id, 'contribution') for resource_id in data['contribution resource id'].dropna().astype(str)]
+    papers = {}
+    for _, row in data.iterrows():
+        papers.setdefault(str(row['paper id']), set()).add(f"Contribution {int(row['contribution id'])}")
+    resources = [(paper_id, paper_id, 'paper') for paper_id in papers]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for paper_id, by_label in zip(papers, executor.map(lambda paper_id: contribution_statements(orkg, paper_id), papers)):
+            for label in sorted(papers[paper_id]):
+                matches = by_label.get(label, [])
+                if len(matches) == 1:
+                    resources.append((f"{label} of {paper_id}", matches[0]['object']['id'], 'contribution'))
+                else:
+                    print(f"Skipping {label} of paper {paper_id}: {len(matches)} contributions with this label")
+    return resources
+
+def fetch_ownership(orkg, resource_id):
+    """ Returns (observatory ID, organization ID, error); the error is None if the resource was found. """
+    try:
+        response = orkg.resources.by_id(resource_id)
+    except Exception as e:
+        return None, None, str(e)
+    if not response.succeeded:
+        return None, None, f"Status Code: {response.status_code}"
+    return response.content.get('observatory_id'), response.content.get('organization_id'), None
+
+def assign_observatory(orkg, resource_id, new_obs, new_org):
+    """ The PUT of resources.update_observatory, without its exists() call and without fetching the result. """
+    # A spawned endpoint of its own, so that the trailing slash setting does not race with other threads
+    endpoint = orkg.backend.resources(resource_id)
+    endpoint._append_slash = False
+    try:
+        response = endpoint.PUT(json={'observatory_id': new_obs, 'organization_id': new_org}, headers=orkg.resources.auth)
+    except Exception as e:
+        return str(e)
+    return None if response.ok else f"Status Code: {response.status_code} {response.text[:200]}"
+
+def load_results(result_path, new_obs, new_org):
+    """ IDs of the resources a previous run already moved to (or found in) the target observatory and organization. """
+    if not os.path.exists(result_path):
+        return set()
+    results = pd.read_csv(result_path, dtype=str)
+    done = results[(results['Observatory ID'] == new_obs) & (results['Organization ID'] == new_org)
+                   & results['Status'].isin(DONE_STATUSES)]
+    return set(done['ORKG Resource ID'])
+
+def append_results(results, result_path):
+    write_header = not os.path.exists(result_path) or os.path.getsize(result_path) == 0
+    pd.DataFrame(results, columns=RESULT_COLUMNS).to_csv(result_path, mode='a', header=write_header, index=False)
+
+def reassign_resources(orkg, resources, new_obs, new_org, result_path, workers=8, batch_size=100):
+    """
+    Move resources to a new observatory and organization, calling the API only where needed: the current
+    ownership is fetched concurrently in batches, and only the resources that differ are updated.
+    Every result is appended to `result_path`; resources it lists as done for the same target are skipped,
+    so a rerun only retries failures. Returns the number of failures.
+    """
+    done = load_results(result_path, new_obs, new_org)
+    pending = list({resource_id: (name, resource_id, kind) for name, resource_id, kind in resources if resource_id not in done}.values())
+    print(f"{len(done)} resources already done, {len(pending)} to check with {workers} workers.")
+
+    def result(name, resource_id, kind, previous, status, detail=''):
+        return {'Name': name, 'ORKG Resource ID': resource_id, 'Kind': kind, 'Observatory ID': new_obs, 'Organization ID': new_org,
+                'Previous Observatory ID': previous[0], 'Previous Organization ID': previous[1], 'Status': status, 'Detail': detail}
+
+    to_update = []
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            results = []
+            for (name, resource_id, kind), (obs, org, error) in zip(batch, executor.map(lambda item: fetch_ownership(orkg, item[1]), batch)):
+                if error is not None:
+                    results.append(result(name, resource_id, kind, ('', ''), 'failed', error))
+                    failed += 1
+                elif (obs, org) == (new_obs, new_org):
+                    results.append(result(name, resource_id, kind, (obs, org), 'unchanged'))
+                else:
+                    to_update.append((name, resource_id, kind, (obs, org)))
+            append_results(results, result_path)
+        print(f"{len(pending) - len(to_update) - failed} resources unchanged, {len(to_update)} to update, {failed} not found or failed.")
+
+        for start in range(0, len(to_update), batch_size):
+            batch = to_update[start:start + batch_size]
+            results = []
+            for (name, resource_id, kind, previous), error in zip(batch, executor.map(lambda item: assign_observatory(orkg, item[1], new_obs, new_org), batch)):
+                if error is None:
+                    results.append(result(name, resource_id, kind, previous, 'updated'))
+                else:
+                    results.append(result(name, resource_id, kind, previous, 'failed', error))
+                    failed += 1
+            append_results(results, result_path)
+            print(f"{start + len(batch)} of {len(to_update)} resources updated")
+    print(f"Reassignment finished with {failed} failures; results are in {result_path}")
+    return failed
+
 def main():
     host_address = input("Enter the ORKG host address: ")
     email = input("Enter your ORKG email address: ")
     password = getpass("Enter your ORKG password: ")
-    input_file_path = input("Enter the path of the input CSV file: ")
+    mode = input("Enter the update mode (sequential/bulk) [sequential]: ").strip().lower() or 'sequential'
+    if mode == 'bulk':
+        input_file_paths = input("Enter the paths of the input CSV files, comma-separated (materials, reactants and/or recorded contributions): ")
+    else:
+        input_file_path = input("Enter the path of the input CSV file: ")
     new_obs = input("Enter the new observatory ID: ")
     new_org = input("Enter the new organization ID: ")
 
-    orkg = ORKG(host=host_address, creds=(email, password))
+    if mode == 'bulk':
+        workers = int(input("Enter the number of concurrent requests [8]: ").strip() or 8)
+        result_path = input("Enter the path of the result CSV file (e.g., data/8-orkg-observatory-reassignment.csv): ")
+        orkg = orkg_client(host_address, creds=(email, password), pool_size=max(workers, 10))
+        resources = []
+        for path in input_file_paths.split(','):
+            resources.extend(collect_resources(orkg, read_resources_from_csv(path.strip()), workers))
+        reassign_resources(orkg, resources, new_obs, new_org, result_path, workers)
+        return
+
+    orkg = orkg_client(host_address, creds=(email, password))
     resource_data = read_resources_from_csv(input_file_path)
     update_resources(orkg, resource_data, new_obs, new_org)
 
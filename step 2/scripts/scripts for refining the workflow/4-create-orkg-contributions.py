@@ -1,8 +1,13 @@
 import pandas as pd
 import json
-from orkg import ORKG, OID
+from orkg import OID
 import getpass  # Import getpass module for secure password input
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import orkg_client
+from template_cache import materialize_template
 
 def read_mapping(file_path):
     mapping_df = pd.read_csv(file_path)
@@ -59,12 +64,12 @@ def append_record_to_csv(record, output_file_path):
         # Append the record to the existing file
         pd.DataFrame([record]).to_csv(output_file_path, mode='a', header=False, index=False)
 
-def main(file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path):
+def main(file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path, template_cache_path=None):
     # Initialize ORKG client with user inputs
-    orkg = ORKG(host=orkg_host, creds=(orkg_email, orkg_password))
+    orkg = orkg_client(orkg_host, creds=(orkg_email, orkg_password))
     
-    # Materialize the specified template
-    orkg.templates.materialize_template(template_resource_id)
+    # Materialize the specified template, from the template cache if one is given
+    materialize_template(orkg, template_resource_id, template_cache_path)
 
     template = orkg.templates
     
@@ -146,5 +151,6 @@ if __name__ == "__main__":
     output_file_path = input("Enter the path for the output CSV file: ")
     reactant_mapping_path = input("Enter the path to the reactant mapping CSV file: ")
     material_mapping_path = input("Enter the path to the material mapping CSV file: ")
+    template_cache_path = input("Enter the template cache path (e.g., data/7-orkg-template-cache.json), leave empty to fetch the template from ORKG: ").strip()
     
-    main(csv_file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path)
+    main(csv_file_path, orkg_host, orkg_email, orkg_password, template_resource_id, output_file_path, reactant_mapping_path, material_mapping_path, template_cache_path)
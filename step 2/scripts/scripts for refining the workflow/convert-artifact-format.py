@@ -0,0 +1,14 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from columnar_store import convert_artifact
+
+# Converts the 4-, 5-, 6- and 7-* artifacts between CSV (for humans) and Parquet or Arrow IPC (for the pipeline).
+# The format of each file follows its extension: .parquet, .arrow/.feather or .csv
+if __name__ == "__main__":
+    input_path = input("Enter the path of the artifact to convert: ").strip()
+    output_path = input("Enter the path of the converted file (.parquet, .arrow, .feather or .csv): ").strip()
+
+    rows = convert_artifact(input_path, output_path)
+    print(f"{rows} rows converted from {input_path} to {output_path}")
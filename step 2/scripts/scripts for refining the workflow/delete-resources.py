@@ -1,6 +1,11 @@
 import csv
 import getpass  # Import getpass module for secure password input
-from orkg import ORKG
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import orkg_client
+from resource_rollback import delete_resources, rollback_runs
 
 def read_resource_ids(input_file):
     resource_ids = []
@@ -12,30 +17,47 @@ def read_resource_ids(input_file):
             resource_ids.append(resource_id)
     return resource_ids
 
-def process_resource_ids(orkg_host, orkg_email, orkg_password, resource_ids):
-    orkg = ORKG(host=orkg_host, creds=(orkg_email, orkg_password))
-    # Placeholder function to process each resource ID
-    for resource_id in resource_ids:
-        print(f"Processing resource ID: {resource_id}")
-        # Add your specific processing code here
-        if orkg.resources.exists(id=resource_id):
-            orkg.resources.delete(id=resource_id)
-        else:
-            print("resource does not exit")
+def process_resource_ids(orkg_host, orkg_email, orkg_password, resource_ids, journal_path='delete-resources-journal.jsonl', workers=8, dry_run=False):
+    # Deletes are sent right away, concurrently; a resource that is already gone (404) counts as deleted
+    orkg = orkg_client(orkg_host, creds=(orkg_email, orkg_password), pool_size=max(workers, 10))
+    return delete_resources(orkg, resource_ids, journal_path, workers, dry_run=dry_run)
+
+def optional_path(prompt):
+    return input(prompt).strip() or None
 
 if __name__ == "__main__":
-    # Prompt user for input file path
-    input_file = input("Please enter the path to the input CSV file: ").strip()
+    mode = input("Delete by upload run ID or from a CSV file of resource IDs? (run/csv) [run]: ").strip().lower() or 'run'
+    if mode == 'csv':
+        # Prompt user for input file path
+        input_file = input("Please enter the path to the input CSV file: ").strip()
+    else:
+        run_ids = [run_id.strip() for run_id in input("Enter the upload and/or registration run IDs to roll back (comma-separated): ").split(',') if run_id.strip()]
+        upload_log_path = optional_path("Enter the upload log path (e.g., data/7-orkg-upload-log.jsonl): ")
+        records_path = optional_path("Enter the recorded contributions CSV path (e.g., data/7-recorded-orkg-contributions.csv): ")
+        registration_log_path = optional_path("Enter the registration log path (e.g., data/5-orkg-registration-log.jsonl, leave empty to keep materials and reactants): ")
+        mapping_paths = [path for path in (
+            optional_path("Enter the reactants output CSV path (e.g., data/5-orkg-added-reactants.csv): "),
+            optional_path("Enter the materials output CSV path (e.g., data/5-orkg-added-materials.csv): "),
+        ) if path]
+        label_index_path = optional_path("Enter the label index file path (e.g., data/5-orkg-label-index.jsonl, leave empty if not used): ")
+    journal_path = input("Enter the rollback journal path [data/8-orkg-rollback-journal.jsonl]: ").strip() or 'data/8-orkg-rollback-journal.jsonl'
+    workers = int(input("Enter the number of concurrent requests [8]: ").strip() or 8)
+    dry_run = input("Dry run, only list what would be deleted? (yes/no) [yes]: ").strip().lower() in ('', 'y', 'yes')
     orkg_host = input("Enter ORKG host URL: ")
     orkg_email = input("Enter your ORKG email: ")
-    orkg_password = getpass.getpass("Enter your ORKG password: ")  # Secure password input    
-    
+    orkg_password = getpass.getpass("Enter your ORKG password: ")  # Secure password input
+
     try:
-        resource_ids = read_resource_ids(input_file)
-        process_resource_ids(orkg_host, orkg_email, orkg_password, resource_ids)
-    except FileNotFoundError:
-        print(f"Error: The file '{input_file}' was not found.")
-    except KeyError:
-        print(f"Error: The file '{input_file}' does not have the required header 'contribution resource id'.")
+        if mode == 'csv':
+            resource_ids = read_resource_ids(input_file)
+            process_resource_ids(orkg_host, orkg_email, orkg_password, resource_ids, journal_path, workers, dry_run)
+        else:
+            orkg = orkg_client(orkg_host, creds=(orkg_email, orkg_password), pool_size=max(workers, 10))
+            rollback_runs(orkg, run_ids, journal_path, upload_log_path, registration_log_path, records_path,
+                          mapping_paths, label_index_path, workers, dry_run=dry_run)
+    except FileNotFoundError as e:
+        print(f"Error: The file '{e.filename}' was not found.")
+    except KeyError as e:
+        print(f"Error: The file does not have the required column {e}.")
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from template_cache import TemplateCache
+
+if __name__ == "__main__":
+    cache_path = input("Enter the template cache path (e.g., data/7-orkg-template-cache.json): ").strip()
+    cache = TemplateCache(cache_path)
+    if not cache.entries:
+        print("The template cache is empty.")
+        sys.exit(0)
+    print("Cached templates:")
+    for entry in cache.entries.values():
+        print(f"- {entry['template_id']} of {entry['host']}: version {entry['version']}, cached {entry['cached_at']}, {len(entry['responses'])} responses")
+    template_ids = [template_id.strip() for template_id in input("Enter the template IDs to invalidate (comma-separated), leave empty for all: ").split(',') if template_id.strip()]
+    host = input("Enter the ORKG host to invalidate them for, leave empty for every host: ").strip() or None
+    if template_ids:
+        dropped = sum(cache.invalidate(template_id, host) for template_id in template_ids)
+    else:
+        dropped = cache.invalidate(host=host)
+    print(f"{dropped} cached templates invalidated; they are fetched from ORKG again on the next run.")
@@ -0,0 +1,394 @@
+import argparse
+import importlib.util
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import pandas as pd
+
+# End-to-end throughput benchmark of the step 2 scripts against the local ORKG stand-in and the mock chat
+# completions server. For every dataset size a synthetic ALD dataset is generated, both servers are started,
+# and each stage runs in its own process, so that its peak memory can be measured:
+#   papers     1-create-paper-info-file-from-orkg.py     parallel DOI lookups
+#   resources  2-add-material-and-reactants-to-orkg.py   bulk registration of reactants and materials
+#   annotate   3-gpt-assistant-annotate.py               concurrent extraction
+#   upload     4-create-and-upload-orkg-contributions.py concurrent upload of schema-built contributions
+#   sync       4-create-and-upload-orkg-contributions.py delta sync of a few corrected, removed and added rows
+# Later stages read the outputs of earlier ones (paper IDs and mapping files), as in the workflow.
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(TESTING_DIR)
+SCHEMA_PATH = os.path.join(os.path.dirname(SCRIPTS_DIR), 'data', 'ald-schema_ver4.json')
+STAGES = ['papers', 'resources', 'annotate', 'template', 'upload', 'sync']
+PROCESSES_PER_PAPER = 4
+MATERIALS = ['Al2O3', 'HfO2', 'ZrO2', 'TiO2', 'ZnO', 'SiO2', 'TiN', 'Ta2O5', 'Pt', 'Ru', 'MoS2', 'Ga2O3', 'In2O3', 'NiO', 'Co3O4']
+REACTANTS = ['AlMe3', 'H2O', 'O3', 'O2 plasma', 'NH3', 'Hf(NEtMe)4', 'Zr(NMe2)4', 'Ti(NMe2)4', 'ZnEt2', 'TiCl4', 'H2S', 'N2 plasma']
+
+sys.path.insert(0, SCRIPTS_DIR)
+
+from fulltext_store import FullTextStoreWriter
+from run_metrics import METRICS, instrument_orkg
+from template_cache import TemplateCache
+from upload_log import UploadLog, new_run_id
+
+
+def load_script(file_name):
+    spec = importlib.util.spec_from_file_location(file_name[:-3].replace('-', '_'), os.path.join(SCRIPTS_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def dataset_paths(workdir):
+    names = {
+        'raw_data': '2-filtered-data.csv',
+        'full_texts': '2-full-texts.store',
+        'import_file': '3-orkg-csv-papers-import.csv',
+        'papers_info': '4-orkg-papers-info.csv',
+        'reactants': '5-orkg-added-reactants.csv',
+        'materials': '5-orkg-added-materials.csv',
+        'label_index': '5-orkg-label-index.jsonl',
+        'registration_log': '5-orkg-registration-log.jsonl',
+        'annotations': '6-gpt-annotations.csv',
+        'records': '6-gpt-annotated-records.txt',
+        'synthetic_annotations': '6-synthetic-annotations.csv',
+        'contributions': '7-recorded-orkg-contributions.csv',
+        'upload_log': '7-orkg-upload-log.jsonl',
+        'sync_log': '7-orkg-contribution-sync.jsonl',
+        'template_cache': '7-orkg-template-cache.json',
+        'corrected_annotations': '6-corrected-annotations.csv',
+    }
+    return {key: os.path.join(workdir, name) for key, name in names.items()}
+
+
+def generate_dataset(workdir, rows, text_length, full_text_store=False, seed=0):
+    """
+    A synthetic filtered ALD database export with `rows` processes, and its ORKG CSV import file. With
+    `full_text_store`, the full texts are put in a full-text store and left out of the export, as step 1 does.
+    """
+    rng = random.Random(seed)
+    # Label vocabularies grow with the dataset, like the long tail of the real database
+    materials = MATERIALS + [f"M{k}O{k % 3 + 1}" for k in range(max(rows // 50, 1))]
+    reactants = REACTANTS + [f"Precursor-{k}" for k in range(max(rows // 25, 1))]
+    filler = "Atomic layer deposition of thin films with self-limiting surface reactions. "
+
+    records = []
+    for process_id in range(rows):
+        paper = process_id // PROCESSES_PER_PAPER
+        doi = f"10.5555/ald-bench.{paper:07d}"
+        process_reactants = rng.sample(reactants, rng.choice([2, 2, 2, 3]))
+        records.append({
+            'process_id': process_id,
+            'process_material': rng.choice(materials),
+            'process_reactanta': process_reactants[0],
+            'process_reactantb': process_reactants[1],
+            'process_reactantc': process_reactants[2] if len(process_reactants) > 2 else None,
+            'process_reactantd': None,
+            'reference_doi': doi,
+            'full_text': (f"Synthetic article {doi}. " + filler * (text_length // len(filler) + 1))[:text_length],
+        })
+    paths = dataset_paths(workdir)
+    data = pd.DataFrame(records)
+    if full_text_store:
+        store = FullTextStoreWriter(paths['full_texts'])
+        store.add_frame(data)
+        store.close()
+        data = data.drop(columns=['full_text'])
+    data.to_csv(paths['raw_data'], index=False)
+    import_data = pd.DataFrame({'paper:doi': data['reference_doi'].drop_duplicates()})
+    import_data['paper:research_field'] = 'R254'
+    import_data.to_csv(paths['import_file'], index=False)
+    return paths
+
+
+def write_synthetic_annotations(paths, output_columns):
+    """ Annotations as written by the extraction script, with profiles that name each row's own material and reactants. """
+    data = pd.read_csv(paths['raw_data'])
+    papers = pd.read_csv(paths['papers_info']).rename(columns={'doi': 'reference_doi'})
+    data = data.merge(papers, on='reference_doi', how='left')
+    reactant_columns = ['process_reactanta', 'process_reactantb', 'process_reactantc', 'process_reactantd']
+    profiles = []
+    for row in data.itertuples(index=False):
+        reactants = ', '.join(getattr(row, column) for column in reactant_columns if isinstance(getattr(row, column), str))
+        profiles.append(json.dumps({
+            'process_parameters': {'reactants': [reactants], 'temperature_range': '150-300 °C', 'pressure_range': '-'},
+            'film_properties': {'material': row.process_material, 'film_thickness': '20 nm', 'refractive_index': '1.65'},
+            'process_characteristics': {'self_limiting_behavior': 'Yes', 'growth_per_cycle': '1.1 Å/cycle'},
+        }, ensure_ascii=False))
+    data['extracted_info'] = profiles
+    data[output_columns].to_csv(paths['synthetic_annotations'], index=False)
+
+
+def server_stats(url):
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+def stats_delta(before, after):
+    return {key: after[key] - before.get(key, 0) for key in after if after[key] != before.get(key, 0)}
+
+
+def orkg_client(orkg_url):
+    from http_client import orkg_client
+    # Both the API and the login go to the stand-in; it accepts any credentials
+    orkg = orkg_client(orkg_url, creds=('bench@example.org', 'bench'), auth_host=orkg_url, pool_size=16)
+    instrument_orkg(orkg, METRICS)
+    return orkg
+
+
+def run_papers(paths, args):
+    module = load_script('1-create-paper-info-file-from-orkg.py')
+    rows = len(pd.read_csv(paths['import_file']))
+    # No DOI cache and no login, so every DOI is looked up
+    return rows, lambda: module.fetch_paper_details_parallel(paths['import_file'], paths['papers_info'], '', '', args.orkg_url, args.workers, None)
+
+
+def run_resources(paths, args):
+    module = load_script('2-add-material-and-reactants-to-orkg.py')
+    orkg = orkg_client(args.orkg_url)
+    data = module.read_csv_with_encoding(paths['raw_data'])
+
+    def run():
+        index = module.load_label_index(paths['label_index'], [paths['reactants'], paths['materials']])
+        registration_log = UploadLog(paths['registration_log'])
+        run_id = new_run_id()
+        try:
+            module.register_items(orkg, data, module.REACTANT_COLUMNS, paths['reactants'], index, args.workers, registration_log, run_id)
+            module.register_items(orkg, data, module.MATERIAL_COLUMNS, paths['materials'], index, args.workers, registration_log, run_id)
+        finally:
+            index.close()
+            registration_log.close()
+    return len(data), run
+
+
+def run_annotate(paths, args):
+    os.environ['OPENAI_BASE_URL'] = args.chat_url + '/v1'
+    module = load_script('3-gpt-assistant-annotate.py')
+
+    def run():
+        _, _, combined_df = module.read_input_files(paths['materials'], paths['reactants'], paths['papers_info'], paths['raw_data'],
+                                                    paths['full_texts'] if args.full_text_store else None)
+        journal, processed_keys = module.open_processed_records(paths['records'], paths['annotations'])
+        try:
+            backends = module.load_backends(args.backends, 'bench') if args.backends else None
+            module.run_concurrent_extraction('bench', combined_df, processed_keys, journal, paths['annotations'], args.workers, None, None, backends=backends)
+        finally:
+            journal.close()
+    return len(pd.read_csv(paths['raw_data'], usecols=['process_id'])), run
+
+
+def materialize(orkg, paths, args, mode='check'):
+    # With a few attempts: a single injected error fails the whole materialization
+    cache = TemplateCache(paths['template_cache'], mode)
+    for attempt in range(5):
+        try:
+            cache.materialize(orkg, args.template_id)
+            break
+        except Exception as e:
+            print(f"Materializing the template failed ({e}), attempt {attempt + 1} of 5")
+    print(f"Materializing the template took {cache.requests} ORKG requests")
+    return orkg.templates
+
+
+def run_template(paths, args):
+    # The template is fetched into the cache first; the startup from the cache is measured
+    materialize(orkg_client(args.orkg_url), paths, args, 'refresh')
+    return 1, lambda: materialize(orkg_client(args.orkg_url), paths, args)
+
+
+def run_upload(paths, args):
+    module = load_script('4-create-and-upload-orkg-contributions.py')
+    extraction = load_script('3-gpt-assistant-annotate.py')
+    write_synthetic_annotations(paths, extraction.OUTPUT_COLUMNS)
+    orkg = orkg_client(args.orkg_url)
+    # Materialized before the measurement
+    template = materialize(orkg, paths, args)
+
+    def run():
+        data = module.read_annotations(paths['synthetic_annotations'])
+        reactant_mapping = module.read_mapping(paths['reactants'])
+        material_mapping = module.read_mapping(paths['materials'])
+        plan, payloads = module.prepare_payloads(template, data, SCHEMA_PATH, reactant_mapping, material_mapping, paths['contributions'])
+        module.upload_concurrently(orkg, template, data, reactant_mapping, material_mapping, paths['contributions'], paths['upload_log'], args.workers, plan, payloads)
+    return len(pd.read_csv(paths['synthetic_annotations'], usecols=['process_id'])), run
+
+
+def write_corrected_annotations(paths, share, seed=0):
+    """ The synthetic annotations after a routine correction: `share` of the rows changed, half as many removed and added. """
+    rng = random.Random(seed)
+    data = pd.read_csv(paths['synthetic_annotations'])
+    count = max(int(len(data) * share), 2)
+    changed = rng.sample(list(data.index), count)
+    for index in changed:
+        profile = json.loads(data.at[index, 'extracted_info'])
+        profile['film_properties']['film_thickness'] = f"{rng.randint(5, 90)} nm"
+        data.at[index, 'extracted_info'] = json.dumps(profile, ensure_ascii=False)
+    removed = data.drop(changed).sample(count // 2, random_state=seed).index
+    added = data.loc[removed].copy()
+    added['process_id'] = added['process_id'] + len(data)
+    data = pd.concat([data.drop(removed), added], ignore_index=True)
+    data.to_csv(paths['corrected_annotations'], index=False)
+    return count, count // 2
+
+
+def run_sync(paths, args):
+    module = load_script('4-create-and-upload-orkg-contributions.py')
+    orkg = orkg_client(args.orkg_url)
+    template = materialize(orkg, paths, args)
+    reactant_mapping = module.read_mapping(paths['reactants'])
+    material_mapping = module.read_mapping(paths['materials'])
+
+    def sync(annotations_path):
+        data = module.read_annotations(annotations_path)
+        plan, payloads = module.prepare_payloads(template, data, SCHEMA_PATH, reactant_mapping, material_mapping, paths['contributions'])
+        return module.sync_contributions(orkg, template, data, reactant_mapping, material_mapping, paths['contributions'],
+                                         paths['upload_log'], paths['sync_log'], args.workers, plan, payloads)
+
+    # The contributions of the upload stage are taken into the sync log first, outside the measurement
+    sync(paths['synthetic_annotations'])
+    changed, removed = write_corrected_annotations(paths, args.correction_share)
+    print(f"{changed} rows changed, {removed} removed and {removed} added")
+
+    def run():
+        sync(paths['corrected_annotations'])
+    return len(pd.read_csv(paths['corrected_annotations'], usecols=['process_id'])), run
+
+
+STAGE_RUNNERS = {'papers': run_papers, 'resources': run_resources, 'annotate': run_annotate, 'template': run_template, 'upload': run_upload, 'sync': run_sync}
+
+
+def run_stage(stage, workdir, args):
+    """
+    Run one stage in this process and write its measurements to <workdir>/<stage>-result.json, and the
+    client-side run metrics (latencies, statuses, retries, tokens) to <workdir>/<stage>-metrics.json and .prom.
+    """
+    paths = dataset_paths(workdir)
+    rows, run = STAGE_RUNNERS[stage](paths, args)
+    stats_url = f"{args.chat_url}/v1/stats" if stage == 'annotate' else f"{args.orkg_url}/stand-in/stats"
+    before = server_stats(stats_url)
+    started = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - started
+    # The stand-in counts requests per endpoint, the mock chat server in total
+    counts = stats_delta(before, server_stats(stats_url))
+    if stage != 'annotate':
+        counts = {key: count for key, count in counts.items() if ' /' in key or key == 'injected errors'}
+    result = {
+        'stage': stage,
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(rows / seconds, 1) if seconds else None,
+        'requests': counts.get('requests', sum(count for key, count in counts.items() if ' /' in key)),
+        'request_counts': counts,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_memory_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    with open(os.path.join(workdir, f"{stage}-result.json"), 'w', encoding='utf-8') as file:
+        json.dump(result, file)
+    METRICS.script = f"benchmark {stage}"
+    METRICS.write(os.path.join(workdir, f"{stage}-metrics.json"))
+
+
+def start_server(command, stats_url, log_path):
+    log = open(log_path, 'w')
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    for _ in range(100):
+        try:
+            server_stats(stats_url)
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited, see {log_path}")
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Server did not start, see {log_path}")
+
+
+def benchmark_size(rows, workdir, args):
+    os.makedirs(workdir, exist_ok=True)
+    # Outputs of an earlier benchmark would be resumed from instead of being rebuilt
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    paths = generate_dataset(workdir, rows, args.text_length, args.full_text_store)
+    orkg_port = int(args.orkg_url.rsplit(':', 1)[1])
+    chat_port = int(args.chat_url.rsplit(':', 1)[1])
+    servers = [
+        start_server([sys.executable, os.path.join(TESTING_DIR, 'orkg-stand-in-server.py'), '--port', str(orkg_port),
+                      '--latency', str(args.orkg_latency), '--error-rate', str(args.orkg_error_rate), '--papers-file', paths['import_file']],
+                     f"{args.orkg_url}/stand-in/stats", os.path.join(workdir, 'orkg-stand-in.log')),
+        start_server([sys.executable, os.path.join(TESTING_DIR, 'mock-chat-completions-server.py'), '--port', str(chat_port),
+                      '--latency', str(args.chat_latency), '--model-latency', *args.model_latency],
+                     f"{args.chat_url}/v1/stats", os.path.join(workdir, 'mock-chat.log')),
+    ]
+    results = []
+    try:
+        for stage in args.stages:
+            command = [sys.executable, os.path.abspath(__file__), '--run-stage', stage, '--workdir', workdir,
+                       '--orkg-url', args.orkg_url, '--chat-url', args.chat_url, '--workers', str(args.workers),
+                       '--template-id', args.template_id, '--correction-share', str(args.correction_share)] + (['--backends', args.backends] if args.backends else []) \
+                      + (['--full-text-store'] if args.full_text_store else [])
+            with open(os.path.join(workdir, f"{stage}.log"), 'w') as log:
+                returncode = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode
+            if returncode != 0:
+                print(f"{rows} rows, {stage}: failed, see {os.path.join(workdir, stage + '.log')}")
+                break
+            with open(os.path.join(workdir, f"{stage}-result.json"), encoding='utf-8') as file:
+                result = json.load(file)
+            result['dataset_rows'] = rows
+            results.append(result)
+            print(f"{rows:>8} {stage:<10} {result['rows']:>8} {result['seconds']:>9.2f} {result['rows_per_second']:>10} "
+                  f"{result['requests']:>9} {result['peak_memory_mb']:>9}", flush=True)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the step 2 scripts against the local ORKG stand-in and the mock chat server.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="dataset sizes in rows")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--workers', type=int, default=8, help="workers or requests in flight per stage")
+    parser.add_argument('--text-length', type=int, default=2000, help="characters of full text per paper")
+    parser.add_argument('--orkg-latency', type=float, default=0.0, help="latency of the ORKG stand-in in seconds")
+    parser.add_argument('--orkg-error-rate', type=float, default=0.0, help="fraction of ORKG requests answered with HTTP 503")
+    parser.add_argument('--chat-latency', type=float, default=0.0, help="latency of the mock chat server in seconds")
+    parser.add_argument('--model-latency', nargs='*', default=[], metavar='MODEL=SECONDS', help="latency of the mock chat server per model")
+    parser.add_argument('--backends', help="LLM backends file for the annotate stage; backends without a base URL use the mock chat server")
+    parser.add_argument('--full-text-store', action='store_true', help="keep the full texts in a full-text store instead of the dataset, as step 1 does with a store path")
+    parser.add_argument('--correction-share', type=float, default=0.01, help="share of the rows the sync stage corrects")
+    parser.add_argument('--orkg-url', default='http://127.0.0.1:8770')
+    parser.add_argument('--chat-url', default='http://127.0.0.1:8765')
+    parser.add_argument('--template-id', default='R733029')
+    parser.add_argument('--workdir', help="directory for the datasets, outputs and logs (default: a new temporary directory)")
+    parser.add_argument('--report', help="JSON file for the results (default: <workdir>/benchmark-report.json)")
+    parser.add_argument('--run-stage', choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        run_stage(args.run_stage, args.workdir, args)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='ald-benchmark-')
+    print(f"Datasets, outputs and logs are kept in {workdir}")
+    print(f"{'dataset':>8} {'stage':<10} {'rows':>8} {'seconds':>9} {'rows/s':>10} {'requests':>9} {'peak MB':>9}")
+    results = []
+    for rows in args.sizes:
+        results.extend(benchmark_size(rows, os.path.join(workdir, f"{rows}-rows"), args))
+
+    report_path = args.report or os.path.join(workdir, 'benchmark-report.json')
+    settings = {key: value for key, value in vars(args).items() if key not in ('run_stage', 'report')}
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump({'settings': settings, 'results': results}, file, indent=2)
+    print(f"Report written to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
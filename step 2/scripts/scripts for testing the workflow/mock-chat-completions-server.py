@@ -0,0 +1,154 @@
+import argparse
+import copy
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prompt_templates import PromptCacheEstimate
+
+# A local stand-in for the OpenAI chat completions endpoint. Point the annotation script at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python scripts/3-gpt-assistant-annotate.py
+
+CANNED_PROFILE = {
+    "process_parameters": {"reactants": ["-"], "temperature_range": "150-300 °C", "pressure_range": "-"},
+    "film_properties": {
+        "material": "-", "thickness_control": "-", "uniformity": "-", "conformality": "-",
+        "film_thickness": "-", "film_density": "-", "surface_roughness": "-", "refractive_index": "-"
+    },
+    "process_characteristics": {"self_limiting_behavior": "-", "nucleation_behavior": "-", "growth_per_cycle": "1.0 Å/cycle"},
+    "safety": "-", "stability": "-", "reproducibility": "-", "precursor_consumption": "-", "device_performance": "-",
+    "extra_properties": {}
+}
+
+
+def canned_value(path):
+    value = CANNED_PROFILE
+    for key in path.split('.'):
+        value = value[key]
+    return value
+
+
+def canned_profile(missing_field_rate):
+    # A profile that, now and then, lacks a field, as answers cut short by the model do
+    profile = copy.deepcopy(CANNED_PROFILE)
+    if random.random() < missing_field_rate:
+        del profile['film_properties']['film_thickness']
+    return profile
+
+
+def build_answer(request, missing_field_rate=0.0):
+    # Coalesced prompts list their processes; answer with one profile per listed process_id
+    # The row context comes after the article, in a system message of its own
+    system_message = '\n'.join(m.get('content', '') for m in request.get('messages', []) if m.get('role') == 'system')
+    process_ids = re.findall(r'^\s*- process_id (\S+):', system_message, flags=re.MULTILINE)
+    if process_ids:
+        return {'processes': [{'process_id': process_id, 'profile': canned_profile(missing_field_rate)} for process_id in process_ids]}
+    # Re-requests for single fields list the dotted field names
+    fields = re.findall(r'^\s*- "([\w.]+)":', system_message, flags=re.MULTILINE)
+    if fields:
+        return {field: canned_value(field) for field in fields}
+    return canned_profile(missing_field_rate)
+
+
+stats = {'requests': 0, 'in_flight': 0, 'max_in_flight': 0, 'errors': 0}
+# Reports cached prompt tokens the way the provider's prompt cache would
+prompt_cache = PromptCacheEstimate()
+stats_lock = threading.Lock()
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    model_latency = {}
+    error_rate = 0.0
+    invalid_json_rate = 0.0
+    missing_field_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with stats_lock:
+                self.send_json(200, dict(stats))
+        else:
+            self.send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        with stats_lock:
+            stats['requests'] += 1
+            stats['in_flight'] += 1
+            stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+            # Requests per model, to check the routing between backends
+            model_key = f"requests {request.get('model', 'mock')}"
+            stats[model_key] = stats.get(model_key, 0) + 1
+        try:
+            time.sleep(self.model_latency.get(request.get('model'), self.latency))
+            if random.random() < self.error_rate:
+                with stats_lock:
+                    stats['errors'] += 1
+                self.send_json(500, {'error': {'message': 'injected server error'}})
+                return
+            content = json.dumps(build_answer(request, self.missing_field_rate))
+            if random.random() < self.invalid_json_rate:
+                content = content[:-10]
+            cached_tokens, uncached_tokens = prompt_cache.count(request)
+            prompt_tokens = cached_tokens + uncached_tokens
+            completion_tokens = len(content) // 4
+            self.send_json(200, {
+                'id': f"chatcmpl-mock-{stats['requests']}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'mock'),
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens,
+                          'prompt_tokens_details': {'cached_tokens': cached_tokens}},
+            })
+        finally:
+            with stats_lock:
+                stats['in_flight'] -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat completions server for local testing.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds to wait before answering each request")
+    parser.add_argument('--model-latency', nargs='*', default=[], metavar='MODEL=SECONDS',
+                        help="latency per model, e.g. to let a small model answer faster than a large one")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument('--invalid-json-rate', type=float, default=0.0, help="fraction of answers with truncated JSON")
+    parser.add_argument('--missing-field-rate', type=float, default=0.0, help="fraction of profiles without their film_thickness field")
+    args = parser.parse_args()
+
+    ChatCompletionsHandler.latency = args.latency
+    ChatCompletionsHandler.model_latency = {model: float(seconds) for model, seconds in (item.split('=', 1) for item in args.model_latency)}
+    ChatCompletionsHandler.error_rate = args.error_rate
+    ChatCompletionsHandler.invalid_json_rate = args.invalid_json_rate
+    ChatCompletionsHandler.missing_field_rate = args.missing_field_rate
+    server = ThreadingHTTPServer((args.host, args.port), ChatCompletionsHandler)
+    print(f"Mock chat completions server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+import argparse
+import csv
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# A local, in-memory stand-in for the ORKG endpoints used by the step 2 scripts, for load tests that must
+# not touch orkg.org. Create the ORKG client with both hosts pointing at it:
+#   ORKG(host="http://127.0.0.1:8770", auth_host="http://127.0.0.1:8770", creds=("bench@example.org", "bench"))
+# Any username and password are accepted. Papers can be preloaded from an ORKG CSV import file, as if it
+# had been imported through the ORKG web interface.
+
+# The Comprehensive ALD Profile template and its nested templates, with the properties the upload script fills in:
+# template ID -> (label, target class, [(predicate ID, predicate label, value class or None for text)])
+ALD_TEMPLATES = {
+    'R733029': ('Comprehensive ALD Profile', 'C_ALD_PROFILE', [
+        ('P_PROCESS_PARAMETER', 'process parameter', 'C_ALD_PROCESS_PARAMETERS'),
+        ('P_FILM_PROPERTY', 'film property', 'C_ALD_FILM_PROPERTIES'),
+        ('P_PROCESS_CHARACTERISTIC', 'process characteristic', 'C_ALD_PROCESS_CHARACTERISTICS'),
+    ]),
+    'R733030': ('ALD process parameters', 'C_ALD_PROCESS_PARAMETERS', [
+        ('P_REACTANT', 'reactant', 'C_REACTANT'),
+        ('P_TEMPERATURE_RANGE', 'temperature range', None),
+        ('P_PRESSURE_RANGE', 'pressure range', None),
+    ]),
+    'R733031': ('ALD film properties', 'C_ALD_FILM_PROPERTIES', [
+        ('P_MATERIAL', 'material', 'C_MATERIAL'),
+        ('P_THICKNESS_CONTROL', 'thickness control', None),
+        ('P_CONFORMALITY', 'conformality', None),
+        ('P_FILM_THICKNESS', 'film thickness', None),
+        ('P_FILM_DENSITY', 'film density', None),
+        ('P_SURFACE_ROUGHNESS', 'surface roughness', None),
+        ('P_REFRACTIVE_INDEX', 'refractive index', None),
+    ]),
+    'R733032': ('ALD process characteristics', 'C_ALD_PROCESS_CHARACTERISTICS', [
+        ('P_SELF_LIMITING_BEHAVIOR', 'self limiting behavior', None),
+        ('P_GROWTH_PER_CYCLE', 'growth per cycle', None),
+    ]),
+}
+# Nested templates have a label format, so their instances are created without a label
+FORMATTED_TEMPLATES = {'R733030', 'R733031', 'R733032'}
+
+
+def statement(subject_id, predicate_id, object_id, object_label=None, statement_id=None, object_class='resource'):
+    return {
+        'id': statement_id or f"S_{subject_id}_{predicate_id}_{object_id}",
+        'subject': {'id': subject_id, 'label': subject_id, '_class': 'resource'},
+        'predicate': {'id': predicate_id, 'label': predicate_id},
+        'object': {'id': object_id, 'label': object_label if object_label is not None else object_id, '_class': object_class},
+    }
+
+
+def template_statements():
+    """ The statements that describe ALD_TEMPLATES, as returned by the statements endpoint. """
+    statements = []
+    for template_id, (_, target_class, properties) in ALD_TEMPLATES.items():
+        statements.append(statement(template_id, 'sh:targetClass', target_class))
+        if template_id in FORMATTED_TEMPLATES:
+            statements.append(statement(template_id, 'TemplateLabelFormat', f"{template_id}_FORMAT", '{P_MATERIAL}'))
+        for predicate_id, predicate_label, value_class in properties:
+            component_id = f"{template_id}_{predicate_id}"
+            statements.append(statement(template_id, 'sh:property', component_id))
+            statements.append(statement(component_id, 'sh:path', predicate_id, predicate_label))
+            statements.append(statement(component_id, 'sh:minCount', f"{component_id}_MIN", '0'))
+            if value_class is not None:
+                statements.append(statement(component_id, 'sh:class', value_class, value_class))
+    return statements
+
+
+class Store:
+    """ Papers and resources of the stand-in, in memory. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(900000)
+        self.resources = {}
+        self.literals = {}
+        self.labels = {}
+        self.papers_by_doi = {}
+        self.papers_by_title = {}
+        self.statements = {}
+        self.by_subject = {}
+        self.by_object = {}
+        for template_statement in template_statements():
+            self.add_statement(template_statement)
+        for template_id, (label, _, _) in ALD_TEMPLATES.items():
+            self.resources[template_id] = {'id': template_id, 'label': label, 'classes': ['NodeShape']}
+
+    def new_resource(self, label, classes=(), **extra):
+        # Called with the lock held
+        resource_id = f"R{next(self.ids)}"
+        resource = {'id': resource_id, 'label': label, 'classes': list(classes),
+                    'observatory_id': '00000000-0000-0000-0000-000000000000',
+                    'organization_id': '00000000-0000-0000-0000-000000000000', **extra}
+        self.resources[resource_id] = resource
+        self.labels.setdefault(label, resource_id)
+        return resource
+
+    def add_statement(self, new_statement):
+        # Called with the lock held (or before the server starts)
+        self.statements[new_statement['id']] = new_statement
+        self.by_subject.setdefault(new_statement['subject']['id'], {})[new_statement['id']] = new_statement
+        self.by_object.setdefault(new_statement['object']['id'], {})[new_statement['id']] = new_statement
+
+    def new_statement(self, subject_id, predicate_id, object_id, object_label, object_class='resource'):
+        self.add_statement(statement(subject_id, predicate_id, object_id, object_label, f"S{next(self.ids)}", object_class))
+
+    def delete_statement(self, statement_id):
+        removed = self.statements.pop(statement_id, None)
+        if removed is not None:
+            del self.by_subject[removed['subject']['id']][statement_id]
+            del self.by_object[removed['object']['id']][statement_id]
+        return removed
+
+    def add_values(self, subject_id, values):
+        """ The statements of a contribution in the format of the legacy papers endpoint, nested resources included. """
+        for predicate_id, objects in values.items():
+            for value in objects:
+                if '@id' in value:
+                    target = self.resources.get(value['@id'], {'label': value['@id']})
+                    self.new_statement(subject_id, predicate_id, value['@id'], target['label'])
+                elif 'text' in value:
+                    literal = self.new_literal(str(value['text']))
+                    self.new_statement(subject_id, predicate_id, literal['id'], literal['label'], 'literal')
+                else:
+                    nested = self.new_resource(value.get('label', ''), value.get('classes', []))
+                    self.new_statement(subject_id, predicate_id, nested['id'], nested['label'])
+                    self.add_values(nested['id'], value.get('values', {}))
+
+    def new_literal(self, label):
+        # Called with the lock held
+        literal = {'id': f"L{next(self.ids)}", 'label': label, 'datatype': 'xsd:string'}
+        self.literals[literal['id']] = literal
+        return literal
+
+    def add_paper(self, doi, title):
+        with self.lock:
+            if doi in self.papers_by_doi:
+                return self.papers_by_doi[doi]
+            paper = self.new_resource(title, ['Paper'], doi=doi, contributions=[])
+            self.papers_by_doi[doi] = paper
+            self.papers_by_title[title] = paper
+            return paper
+
+    def load_papers(self, import_file):
+        """ Preload the papers of an ORKG CSV import file (column paper:doi). """
+        with open(import_file, newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                doi = row['paper:doi'].strip()
+                if doi:
+                    self.add_paper(doi, row.get('paper:title') or f"Paper {doi}")
+        return len(self.papers_by_doi)
+
+
+class OrkgStandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API behind its proxy
+    store = None
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    stats = {}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def send_json(self, status, payload=None, location=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if location is not None:
+            self.send_header('Location', f"http://{self.headers.get('Host')}{location}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+            return parse_qs(body.decode('utf-8'))
+        return json.loads(body) if body else {}
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self.read_json() if method in ('POST', 'PUT') else None
+
+        if path.startswith('/stand-in'):
+            self.handle_control(method, path)
+            return
+        endpoint = re.sub(r'/[RS]\d+$', '/{id}', path)
+        self.count(f"{method} {endpoint}")
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if path != '/realms/orkg/protocol/openid-connect/token' and random.random() < self.error_rate:
+            self.count('injected errors')
+            self.send_json(503, {'message': 'injected server error'})
+            return
+        if method != 'GET' and path.startswith('/api') and 'Authorization' not in self.headers:
+            self.send_json(401, {'message': 'authentication required'})
+            return
+
+        handler = ROUTES.get((method, endpoint))
+        if handler is None:
+            self.send_json(404, {'message': f"not found: {method} {path}"})
+            return
+        handler(self, path.rsplit('/', 1)[-1], query, body)
+
+    def handle_control(self, method, path):
+        # Request counts for benchmarks: GET /stand-in/stats, POST /stand-in/stats/reset
+        with self.stats_lock:
+            if method == 'POST' and path == '/stand-in/stats/reset':
+                self.stats.clear()
+            counts = dict(self.stats)
+        store = self.store
+        with store.lock:
+            counts.update({'resources stored': len(store.resources), 'papers stored': len(store.papers_by_doi),
+                           'statements stored': len(store.statements)})
+        self.send_json(200, counts)
+
+    # Authentication (the Keycloak token endpoint used by orkg.client.session.Session)
+    def token(self, _, query, body):
+        self.send_json(200, {'access_token': 'stand-in-token', 'expires_in': 3600, 'refresh_expires_in': 7200,
+                             'refresh_token': 'stand-in-refresh-token', 'token_type': 'Bearer'})
+
+    # papers.by_doi
+    def find_papers(self, _, query, body):
+        with self.store.lock:
+            paper = self.store.papers_by_doi.get(query.get('doi', ''))
+            content = [{'id': paper['id'], 'title': paper['label'], 'identifiers': {'doi': [paper['doi']]}}] if paper else []
+        self.send_json(200, {'content': content, 'totalElements': len(content)})
+
+    # papers.add (legacy endpoint) with merge_if_exists
+    def add_paper(self, _, query, body):
+        paper_data = body.get('paper', {})
+        title = paper_data.get('title')
+        if not title or 'researchField' not in paper_data:
+            self.send_json(400, {'message': 'title and researchField are required'})
+            return
+        store = self.store
+        with store.lock:
+            paper = store.papers_by_title.get(title) if str(query.get('mergeIfExists')).lower() == 'true' else None
+            if paper is None:
+                paper = store.new_resource(title, ['Paper'], doi=paper_data.get('doi'), contributions=[])
+                store.papers_by_title.setdefault(title, paper)
+            for contribution in paper_data.get('contributions', []):
+                label = contribution.get('name') or contribution.get('label') or 'Contribution'
+                contribution_resource = store.new_resource(label, ['Contribution'])
+                paper['contributions'].append(contribution_resource['id'])
+                store.new_statement(paper['id'], 'P31', contribution_resource['id'], label)
+                store.add_values(contribution_resource['id'], contribution.get('values', {}))
+        self.send_json(201, None, location=f"/api/resources/{paper['id']}")
+
+    # resources.get (the exact label search of find_or_add)
+    def search_resources(self, _, query, body):
+        label = query.get('q', '')
+        with self.store.lock:
+            if str(query.get('exact')).lower() == 'true':
+                resource_id = self.store.labels.get(label)
+                content = [self.store.resources[resource_id]] if resource_id in self.store.resources else []
+            else:
+                content = [r for r in self.store.resources.values() if label.lower() in r['label'].lower()][:int(query.get('size', 20))]
+        self.send_json(200, {'content': content, 'totalElements': len(content)})
+
+    # resources.add (the creation of find_or_add)
+    def add_resource(self, _, query, body):
+        with self.store.lock:
+            resource = self.store.new_resource(body.get('label', ''), body.get('classes', []))
+        self.send_json(201, None, location=f"/api/resources/{resource['id']}")
+
+    # resources.by_id / exists, also followed after every creation
+    def get_resource(self, resource_id, query, body):
+        with self.store.lock:
+            resource = self.store.resources.get(resource_id)
+        if resource is None:
+            self.send_json(404, {'message': f"resource {resource_id} not found"})
+        else:
+            self.send_json(200, resource)
+
+    # resources.update_observatory
+    def update_resource(self, resource_id, query, body):
+        with self.store.lock:
+            resource = self.store.resources.get(resource_id)
+            if resource is not None:
+                for key in ('observatory_id', 'organization_id', 'label', 'classes'):
+                    if key in body:
+                        resource[key] = body[key]
+        if resource is None:
+            self.send_json(404, {'message': f"resource {resource_id} not found"})
+        else:
+            self.send_json(200, None, location=f"/api/resources/{resource_id}")
+
+    # resources.delete; like ORKG, a resource that is still used in a statement is not deleted
+    def delete_resource(self, resource_id, query, body):
+        store = self.store
+        with store.lock:
+            in_use = bool(store.by_subject.get(resource_id) or store.by_object.get(resource_id))
+            resource = None if in_use else store.resources.pop(resource_id, None)
+            if resource is not None and store.labels.get(resource['label']) == resource_id:
+                del store.labels[resource['label']]
+            exists = in_use or resource is not None
+        if in_use:
+            self.send_json(403, {'message': f"resource {resource_id} is used in at least one statement"})
+        else:
+            self.send_json(204 if exists else 404, None if exists else {'message': 'not found'})
+
+    # statements.get_by_subject, get_by_object, get_by_subject_and_predicate and get_by_object_and_predicate;
+    # paged like the real API when a page size is given
+    def find_statements(self, _, query, body):
+        store = self.store
+        with store.lock:
+            if 'subject_id' in query:
+                candidates = store.by_subject.get(query['subject_id'], {}).values()
+            elif 'object_id' in query:
+                candidates = store.by_object.get(query['object_id'], {}).values()
+            else:
+                candidates = store.statements.values()
+            content = [
+                s for s in candidates
+                if ('subject_id' not in query or s['subject']['id'] == query['subject_id'])
+                and ('object_id' not in query or s['object']['id'] == query['object_id'])
+                and ('predicate_id' not in query or s['predicate']['id'] == query['predicate_id'])
+            ]
+        total = len(content)
+        if 'size' not in query:
+            self.send_json(200, {'content': content, 'totalElements': total})
+            return
+        size, number = max(1, int(query['size'])), int(query.get('page', 0))
+        page = {'size': size, 'number': number, 'total_elements': total, 'total_pages': (total + size - 1) // size}
+        self.send_json(200, {'content': content[number * size:(number + 1) * size], 'totalElements': total, 'page': page})
+
+    # literals.add
+    def add_literal(self, _, query, body):
+        with self.store.lock:
+            literal = self.store.new_literal(str(body.get('label', '')))
+        self.send_json(201, literal, location=f"/api/literals/{literal['id']}")
+
+    # statements.add; the object is a resource or a literal
+    def add_statement(self, _, query, body):
+        store = self.store
+        with store.lock:
+            subject_id, object_id = body.get('subject_id'), body.get('object_id')
+            if subject_id not in store.resources or (object_id not in store.resources and object_id not in store.literals):
+                missing = True
+            else:
+                missing = False
+                if object_id in store.literals:
+                    store.new_statement(subject_id, body['predicate_id'], object_id, store.literals[object_id]['label'], 'literal')
+                else:
+                    store.new_statement(subject_id, body['predicate_id'], object_id, store.resources[object_id]['label'])
+                created = list(store.by_subject[subject_id].values())[-1]
+        if missing:
+            self.send_json(400, {'message': 'subject or object not found'})
+        else:
+            self.send_json(201, created, location=f"/api/statements/{created['id']}")
+
+    # statements.delete
+    def delete_statement(self, statement_id, query, body):
+        with self.store.lock:
+            removed = self.store.delete_statement(statement_id)
+        self.send_json(404 if removed is None else 204, {'message': 'not found'} if removed is None else None)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+
+ROUTES = {
+    ('POST', '/realms/orkg/protocol/openid-connect/token'): OrkgStandInHandler.token,
+    ('GET', '/api/papers'): OrkgStandInHandler.find_papers,
+    ('POST', '/api/papers'): OrkgStandInHandler.add_paper,
+    ('GET', '/api/resources'): OrkgStandInHandler.search_resources,
+    ('POST', '/api/resources'): OrkgStandInHandler.add_resource,
+    ('GET', '/api/resources/{id}'): OrkgStandInHandler.get_resource,
+    ('PUT', '/api/resources/{id}'): OrkgStandInHandler.update_resource,
+    ('DELETE', '/api/resources/{id}'): OrkgStandInHandler.delete_resource,
+    ('GET', '/api/statements'): OrkgStandInHandler.find_statements,
+    ('POST', '/api/statements'): OrkgStandInHandler.add_statement,
+    ('POST', '/api/literals'): OrkgStandInHandler.add_literal,
+    ('DELETE', '/api/statements/{id}'): OrkgStandInHandler.delete_statement,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local ORKG stand-in server for load tests and benchmarks.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8770)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds to wait before answering each request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="up to this many extra seconds of random latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of API requests answered with HTTP 503")
+    parser.add_argument('--papers-file', action='append', default=[], help="ORKG CSV import file whose papers are preloaded (repeatable)")
+    args = parser.parse_args()
+
+    OrkgStandInHandler.store = Store()
+    OrkgStandInHandler.latency = args.latency
+    OrkgStandInHandler.jitter = args.jitter
+    OrkgStandInHandler.error_rate = args.error_rate
+    for papers_file in args.papers_file:
+        print(f"{OrkgStandInHandler.store.load_papers(papers_file)} papers loaded from {papers_file}")
+    server = ThreadingHTTPServer((args.host, args.port), OrkgStandInHandler)
+    server.daemon_threads = True
+    print(f"ORKG stand-in server listening on http://{args.host}:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
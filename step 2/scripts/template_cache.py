@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from orkg.client.templates.components import Template
+
+MODES = ['check', 'verify', 'offline', 'refresh']
+SUBJECT_PREFIX = 'statements/subject/'
+
+
+class TemplateCacheMiss(Exception):
+    """ Raised in offline mode when a template, or a part of its definition, is not in the cache. """
+
+
+class CachedResponse:
+    """ The parts of an ORKG client response that the template code reads. """
+
+    def __init__(self, content):
+        self.content = content
+        self.succeeded = True
+        self.status_code = '200'
+
+
+def definition_version(responses, subject_ids=None):
+    """
+    The version of a template definition: a hash of the statements of every subject it was read from,
+    i.e. the template, each of its property shapes (path, class, cardinality) and its nested templates
+    with their property shapes. ORKG keeps no modification time for templates, and editing one replaces
+    statements. With `subject_ids`, only the statements of those subjects are hashed.
+    """
+    subjects = {}
+    for key, statements in responses.items():
+        if key.startswith(SUBJECT_PREFIX) and (subject_ids is None or key[len(SUBJECT_PREFIX):] in subject_ids):
+            subjects[key[len(SUBJECT_PREFIX):]] = sorted(
+                [s['id'], s['predicate']['id'], s['object']['id'], s['object'].get('label', '')] for s in statements)
+    return hashlib.sha256(json.dumps(subjects, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class DefinitionCalls:
+    """
+    Stands in for the read calls the orkg template code makes while materializing a template, on the
+    client's own statements and resources clients, so that the generated functions are attached to the
+    client as usual. Answers come from `responses` ({call: content}); a call missing there goes to ORKG
+    and is recorded if `fetch` is set, and raises TemplateCacheMiss otherwise.
+    """
+
+    def __init__(self, orkg, responses, fetch):
+        self.orkg = orkg
+        self.responses = responses
+        self.fetch = fetch
+        self.fetched = 0
+
+    def answer(self, key, call, **kwargs):
+        if key not in self.responses:
+            if not self.fetch:
+                raise TemplateCacheMiss(f"{key} is not in the template cache")
+            response = call(**kwargs)
+            if not response.succeeded:
+                raise RuntimeError(f"Fetching {key} of the template definition failed with status {response.status_code}")
+            self.responses[key] = response.content
+            self.fetched += 1
+        return CachedResponse(self.responses[key])
+
+    def __enter__(self):
+        statements, resources = self.orkg.statements, self.orkg.resources
+        get_by_subject, get_by_object_and_predicate, by_id = statements.get_by_subject, statements.get_by_object_and_predicate, resources.by_id
+        statements.get_by_subject = lambda subject_id, **kwargs: self.answer(
+            f"statements/subject/{subject_id}", get_by_subject, subject_id=subject_id, **kwargs)
+        statements.get_by_object_and_predicate = lambda object_id, predicate_id, **kwargs: self.answer(
+            f"statements/object/{object_id}/{predicate_id}", get_by_object_and_predicate, object_id=object_id, predicate_id=predicate_id, **kwargs)
+        resources.by_id = lambda id: self.answer(f"resources/{id}", by_id, id=id)
+        # Templates already built in this process would not be read again, and so not recorded
+        self.registry = Template.templates
+        Template.templates = {}
+        # The set of materialized functions is shared by all clients, but the functions are attached to one
+        templates = self.orkg.templates
+        templates.materialized_templates = {name for name in templates.materialized_templates if name in vars(templates)}
+        return self
+
+    def __exit__(self, *exc_info):
+        del self.orkg.statements.get_by_subject
+        del self.orkg.statements.get_by_object_and_predicate
+        del self.orkg.resources.by_id
+        Template.templates = {**self.registry, **Template.templates}
+        Template.wip_templates.clear()
+
+
+class TemplateCache:
+    """
+    On-disk cache of the ORKG template definitions that materialize_template reads, keyed by host,
+    template ID and the template's version (see definition_version). The template functions are
+    generated from the cached definition, so materializing only reads the statements of the template
+    itself again to compare them with the cached ones, one request ('check' mode), reads the statements
+    of every cached subject again, concurrently, to check the whole version ('verify' mode), makes no
+    requests at all ('offline' mode, which raises TemplateCacheMiss for a template that is not cached),
+    or fetches the definition again ('refresh' mode). Nested templates are cached with the template
+    that uses them.
+    """
+
+    def __init__(self, path, mode='check', workers=8):
+        if mode not in MODES:
+            raise ValueError(f"Unknown template cache mode {mode}, expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.workers = workers
+        self.entries = {}
+        self.requests = 0
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+
+    @staticmethod
+    def key(host, template_id):
+        return f"{host.rstrip('/')} {template_id}"
+
+    def materialize(self, orkg, template_id):
+        """ orkg.templates.materialize_template(template_id), from the cache where the cached version is current. """
+        key = self.key(orkg.host, template_id)
+        entry = self.entries.get(key)
+        if self.mode == 'offline':
+            if entry is None:
+                raise TemplateCacheMiss(f"Template {template_id} of {orkg.host} is not in the template cache {self.path}")
+            return self._materialize(orkg, template_id, entry['responses'], fetch=False)
+        if entry is not None and self.mode in ('check', 'verify'):
+            # 'check' only compares the statements of the template itself, which list its property shapes
+            subject_ids = [template_id] if self.mode == 'check' else None
+            try:
+                current = self.current_version(orkg, entry['responses'], subject_ids)
+            except Exception as e:
+                print(f"Checking the version of template {template_id} failed ({e}), using the cached version {entry['version']}")
+                return self._materialize(orkg, template_id, entry['responses'], fetch=False)
+            if current == definition_version(entry['responses'], subject_ids):
+                print(f"Template {template_id} loaded from the template cache (version {entry['version']})")
+                return self._materialize(orkg, template_id, entry['responses'], fetch=False)
+            print(f"Template {template_id} changed in ORKG since it was cached (version {entry['version']})")
+        responses = {}
+        result = self._materialize(orkg, template_id, responses, fetch=True)
+        self.entries[key] = {
+            'template_id': template_id,
+            'host': orkg.host,
+            'version': definition_version(responses),
+            'cached_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'responses': responses,
+        }
+        self.save()
+        print(f"Template {template_id} fetched from ORKG and cached (version {self.entries[key]['version']})")
+        return result
+
+    def current_version(self, orkg, responses, subject_ids=None):
+        """ The version of a cached definition (or of its `subject_ids`) as it is in ORKG now; None if a subject could not be read. """
+        if subject_ids is None:
+            subject_ids = [key[len(SUBJECT_PREFIX):] for key in responses if key.startswith(SUBJECT_PREFIX)]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            probes = list(executor.map(lambda subject_id: orkg.statements.get_by_subject(subject_id=subject_id, size=99999), subject_ids))
+        self.requests += len(probes)
+        if not all(probe.succeeded for probe in probes):
+            return None
+        return definition_version({SUBJECT_PREFIX + subject_id: probe.content for subject_id, probe in zip(subject_ids, probes)})
+
+    def _materialize(self, orkg, template_id, responses, fetch):
+        with DefinitionCalls(orkg, responses, fetch) as calls:
+            result = orkg.templates.materialize_template(template_id)
+        self.requests += calls.fetched
+        return result
+
+    def invalidate(self, template_id=None, host=None):
+        """ Drop the cached definitions of a template (of every host unless `host` is given), or all of them; returns how many were dropped. """
+        dropped = [key for key, entry in self.entries.items()
+                   if (template_id is None or entry['template_id'] == template_id)
+                   and (host is None or entry['host'].rstrip('/') == host.rstrip('/'))]
+        for key in dropped:
+            del self.entries[key]
+        if dropped:
+            self.save()
+        return len(dropped)
+
+    def save(self):
+        # Written to a temporary file first, so that an interrupted run leaves the previous cache intact
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def materialize_template(orkg, template_id, cache_path=None, mode='check'):
+    """ Materialize a template through the cache at `cache_path`, or directly from ORKG without one. """
+    if not cache_path:
+        return orkg.templates.materialize_template(template_id)
+    return TemplateCache(cache_path, mode).materialize(orkg, template_id)
@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def new_run_id():
+    return time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6]
+
+
+class UploadLog:
+    """
+    Durable, append-only JSON-lines log of ORKG uploads. Every entry carries the run ID, the row key,
+    the paper and contribution it produced and a status; each append is fsynced before returning.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        self.entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # torn last line of an interrupted run
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def record(self, **entry):
+        entry.setdefault('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S'))
+        with self.lock:
+            self.file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.entries.append(entry)
+        return entry
+
+    def latest_entries(self):
+        """ The last entry of every key, e.g. 'rolled back' after an 'uploaded' one. """
+        latest = {}
+        for entry in self.entries:
+            if 'key' in entry:
+                latest[entry['key']] = entry
+        return latest
+
+    def completed_keys(self):
+        return {key for key, entry in self.latest_entries().items() if entry.get('status') == 'uploaded'}
+
+    def last_contribution_ids(self):
+        """ Highest contribution number uploaded per paper, to continue the numbering after a resume. """
+        last_ids = {}
+        for entry in self.latest_entries().values():
+            if entry.get('status') == 'uploaded':
+                paper_id = entry['paper_id']
+                last_ids[paper_id] = max(last_ids.get(paper_id, 0), int(entry['contribution_id']))
+        return last_ids
+
+    def entries_for_run(self, run_id):
+        return [entry for entry in self.entries if entry.get('run_id') == run_id]
+
+    def close(self):
+        with self.lock:
+            self.file.close()